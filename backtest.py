@@ -0,0 +1,269 @@
+import os
+import json
+import time
+import datetime
+import argparse
+import logging
+import numpy as np
+
+import indicators
+import scoring
+from barstore import BarStore, from_day, from_records, to_day
+
+# ================= ⏪ V34 历史回测 =================
+# 离线读取本地K线库，整段滚动计算指标，一次性对 (symbols × dates) 全部打分，
+# 每日收盘按 calculate_position_size 的仓位规则重设目标仓位，次日按吊灯/结构止损结算。
+# 历史基本面 / 财报日 / 盘口 up/down 量本地没有，回测中这几个因子保持中性。
+# 机器人平时不把 SPY / ^VIX / 板块 ETF 写进K线库，先用 --backfill 补齐，缺的区间大盘 / 板块因子也按中性处理。
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+logger = logging.getLogger(__name__)
+
+BASE_PATH = os.getenv('DATA_PATH') or ("/data" if os.path.exists("/data") else ".")
+REGIME_SYMBOLS = ('SPY', '^VIX')
+BACKFILL_CHUNK_DAYS = 1800  # 单次请求的自然日跨度，长历史分段拉
+
+# ================= 📥 历史回补 =================
+def backfill(store, symbols, api_key, base_url="https://financialmodelingprep.com", start=None, years=10):
+    # historical-price-eod/full 分段拉取，整份重写本地K线 (只留已收盘的)，返回 {代码: 条数}
+    import urllib.request, urllib.parse
+    def fetch(**params):
+        params['apikey'] = api_key
+        with urllib.request.urlopen(f"{base_url}/stable/historical-price-eod/full?{urllib.parse.urlencode(params)}", timeout=60) as r:
+            return json.loads(r.read())
+    today = datetime.date.today()
+    begin = start or today - datetime.timedelta(days=int(years * 365.25))
+    written = {}
+    for sym in symbols:
+        rows = []; lo = begin
+        while lo < today:
+            hi = min(lo + datetime.timedelta(days=BACKFILL_CHUNK_DAYS), today)
+            try: resp = fetch(symbol=sym, **{'from': lo.isoformat(), 'to': hi.isoformat()})
+            except (OSError, ValueError) as e:
+                logger.warning(f"❌ [BACKFILL] {sym} {lo}~{hi} failed: {e}"); rows = None; break
+            if isinstance(resp, list): rows.extend(resp)
+            lo = hi + datetime.timedelta(days=1)
+        if rows is None: continue  # 有一段失败就不动本地数据，免得留下缺口
+        bars = from_records(rows)
+        bars = bars[bars['date'] < to_day(today)]
+        if not len(bars):
+            logger.warning(f"❌ [BACKFILL] {sym} no history"); continue
+        written[sym] = store.rewrite(sym, bars)
+        logger.info(f"📥 [BACKFILL] {sym} {written[sym]} bars {from_day(bars['date'][0])}~{from_day(bars['date'][-1])}")
+    return written
+
+def _ffill(a):
+    # 沿日期方向前向填充 (停牌 / 缺行)，上市前保持 NaN
+    idx = np.where(~np.isnan(a), np.arange(a.shape[-1]), 0)
+    np.maximum.accumulate(idx, axis=-1, out=idx)
+    return np.take_along_axis(a, idx, axis=-1)
+
+def load_panel(store, symbols, start=None, end=None):
+    # 多只K线 -> 按日期并集对齐的 (symbols × dates) 面板
+    bars = {s: store.load(s) for s in symbols}
+    bars = {s: b for s, b in bars.items() if len(b)}
+    if not bars: raise ValueError("本地K线库里没有这些代码的数据")
+    dates = np.unique(np.concatenate([b['date'] for b in bars.values()]))
+    if start: dates = dates[dates >= start]
+    if end: dates = dates[dates <= end]
+    names = sorted(bars)
+    panel = {c: np.full((len(names), len(dates)), np.nan) for c in ('open', 'high', 'low', 'close', 'volume')}
+    for i, s in enumerate(names):
+        b = bars[s]
+        pos = np.searchsorted(dates, b['date'])
+        ok = (pos < len(dates)) & (dates[np.minimum(pos, len(dates) - 1)] == b['date'])
+        for c in panel: panel[c][i, pos[ok]] = b[c][ok]
+    for c in panel: panel[c] = _ffill(panel[c])
+    return names, dates, panel
+
+def regime_series(store, dates):
+    # SPY 收盘 vs MA200 -> 牛/熊 (MA200 用完整历史算，回测开头不空转)；^VIX 有数据就用，没有按 0 处理 (不影响基础分)
+    b = store.load('SPY')
+    close = _align(b['date'], b['close'], dates)
+    ma200 = _align(b['date'], indicators.sma(np.ascontiguousarray(b['close']), 200), dates) if len(b) else close
+    spy = np.where(np.isnan(ma200), scoring.SPY_NEUTRAL, np.where(close > ma200, scoring.SPY_BULL, scoring.SPY_BEAR))
+    vix = np.nan_to_num(_align_row(store, '^VIX', dates, 'close'), nan=0.0)
+    return spy, vix
+
+def _align(bar_dates, values, dates):
+    out = np.full(len(dates), np.nan)
+    if len(bar_dates):
+        pos = np.searchsorted(dates, bar_dates)
+        ok = (pos < len(dates)) & (dates[np.minimum(pos, len(dates) - 1)] == bar_dates)
+        out[pos[ok]] = values[ok]
+    return _ffill(out)
+
+def _align_row(store, symbol, dates, col):
+    b = store.load(symbol)
+    return _align(b['date'], b[col], dates)
+
+def sector_series(store, names, dates, sector_map):
+    # 板块 ETF 20 日涨幅，按代码映射展开成 (symbols × dates)
+    out = np.zeros((len(names), len(dates)))
+    cache = {}
+    for i, s in enumerate(names):
+        etf = sector_map.get(s)
+        if not etf: continue
+        if etf not in cache:
+            close = _align_row(store, etf, dates, 'close')
+            prev = np.full(len(dates), np.nan); prev[20:] = close[:-20]
+            cache[etf] = np.nan_to_num((close - prev) / prev, nan=0.0)
+        out[i] = cache[etf]
+    return out
+
+def simulate(panel, records, horizon=5, cost_bps=5.0, gross_cap=1.0, params=scoring.DEFAULT_PARAMS):
+    close = panel['close']; open_ = panel['open']; low = panel['low']
+    special = records['earn'] | records['ice'] | records['zone']
+    weight = np.nan_to_num(scoring.position_size(records['score'], close, records['stop'], special, params=params) / 100.0, nan=0.0)
+    weight[np.isnan(close)] = 0.0
+    gross = weight.sum(axis=0)
+    weight = weight * np.where(gross > gross_cap, gross_cap / np.maximum(gross, 1e-12), 1.0)
+
+    # 次日收益: 盘中触及止损则按 min(开盘, 止损) 出场
+    nxt_close = np.roll(close, -1, axis=1); nxt_open = np.roll(open_, -1, axis=1); nxt_low = np.roll(low, -1, axis=1)
+    stop = records['stop']
+    with np.errstate(all='ignore'):
+        stopped = nxt_low <= stop
+        exit_px = np.where(stopped, np.minimum(nxt_open, stop), nxt_close)
+        ret = np.nan_to_num(exit_px / close - 1.0, nan=0.0)
+    ret[:, -1] = 0.0
+
+    prev_w = np.concatenate([np.zeros((weight.shape[0], 1)), weight[:, :-1]], axis=1)
+    turnover = np.abs(weight - prev_w).sum(axis=0)
+    daily = (weight * ret).sum(axis=0) - turnover * cost_bps / 1e4
+    # t 日收盘打分，收益记在 t+1
+    daily = np.concatenate([[0.0], daily[:-1]])
+    equity = np.cumprod(1.0 + daily)
+
+    with np.errstate(all='ignore'):
+        fwd = np.full(close.shape, np.nan)
+        fwd[:, :-horizon] = close[:, horizon:] / close[:, :-horizon] - 1.0
+    return weight, daily, equity, turnover, fwd, stopped
+
+def factor_hit_rates(records, weight, fwd):
+    # 每个因子代码在持仓信号上的 N 日胜率 / 平均收益
+    taken = (weight > 0) & ~np.isnan(fwd)
+    labels = {'ALL': taken}
+    for field, names in (('trend_code', scoring.TREND_NAMES), ('vsa_code', scoring.VSA_NAMES),
+                         ('fund_code', scoring.FUND_NAMES), ('sector_code', scoring.SECTOR_NAMES)):
+        for code, name in enumerate(names):
+            if name: labels[name] = taken & (records[field] == code)
+    labels['Vol_High'] = taken & records['vol_high']
+    labels['Special_Earnings'] = taken & records['earn']
+    labels['Special_Ice'] = taken & records['ice']
+    labels['Special_Zone'] = taken & records['zone']
+    out = {}
+    for name, mask in labels.items():
+        n = int(mask.sum())
+        if n == 0: continue
+        r = fwd[mask]
+        out[name] = {'signals': n, 'hit_rate': float((r > 0).mean()), 'avg_ret': float(r.mean())}
+    return out
+
+def summarize(dates, daily, equity, turnover, weight):
+    years = max(len(dates) / 252.0, 1e-9)
+    peak = np.maximum.accumulate(equity)
+    std = daily.std()
+    return {
+        'start': str(from_day(dates[0])), 'end': str(from_day(dates[-1])), 'days': int(len(dates)),
+        'total_return': float(equity[-1] - 1.0),
+        'cagr': float(equity[-1] ** (1.0 / years) - 1.0) if equity[-1] > 0 else -1.0,
+        'sharpe': float(daily.mean() / std * np.sqrt(252)) if std > 0 else 0.0,
+        'max_drawdown': float((equity / peak - 1.0).min()),
+        'avg_turnover': float(turnover.mean()),
+        'avg_exposure': float(weight.sum(axis=0).mean()),
+    }
+
+def input_coverage(store, names, dates, sector_map):
+    # SPY / ^VIX / 用到的板块 ETF 各覆盖回测区间的比例 (首根K线之后都算覆盖)
+    etfs = sorted({sector_map[s] for s in names if sector_map.get(s)})
+    out = {}
+    for sym in (*REGIME_SYMBOLS, *etfs):
+        b = store.load(sym)
+        out[sym] = float((dates >= b['date'][0]).mean()) if len(b) and len(dates) else 0.0
+    return out
+
+def neutral_factors(coverage):
+    # 覆盖不全的输入 -> 回测里 (部分) 按中性处理的因子
+    out = []
+    if coverage.get('SPY', 0.0) < 1.0: out.append('spy_regime')
+    if coverage.get('^VIX', 0.0) < 1.0: out.append('vix')
+    if any(f < 1.0 for s, f in coverage.items() if s not in REGIME_SYMBOLS): out.append('sector')
+    return out
+
+def load_inputs(store, symbols, start=None, end=None, sector_map=None):
+    # 面板 + 与参数无关的逐日输入 (大盘 / 板块)；参数寻优时只加载一次
+    names, dates, panel = load_panel(store, symbols, start, end)
+    for sym, f in input_coverage(store, names, dates, sector_map or {}).items():
+        if f < 1.0: logger.warning(f"⚠️ [BACKTEST] {sym} covers {f:.0%} of the backtest window, missing days score as neutral (run backtest.py --backfill)")
+    spy, vix = regime_series(store, dates)
+    sector_ret = sector_series(store, names, dates, sector_map or {})
+    return names, dates, panel, {'sector_ret': sector_ret, 'spy': spy[None, :], 'vix': vix[None, :]}
+
+def run_backtest(store, symbols, start=None, end=None, horizon=5, cost_bps=5.0, sector_map=None, params=scoring.DEFAULT_PARAMS):
+    t0 = time.perf_counter()
+    names, dates, panel, inputs = load_inputs(store, symbols, start, end, sector_map)
+    t1 = time.perf_counter()
+    snap = indicators.series(panel['high'], panel['low'], panel['close'], panel['volume'], **params.lengths())
+    records = scoring.score_snapshot(snap, params=params, **inputs)
+    t2 = time.perf_counter()
+    weight, daily, equity, turnover, fwd, stopped = simulate(panel, records, horizon, cost_bps, params=params)
+    coverage = input_coverage(store, names, dates, sector_map or {})
+    report = {
+        'symbols': len(names),
+        'summary': summarize(dates, daily, equity, turnover, weight),
+        'factors': factor_hit_rates(records, weight, fwd),
+        'stop_hits': int((stopped & (weight > 0)).sum()),
+        'coverage': coverage,
+        'neutral_factors': neutral_factors(coverage),
+        'timing': {'load_s': t1 - t0, 'score_s': t2 - t1, 'simulate_s': time.perf_counter() - t2},
+    }
+    curve = {'dates': [str(from_day(d)) for d in dates], 'equity': equity.tolist(), 'turnover': turnover.tolist()}
+    return report, curve
+
+def _parse_date(s):
+    return int(np.datetime64(s, 'D').astype(np.int64)) if s else None
+
+def main():
+    ap = argparse.ArgumentParser(description="V34 离线回测")
+    ap.add_argument('--symbols', help="逗号分隔；缺省为本地K线库全部代码")
+    ap.add_argument('--universe', help="每行一个代码的文件")
+    ap.add_argument('--start'); ap.add_argument('--end')
+    ap.add_argument('--horizon', type=int, default=5, help="因子胜率的前瞻天数")
+    ap.add_argument('--cost-bps', type=float, default=5.0)
+    ap.add_argument('--sector-map', help="JSON: {代码: 板块ETF}")
+    ap.add_argument('--params', help="评分参数 JSON (optimize.py 的 best_params.json)，缺省用内置口径")
+    ap.add_argument('--data', default=BASE_PATH)
+    ap.add_argument('--out', default='backtest_out')
+    ap.add_argument('--backfill', action='store_true', help="先从 FMP 重拉这些代码 + SPY / ^VIX / 板块 ETF 的长历史 (需 FMP_API_KEY)")
+    ap.add_argument('--backfill-years', type=float, default=10.0, help="--backfill 缺省回补年数 (给了 --start 就从 start 起)")
+    args = ap.parse_args()
+
+    store = BarStore(os.path.join(args.data, "bars"))
+    if args.symbols: symbols = [s.strip().upper() for s in args.symbols.split(',') if s.strip()]
+    elif args.universe: symbols = [l.strip().upper() for l in open(args.universe) if l.strip() and not l.startswith('#')]
+    else: symbols = None
+    sector_map = json.load(open(args.sector_map)) if args.sector_map else {}
+    if args.backfill:
+        if not os.getenv('FMP_API_KEY'): ap.error("--backfill 需要 FMP_API_KEY")
+        start = datetime.date.fromisoformat(args.start) if args.start else None
+        wanted = (symbols or []) + [s for s in (*REGIME_SYMBOLS, *sorted(set(sector_map.values()))) if s not in (symbols or [])]
+        backfill(store, wanted, os.getenv('FMP_API_KEY'), os.getenv('FMP_BASE_URL', 'https://financialmodelingprep.com'), start, args.backfill_years)
+    if symbols is None: symbols = [s for s in store.symbols() if s not in ('SPY', '^VIX', '_VIX') and s not in sector_map.values()]
+    params = scoring.load_params(args.params) if args.params else scoring.DEFAULT_PARAMS
+
+    report, curve = run_backtest(store, symbols, _parse_date(args.start), _parse_date(args.end), args.horizon, args.cost_bps, sector_map, params)
+    os.makedirs(args.out, exist_ok=True)
+    with open(os.path.join(args.out, 'report.json'), 'w') as f: json.dump(report, f, indent=2, ensure_ascii=False)
+    with open(os.path.join(args.out, 'equity.csv'), 'w') as f:
+        f.write("date,equity,turnover\n")
+        for d, e, t in zip(curve['dates'], curve['equity'], curve['turnover']): f.write(f"{d},{e:.6f},{t:.6f}\n")
+    s = report['summary']
+    logger.info(f"⏪ [BACKTEST] {report['symbols']} symbols {s['start']}~{s['end']}: total {s['total_return']:.2%}, CAGR {s['cagr']:.2%}, Sharpe {s['sharpe']:.2f}, MaxDD {s['max_drawdown']:.2%}, turnover {s['avg_turnover']:.2f}/day")
+    for name, h in sorted(report['factors'].items(), key=lambda kv: -kv[1]['signals']):
+        logger.info(f"   {name:<18} n={h['signals']:<7} hit={h['hit_rate']:.1%} avg={h['avg_ret']:+.2%}")
+    if report['neutral_factors']: logger.warning(f"⚠️ [BACKTEST] neutral (missing data): {', '.join(report['neutral_factors'])}")
+    logger.info(f"   timing: {report['timing']}")
+
+if __name__ == "__main__":
+    main()
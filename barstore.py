@@ -0,0 +1,113 @@
+import os
+import datetime
+import numpy as np
+
+# ================= 💾 本地K线库 =================
+# 每个代码一个定长记录文件 (<SYMBOL>.bin)，date 存为 epoch 天数。
+# 平时只追加写入；FMP 的历史是拆股 / 分红调整过的，重叠那根对不上时整份重写。
+# 读取时 np.memmap 映射后只拷贝需要的尾部窗口。
+BAR_DTYPE = np.dtype([
+    ('date', '<i8'), ('open', '<f8'), ('high', '<f8'),
+    ('low', '<f8'), ('close', '<f8'), ('volume', '<f8'),
+])
+
+def to_day(d):
+    # 'YYYY-MM-DD...' / date -> epoch 天数
+    if isinstance(d, (datetime.date, datetime.datetime)): d = d.strftime('%Y-%m-%d')
+    return int(np.datetime64(str(d)[:10], 'D').astype(np.int64))
+
+def from_day(n):
+    return datetime.date(1970, 1, 1) + datetime.timedelta(days=int(n))
+
+def from_records(rows):
+    # FMP historical-price-eod 行 (任意顺序) -> 按日期升序、去重的结构化数组
+    rows = [r for r in (rows or []) if isinstance(r, dict) and r.get('date')]
+    out = np.empty(len(rows), dtype=BAR_DTYPE)
+    for i, r in enumerate(rows):
+        out[i] = (to_day(r['date']), r.get('open') or 0, r.get('high') or 0, r.get('low') or 0, r.get('close') or 0, r.get('volume') or 0)
+    out.sort(order='date')
+    if len(out) > 1:
+        # 同一天保留最后一条
+        keep = np.append(out['date'][1:] != out['date'][:-1], True)
+        out = out[keep]
+    return out
+
+class BarStore:
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, symbol):
+        safe = "".join(c if c.isalnum() or c in ".-" else "_" for c in symbol.upper())
+        return os.path.join(self.root, f"{safe}.bin")
+
+    def _count(self, path):
+        # 不完整的尾部记录 (写入中途崩溃) 直接忽略
+        try: return os.path.getsize(path) // BAR_DTYPE.itemsize
+        except OSError: return 0
+
+    def _map(self, symbol):
+        path = self._path(symbol)
+        n = self._count(path)
+        if n == 0: return None
+        return np.memmap(path, dtype=BAR_DTYPE, mode='r', shape=(n,))
+
+    def symbols(self):
+        return sorted(f[:-4] for f in os.listdir(self.root) if f.endswith('.bin'))
+
+    def last_date(self, symbol):
+        mm = self._map(symbol)
+        if mm is None: return None
+        last = from_day(mm['date'][-1])
+        del mm
+        return last
+
+    def first_date(self, symbol):
+        mm = self._map(symbol)
+        if mm is None: return None
+        first = from_day(mm['date'][0])
+        del mm
+        return first
+
+    def overlap_matches(self, symbol, bars, close_tol=1e-4, volume_tol=0.05):
+        # 新拉到的K线里与本地最后一根同日的那条: 收盘 / 成交量在容差内一致才算历史没被回溯调整；没有重叠的不判断
+        mm = self._map(symbol)
+        if mm is None or len(bars) == 0: return True
+        last = mm[-1].copy(); del mm
+        hit = bars[bars['date'] == last['date']]
+        if len(hit) == 0: return True
+        new = hit[-1]
+        close_ok = abs(new['close'] - last['close']) <= close_tol * max(abs(last['close']), 1e-9)
+        volume_ok = abs(new['volume'] - last['volume']) <= volume_tol * max(last['volume'], 1.0)
+        return bool(close_ok and volume_ok)
+
+    def rewrite(self, symbol, bars):
+        # 整份替换 (先写临时文件再原子替换)，返回写入条数
+        path = self._path(symbol)
+        tmp = path + ".tmp"
+        with open(tmp, 'wb') as f: f.write(np.ascontiguousarray(bars, dtype=BAR_DTYPE).tobytes())
+        os.replace(tmp, path)
+        return len(bars)
+
+    def load(self, symbol, window=None):
+        mm = self._map(symbol)
+        if mm is None: return np.empty(0, dtype=BAR_DTYPE)
+        out = np.array(mm[-window:] if window else mm)
+        del mm
+        return out
+
+    def append(self, symbol, bars):
+        # 只写入比已存最后日期更新的K线，返回写入条数
+        if len(bars) == 0: return 0
+        path = self._path(symbol)
+        n = self._count(path)
+        if n:
+            mm = np.memmap(path, dtype=BAR_DTYPE, mode='r', shape=(n,))
+            last = mm['date'][-1]; del mm
+            bars = bars[bars['date'] > last]
+            if len(bars) == 0: return 0
+        with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+            f.truncate(n * BAR_DTYPE.itemsize)
+            f.seek(0, os.SEEK_END)
+            f.write(np.ascontiguousarray(bars, dtype=BAR_DTYPE).tobytes())
+        return len(bars)
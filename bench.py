@@ -0,0 +1,474 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import logging
+import resource
+import tempfile
+import threading
+import subprocess
+import datetime
+import zlib
+
+from aiohttp import web
+
+import barstore
+
+# ================= 🏁 离线基准测试 =================
+# 本地替身服务器回放 FMP 响应 (录制的 fixture，缺失的代码按模板合成)，
+# 可注入延迟 / 错误率；在 10 / 100 / 1000 只观察池上跑 /check、/list、
+# daily_monitor、premarket_alert 的真实代码路径，记录墙钟、请求数、峰值 RSS、
+# 各阶段耗时，并追加到历史文件里和上一次同配置结果对比。
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+logger = logging.getLogger("bench")
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_fixtures")
+HISTORY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_history.jsonl")
+RECORD_ENDPOINTS = ["quote", "historical-price-eod/full", "income-statement", "ratios-ttm", "profile"]
+
+# ================= 📼 Fixture =================
+def _slug(endpoint, symbol):
+    return f"{endpoint.replace('/', '_')}__{symbol.replace('^', '_')}.json"
+
+def record(symbols, api_key, base_url="https://financialmodelingprep.com"):
+    # 用真实 API 录制一组模板代码的响应
+    import urllib.request, urllib.parse
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    def fetch(endpoint, **params):
+        params['apikey'] = api_key
+        with urllib.request.urlopen(f"{base_url}/stable/{endpoint}?{urllib.parse.urlencode(params)}", timeout=30) as r:
+            return json.loads(r.read())
+    for sym in symbols:
+        for ep in RECORD_ENDPOINTS:
+            extra = {'limit': 2} if ep == "income-statement" else {}
+            with open(os.path.join(FIXTURE_DIR, _slug(ep, sym)), 'w') as f: json.dump(fetch(ep, symbol=sym, **extra), f)
+        logger.info(f"📼 recorded {sym}")
+    today = datetime.date.today()
+    cal = fetch("earnings-calendar", **{'from': today.isoformat(), 'to': (today + datetime.timedelta(days=1)).isoformat()})
+    with open(os.path.join(FIXTURE_DIR, _slug("earnings-calendar", "ALL")), 'w') as f: json.dump(cal, f)
+
+def _synthetic_history(symbol, days=2520):
+    rnd = random.Random(zlib.crc32(symbol.encode()))
+    price = rnd.uniform(20, 400); rows = []; d = datetime.date.today()
+    drift = rnd.gauss(0.0003, 0.0005); vol = rnd.uniform(0.01, 0.035); base_vol = rnd.uniform(5e5, 2e7)
+    closes = []
+    for _ in range(days):
+        price *= 1 + rnd.gauss(drift, vol); closes.append(price)
+    for close in reversed(closes):
+        d -= datetime.timedelta(days=1)
+        while d.weekday() >= 5: d -= datetime.timedelta(days=1)
+        o = close * (1 + rnd.gauss(0, vol / 3))
+        rows.append({'symbol': symbol, 'date': d.isoformat(), 'open': round(o, 4), 'high': round(max(o, close) * (1 + abs(rnd.gauss(0, vol / 2))), 4),
+                     'low': round(min(o, close) * (1 - abs(rnd.gauss(0, vol / 2))), 4), 'close': round(close, 4),
+                     'volume': int(base_vol * rnd.uniform(0.5, 1.8)), 'change': 0, 'changePercent': 0, 'vwap': round(close, 4)})
+    return rows
+
+class FixtureBook:
+    # 录制的响应作模板；请求到未录制的代码时按 crc32 取模板并改写 symbol，保证确定性
+    def __init__(self, directory):
+        self.data = {}
+        self.templates = {}
+        if os.path.isdir(directory):
+            for fn in os.listdir(directory):
+                if not fn.endswith('.json') or '__' not in fn: continue
+                ep, sym = fn[:-5].split('__', 1)
+                with open(os.path.join(directory, fn)) as f: self.data[(ep, sym)] = json.load(f)
+                self.templates.setdefault(ep, []).append(sym)
+        for ep in self.templates: self.templates[ep].sort()
+        self._hist = {}
+
+    def _template(self, ep, symbol):
+        key = (ep, symbol.replace('^', '_'))
+        if key in self.data: return self.data[key]
+        names = self.templates.get(ep)
+        if not names: return None
+        tpl = self.data[(ep, names[zlib.crc32(symbol.encode()) % len(names)])]
+        return [dict(r, symbol=symbol) for r in tpl] if isinstance(tpl, list) else tpl
+
+    def history(self, symbol):
+        if symbol not in self._hist:
+            self._hist[symbol] = self._template("historical-price-eod_full", symbol) or _synthetic_history(symbol)
+        return self._hist[symbol]
+
+    def quote(self, symbol):
+        q = self._template("quote", symbol)
+        if q: return q[0]
+        last = self.history(symbol)[0]
+        return {'symbol': symbol, 'price': last['close'], 'open': last['open'], 'dayHigh': last['high'], 'dayLow': last['low'],
+                'volume': last['volume'], 'previousClose': last['close'], 'earningsAnnouncement': None}
+
+    def income(self, symbol):
+        tpl = self._template("income-statement", symbol)
+        if tpl: return tpl
+        rnd = random.Random(zlib.crc32(symbol.encode()) + 1)
+        rev = rnd.uniform(1e8, 1e11)
+        return [{'symbol': symbol, 'date': '2026-06-30', 'filingDate': '2026-07-30', 'revenue': rev * rnd.uniform(0.8, 1.6), 'eps': rnd.gauss(1.5, 2)},
+                {'symbol': symbol, 'date': '2025-06-30', 'filingDate': '2025-07-30', 'revenue': rev, 'eps': rnd.gauss(1.2, 2)}]
+
+    def ratios(self, symbol):
+        tpl = self._template("ratios-ttm", symbol)
+        if tpl: return tpl
+        rnd = random.Random(zlib.crc32(symbol.encode()) + 2)
+        return [{'symbol': symbol, 'grossProfitMarginTTM': rnd.uniform(0.1, 0.8), 'freeCashFlowYieldTTM': rnd.uniform(-0.02, 0.08)}]
+
+    def profile(self, symbol):
+        tpl = self._template("profile", symbol)
+        if tpl: return tpl
+        sectors = ["Technology", "Healthcare", "Financial Services", "Consumer Cyclical", "Energy", "Industrials"]
+        return [{'symbol': symbol, 'sector': sectors[zlib.crc32(symbol.encode()) % len(sectors)], 'industry': ""}]
+
+    def bulk(self, date, universe):
+        # eod-bulk: 某一天全市场的日线 CSV；观察池代码之外再垫一批无关代码撑起全市场体量
+        if not hasattr(self, '_by_date'): self._by_date = {}
+        lines = ["symbol,date,open,low,high,close,adjClose,volume"]
+        for sym in sorted(universe):
+            if sym not in self._by_date: self._by_date[sym] = {r['date']: r for r in self.history(sym)}
+            r = self._by_date[sym].get(date)
+            if r: lines.append(f"{sym},{date},{r['open']},{r['low']},{r['high']},{r['close']},{r['close']},{r['volume']}")
+        if len(lines) > 1: lines += [f"ZZ{i:04d},{date},10,9.5,10.5,10,10,100000" for i in range(5000)]
+        return "\n".join(lines) + "\n"
+
+    def constituents(self, universe):
+        return [{'symbol': sym, 'name': sym, 'sector': self.profile(sym)[0].get('sector'), 'subSector': ""} for sym in sorted(universe)]
+
+    def earnings(self, universe):
+        cal = self.data.get(("earnings-calendar", "ALL"))
+        if cal is not None: return cal
+        # 约 5% 的观察池代码今明两天有财报，外加一批无关代码撑起全市场体量
+        today = datetime.date.today().isoformat()
+        rows = [{'symbol': s, 'date': today} for s in sorted(universe) if zlib.crc32(s.encode()) % 20 == 0]
+        return rows + [{'symbol': f"ZZ{i:04d}", 'date': today} for i in range(3000)]
+
+# ================= 🛰️ 替身服务器 =================
+class StandInServer:
+    def __init__(self, book, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, seed=0):
+        self.book = book
+        self.latency_ms = latency_ms; self.jitter_ms = jitter_ms; self.error_rate = error_rate
+        self.rnd = random.Random(seed)
+        self.universe = set()
+        self.stats = {}
+        self.port = None
+        self._loop = None; self._runner = None
+
+    def reset(self):
+        self.stats = {}
+
+    def _count(self, ep, dt, error=False):
+        s = self.stats.setdefault(ep, {'requests': 0, 'errors': 0, 'server_s': 0.0})
+        s['requests'] += 1; s['server_s'] += dt
+        if error: s['errors'] += 1
+
+    async def handle(self, request):
+        t0 = time.perf_counter()
+        ep = request.match_info['ep']; q = request.query
+        delay = max(0.0, self.latency_ms + self.rnd.uniform(-self.jitter_ms, self.jitter_ms)) / 1000.0
+        if delay: await asyncio.sleep(delay)
+        if self.error_rate and self.rnd.random() < self.error_rate:
+            self._count(ep, time.perf_counter() - t0, error=True)
+            return web.json_response({'Error Message': 'injected'}, status=self.rnd.choice([429, 500, 503]))
+        body = self.respond(ep, q)
+        self._count(ep, time.perf_counter() - t0)
+        if isinstance(body, str): return web.Response(text=body, content_type="text/csv")
+        return web.json_response(body)
+
+    def respond(self, ep, q):
+        b = self.book
+        if ep == "historical-price-eod/full":
+            rows = b.history(q['symbol'])
+            if 'from' in q: rows = [r for r in rows if r['date'] >= q['from']]
+            if 'to' in q: rows = [r for r in rows if r['date'] <= q['to']]
+            return rows
+        if ep == "quote": return [b.quote(q['symbol'])]
+        if ep == "batch-quote": return [b.quote(s) for s in q['symbols'].split(',') if s]
+        if ep == "earnings-calendar": return b.earnings(self.universe)
+        if ep == "income-statement": return b.income(q['symbol'])[:int(q.get('limit', 2))]
+        if ep == "ratios-ttm": return b.ratios(q['symbol'])
+        if ep == "profile": return b.profile(q['symbol'])
+        if ep == "eod-bulk": return b.bulk(q['date'], self.universe)
+        if ep.endswith("-constituent"): return b.constituents(self.universe)
+        return []
+
+    def start(self):
+        # 独立线程跑自己的事件循环，避免和被测代码抢同一个 loop
+        ready = threading.Event()
+        def run():
+            self._loop = asyncio.new_event_loop(); asyncio.set_event_loop(self._loop)
+            app = web.Application(); app.router.add_route('GET', '/stable/{ep:.*}', self.handle)
+            self._runner = web.AppRunner(app, access_log=None)
+            self._loop.run_until_complete(self._runner.setup())
+            site = web.TCPSite(self._runner, '127.0.0.1', 0)
+            self._loop.run_until_complete(site.start())
+            self.port = site._server.sockets[0].getsockname()[1]
+            ready.set(); self._loop.run_forever()
+        threading.Thread(target=run, daemon=True).start()
+        ready.wait()
+        return f"http://127.0.0.1:{self.port}"
+
+# ================= 🎭 Discord 替身 =================
+class FakeUser:
+    def __init__(self, uid): self.id = uid
+
+class FakeMessage:
+    def __init__(self, sink, content=None, embed=None, embeds=None):
+        self.sink = sink; self.content = content; self.embeds = embeds or ([embed] if embed else [])
+    async def edit(self, content=None, embed=None, embeds=None, **kwargs):
+        self.sink.append(('edit', time.perf_counter()))
+        if content is not None: self.content = content
+        if embed is not None or embeds is not None: self.embeds = embeds or [embed]
+
+class FakeResponse:
+    def __init__(self, owner): self.owner = owner; self._done = False
+    def is_done(self): return self._done
+    async def defer(self, **kwargs): self._done = True
+    async def send_message(self, content=None, **kwargs):
+        self._done = True; self.owner.sent.append(('send', time.perf_counter()))
+
+class FakeFollowup:
+    def __init__(self, owner): self.owner = owner
+    async def send(self, content=None, embed=None, embeds=None, **kwargs):
+        self.owner.sent.append(('send', time.perf_counter()))
+        return FakeMessage(self.owner.sent, content, embed, embeds)
+
+class FakeInteraction:
+    def __init__(self, uid):
+        self.user = FakeUser(uid); self.sent = []
+        self.response = FakeResponse(self); self.followup = FakeFollowup(self)
+
+class FakeChannel:
+    def __init__(self): self.messages = []
+    async def send(self, content=None, **kwargs):
+        self.messages.append(content)
+        return FakeMessage([], content)
+
+# ================= ⏱️ 阶段计时 =================
+class StageTimer:
+    # 包住 main 里的阶段函数，记录每次调用的 (开始, 结束)，按区间并集算墙钟占用
+    def __init__(self): self.spans = {}
+
+    def wrap(self, module, name, stage=None):
+        fn = getattr(module, name); stage = stage or name
+        if asyncio.iscoroutinefunction(fn):
+            async def timed(*a, **kw):
+                t0 = time.perf_counter()
+                try: return await fn(*a, **kw)
+                finally: self.spans.setdefault(stage, []).append((t0, time.perf_counter()))
+        else:
+            def timed(*a, **kw):
+                t0 = time.perf_counter()
+                try: return fn(*a, **kw)
+                finally: self.spans.setdefault(stage, []).append((t0, time.perf_counter()))
+        setattr(module, name, timed)
+
+    def reset(self): self.spans = {}
+
+    def report(self):
+        out = {}
+        for stage, spans in self.spans.items():
+            covered = 0.0; end = float('-inf')
+            for a, b in sorted(spans):
+                if b <= end: continue
+                covered += b - max(a, end); end = b
+            out[stage] = {'calls': len(spans), 'wall_s': round(covered, 4), 'sum_s': round(sum(b - a for a, b in spans), 4)}
+        return out
+
+def rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'): return int(line.split()[1]) / 1024
+    except OSError: pass
+    return 0.0
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+# ================= 🏃 场景 =================
+def make_watchlists(n_tickers, n_users):
+    # 每个用户取池子的一段，相邻用户重叠一半，模拟热门股被多人关注
+    tickers = [f"T{i:04d}" for i in range(n_tickers)]
+    per_user = max(1, min(n_tickers, 2 * n_tickers // max(n_users, 1)))
+    data = {}
+    for u in range(n_users):
+        start = (u * per_user // 2) % n_tickers
+        data[str(100000 + u)] = {tickers[(start + k) % n_tickers]: {} for k in range(per_user)}
+    return tickers, data
+
+def reset_state_memory(main):
+    # 只清进程内状态 (缓存 / 当天的表)，盘上的K线库、基本面、板块映射保留
+    for name in ('api_cache', 'quote_table', 'bars_synced', 'score_memo'):
+        cache = getattr(main, name, None)
+        if cache is not None: cache.clear()
+    if hasattr(main, 'universe'): main.universe.lists.clear()
+    if hasattr(main, 'prewarmer'): main.prewarmer.warmed.clear()
+    main.market_regime.spy_at = 0; main.market_regime.vix_at = 0
+    main.earnings_calendar.day = None
+    main.sector_service.day = None; main.sector_service.returns.clear(); main.sector_service.profiles = None
+
+def reset_state(main, data_dir):
+    import shutil
+    shutil.rmtree(os.path.join(data_dir, "bars"), ignore_errors=True)
+    os.makedirs(os.path.join(data_dir, "bars"), exist_ok=True)
+    reset_state_memory(main)
+    if os.path.exists(main.SECTOR_MAP_FILE): os.remove(main.SECTOR_MAP_FILE)
+    main.fund_store.close()
+    if os.path.exists(main.SNAPSHOT_FILE): os.remove(main.SNAPSHOT_FILE)
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(main.FUND_DB_FILE + suffix): os.remove(main.FUND_DB_FILE + suffix)
+
+async def run_scenarios(main, server, timer, sizes, n_users, check_count):
+    channel = FakeChannel()
+    main.bot.get_channel = lambda _id: channel
+    results = []
+    for size in sizes:
+        tickers, data = make_watchlists(size, n_users)
+        server.universe = set(tickers)
+        scenarios = [
+            ('check', lambda: _run_checks(main, tickers[:check_count])),
+            ('check_repeat', lambda: _run_checks(main, tickers[:check_count]), lambda: _run_checks(main, tickers[:check_count])),
+            ('list', lambda: main.list_stocks.callback(FakeInteraction(int(next(iter(data)))))),
+            ('daily_monitor', lambda: main.daily_monitor.coro()),
+            ('premarket_alert', lambda: main.premarket_alert.coro()),
+        ]
+        if hasattr(main, 'prewarmer'):
+            scenarios += [
+                ('daily_monitor_warm', lambda: main.daily_monitor.coro(), lambda: _prewarm(main, 'daily_monitor')),
+                ('premarket_warm', lambda: main.premarket_alert.coro(), lambda: _prewarm(main, 'premarket_alert')),
+            ]
+        if hasattr(main, 'scan_market'):
+            scenarios += [
+                ('scan', lambda: main.scan_market.callback(FakeInteraction(1))),
+                ('scan_warm', lambda: main.scan_market.callback(FakeInteraction(1)), lambda: _next_day(main)),
+            ]
+        for name, factory, *setup in scenarios:
+            reset_state(main, main.BASE_PATH)
+            main.watchlist.replace(data)
+            for fn in setup: await fn()
+            server.reset(); timer.reset(); channel.messages.clear()
+            rss0 = rss_mb(); t0 = time.perf_counter()
+            await factory()
+            wall = time.perf_counter() - t0
+            stats = server.stats
+            row = {
+                'scenario': name, 'tickers': size, 'users': n_users,
+                'wall_s': round(wall, 3),
+                'requests': sum(s['requests'] for s in stats.values()),
+                'errors': sum(s['errors'] for s in stats.values()),
+                'endpoints': {ep: s['requests'] for ep, s in sorted(stats.items())},
+                'stages': timer.report(),
+                'rss_mb': round(rss_mb(), 1), 'rss_delta_mb': round(rss_mb() - rss0, 1), 'peak_rss_mb': round(peak_rss_mb(), 1),
+                'messages': len(channel.messages),
+            }
+            results.append(row)
+            logger.info(f"🏁 {name:<16} n={size:<5} wall={row['wall_s']:>8.3f}s req={row['requests']:<6} err={row['errors']:<4} peakRSS={row['peak_rss_mb']}MB")
+    return results
+
+async def _prewarm(main, name):
+    # 预热窗口压缩为零: 触发时刻就是现在，批次不间隔
+    await main.prewarmer.warm(name, main.datetime.datetime.now(main.NY_TZ))
+
+async def _next_day(main):
+    # 冷跑一遍 /scan 后把每只的最后一根K线截掉、清掉当天的内存缓存，
+    # 模拟隔天: 本地K线落后一个交易日，基本面 / 板块映射已在盘上
+    await main.scan_market.callback(FakeInteraction(1))
+    for sym in main.bar_store.symbols():
+        path = main.bar_store._path(sym); n = main.bar_store._count(path)
+        if n: os.truncate(path, (n - 1) * barstore.BAR_DTYPE.itemsize)
+    reset_state_memory(main)
+
+async def _run_checks(main, tickers):
+    for t in tickers:
+        await main.check_stocks.callback(FakeInteraction(1), t)
+
+# ================= 📒 历史对比 =================
+def git_rev():
+    try: return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError: return ""
+
+def compare_history(results, config, history_file, threshold):
+    # 与同配置的上一次结果比较，wall / requests 变差超过阈值即视为回退
+    prev = None
+    if os.path.exists(history_file):
+        with open(history_file) as f:
+            for line in f:
+                try: entry = json.loads(line)
+                except ValueError: continue
+                if entry.get('config') == config: prev = entry
+    regressions = []
+    if prev:
+        old = {(r['scenario'], r['tickers']): r for r in prev['results']}
+        for r in results:
+            o = old.get((r['scenario'], r['tickers']))
+            if not o: continue
+            for metric in ('wall_s', 'requests'):
+                if o[metric] > 0 and r[metric] > o[metric] * (1 + threshold) and r[metric] - o[metric] > (0.05 if metric == 'wall_s' else 0):
+                    regressions.append(f"{r['scenario']}@{r['tickers']} {metric}: {o[metric]} -> {r[metric]} (prev {prev.get('rev')})")
+    return regressions
+
+def main_cli():
+    ap = argparse.ArgumentParser(description="V34 离线基准测试")
+    sub = ap.add_subparsers(dest='cmd')
+    rec = sub.add_parser('record', help="用真实 FMP 录制模板 fixture (需要 FMP_API_KEY)")
+    rec.add_argument('--symbols', default="AAPL,NVDA,MSFT,TSLA,JPM,XOM,LLY,COIN,SPY,SMH,XLK")
+    run = sub.add_parser('run', help="跑基准 (默认)")
+    for p in (ap, run):
+        p.add_argument('--sizes', default="10,100,1000")
+        p.add_argument('--users', type=int, default=20)
+        p.add_argument('--checks', type=int, default=5, help="/check 场景连续查询的代码数")
+        p.add_argument('--latency-ms', type=float, default=40.0)
+        p.add_argument('--jitter-ms', type=float, default=20.0)
+        p.add_argument('--error-rate', type=float, default=0.0)
+        p.add_argument('--history', default=HISTORY_FILE)
+        p.add_argument('--threshold', type=float, default=0.15, help="回退判定阈值 (比例)")
+        p.add_argument('--no-record', action='store_true', help="不写入历史文件")
+        p.add_argument('--fail-on-regression', action='store_true')
+    args = ap.parse_args()
+
+    if args.cmd == 'record':
+        key = os.getenv('FMP_API_KEY')
+        if not key: sys.exit("FMP_API_KEY 未设置")
+        record([s.strip().upper() for s in args.symbols.split(',') if s.strip()], key)
+        return
+
+    server = StandInServer(FixtureBook(FIXTURE_DIR), args.latency_ms, args.jitter_ms, args.error_rate)
+    base_url = server.start()
+    data_dir = tempfile.mkdtemp(prefix="v34bench_")
+    os.environ.update(FMP_API_KEY="bench", FMP_BASE_URL=base_url, DATA_PATH=data_dir, FMP_BACKOFF="0.05")
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    logging.getLogger().setLevel(logging.WARNING); logger.setLevel(logging.INFO)
+    import main
+    main.logger.setLevel(logging.ERROR)
+
+    timer = StageTimer()
+    for name, stage in (('get_market_regime_detailed', 'regime'), ('prefetch_quotes', 'batch_quote'),
+                        ('get_daily_data_stable', 'bars+quote'), ('get_fundamentals_deep', 'fundamentals'),
+                        ('get_sector_momentum', 'sector'), ('score_frames', 'score'), ('score_frames_async', 'score')):
+        if hasattr(main, name): timer.wrap(main, name, stage)
+    if hasattr(main, 'sector_service'): timer.wrap(main.sector_service, 'prepare', 'sector_table')
+
+    sizes = [int(s) for s in args.sizes.split(',') if s.strip()]
+    config = {'sizes': sizes, 'users': args.users, 'checks': args.checks, 'latency_ms': args.latency_ms,
+              'jitter_ms': args.jitter_ms, 'error_rate': args.error_rate}
+
+    async def go():
+        try: return await run_scenarios(main, server, timer, sizes, args.users, args.checks)
+        finally: await main.fmp.close()
+    results = asyncio.run(go())
+
+    regressions = compare_history(results, config, args.history, args.threshold)
+    if not args.no_record:
+        with open(args.history, 'a') as f:
+            f.write(json.dumps({'ts': datetime.datetime.now().isoformat(timespec='seconds'), 'rev': git_rev(), 'config': config, 'results': results}, ensure_ascii=False) + "\n")
+    for r in results:
+        stages = ", ".join(f"{k} {v['wall_s']}s/{v['calls']}" for k, v in sorted(r['stages'].items()))
+        print(f"{r['scenario']:<16} {r['tickers']:>5} tickers  {r['wall_s']:>8.3f}s  {r['requests']:>6} req  peak {r['peak_rss_mb']:>7.1f}MB  | {stages}")
+    if regressions:
+        print("⚠️ 性能回退:")
+        for r in regressions: print("   " + r)
+        if args.fail_on_regression: sys.exit(1)
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,143 @@
+import os
+import sys
+import time
+import pickle
+import asyncio
+import datetime
+import collections
+import numpy as np
+
+# ================= 🗄️ 统一缓存 =================
+# 所有命名空间共用一条 LRU 链和一个内存预算，超出预算从最久未用的条目开始淘汰；
+# 每个命名空间有自己的 TTL，并可选跨自然日失效 (昨天的行情 / 基本面不复用)。
+
+def sizeof(obj):
+    # 粗略估算占用字节: DataFrame / ndarray 按数据缓冲区算，容器递归累加
+    # pandas 还没真正加载时不可能是 DataFrame，不为判断类型去触发导入
+    # (main 用 LazyLoader 先登记了 'pandas'，碰一下 pd.DataFrame 就会整包加载，所以看 pandas.core.frame)
+    frame = sys.modules.get('pandas.core.frame')
+    if frame is not None and isinstance(obj, frame.DataFrame): return int(obj.memory_usage(index=True, deep=False).sum())
+    if isinstance(obj, np.ndarray): return obj.nbytes
+    if isinstance(obj, dict): return sys.getsizeof(obj) + sum(sizeof(k) + sizeof(v) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)): return sys.getsizeof(obj) + sum(sizeof(v) for v in obj)
+    return sys.getsizeof(obj)
+
+def _today():
+    return datetime.datetime.now().strftime('%Y-%m-%d')
+
+class Cache:
+    def __init__(self, max_bytes, stats=None):
+        self.max_bytes = max_bytes
+        self.stats = stats
+        self.ttl = {}; self.same_day = {}
+        self.entries = collections.OrderedDict()  # (ns, key) -> (value, stored_at, day, nbytes)
+        self.nbytes = 0
+        self.ns_bytes = collections.Counter()
+        self.ns_count = collections.Counter()
+        self.writes = 0  # 写入次数，快照据此判断有没有新数据
+
+    def namespace(self, ns, ttl, same_day=True):
+        self.ttl[ns] = ttl; self.same_day[ns] = same_day
+
+    def _count(self, ns, event):
+        if self.stats is not None: self.stats.incr(f"cache.{ns}.{event}")
+
+    def _drop(self, k):
+        _, _, _, n = self.entries.pop(k)
+        self.nbytes -= n; self.ns_bytes[k[0]] -= n; self.ns_count[k[0]] -= 1
+
+    def _fresh(self, ns, entry):
+        _, stored_at, day, _ = entry
+        if time.time() - stored_at > self.ttl.get(ns, float('inf')): return False
+        return not self.same_day.get(ns, True) or day == _today()
+
+    def contains(self, ns, key):
+        # 只判断是否有未过期条目，不计命中、不调整 LRU 顺序
+        entry = self.entries.get((ns, key))
+        return entry is not None and self._fresh(ns, entry)
+
+    def get(self, ns, key, default=None):
+        k = (ns, key)
+        entry = self.entries.get(k)
+        if entry is not None and not self._fresh(ns, entry):
+            self._drop(k); self._count(ns, 'expire'); entry = None
+        self._count(ns, 'hit' if entry is not None else 'miss')
+        if entry is None: return default
+        self.entries.move_to_end(k)
+        return entry[0]
+
+    def put(self, ns, key, value, stored_at=None, day=None):
+        k = (ns, key)
+        if k in self.entries: self._drop(k)
+        n = sizeof(value)
+        if n > self.max_bytes: return value  # 单条就超预算的不缓存
+        self.entries[k] = (value, stored_at or time.time(), day or _today(), n)
+        self.nbytes += n; self.ns_bytes[ns] += n; self.ns_count[ns] += 1; self.writes += 1
+        while self.nbytes > self.max_bytes:
+            old = next(iter(self.entries))
+            self._drop(old); self._count(old[0], 'evict')
+        return value
+
+    def discard(self, ns, key):
+        # 输入变了的旧条目直接删掉，不等 LRU
+        if (ns, key) in self.entries: self._drop((ns, key))
+
+    def clear(self, *namespaces):
+        # 不传参数 = 全部清空
+        for k in [k for k in self.entries if not namespaces or k[0] in namespaces]:
+            self._drop(k)
+
+    def dump(self):
+        # 快照用: 未过期条目按 LRU 顺序 [(ns, key, value, stored_at, day), ...]
+        return [(k[0], k[1], e[0], e[1], e[2]) for k, e in self.entries.items() if self._fresh(k[0], e)]
+
+    def load(self, rows):
+        # 恢复快照: 保留原始写入时间和日期，按当前 TTL / 自然日重新判断，过期的丢弃
+        n = 0
+        for ns, key, value, stored_at, day in rows:
+            if not self._fresh(ns, (value, stored_at, day, 0)): continue
+            self.put(ns, key, value, stored_at=stored_at, day=day); n += 1
+        return n
+
+    def usage(self):
+        # ns -> (条数, 字节)
+        return {ns: (self.ns_count[ns], self.ns_bytes[ns]) for ns in sorted(set(self.ttl) | set(self.ns_count))}
+
+    def __len__(self):
+        return len(self.entries)
+
+# ================= 💾 快照 =================
+def write_snapshot(path, state):
+    # 先写临时文件再原子替换，进程中途被杀也不会留下半个快照
+    tmp = path + ".tmp"
+    with open(tmp, 'wb') as f: pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+def read_snapshot(path, version):
+    # 文件不存在 / 损坏 / 格式版本不符一律当作没有快照
+    try:
+        with open(path, 'rb') as f: state = pickle.load(f)
+    except Exception:
+        return None
+    return state if isinstance(state, dict) and state.get('version') == version else None
+
+# ================= 🛫 同 key 请求合并 =================
+class SingleFlight:
+    # 同一 key 同时只跑一个加载协程，后到的调用方直接等同一个结果
+    def __init__(self, stats=None):
+        self.inflight = {}
+        self.stats = stats
+
+    def _done(self, key, task):
+        if self.inflight.get(key) is task: del self.inflight[key]
+
+    async def do(self, key, fn, *args):
+        task = self.inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn(*args))
+            self.inflight[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+        elif self.stats is not None:
+            self.stats.incr(f"singleflight.{key[0]}.shared")
+        # shield: 某个调用方被取消不会连带取消其他人在等的加载
+        return await asyncio.shield(task)
@@ -0,0 +1,71 @@
+import json
+import sqlite3
+import datetime
+
+# ================= 🏦 基本面存储 =================
+# 每个代码一行: 最新财报的 filingDate + 上次联网校验日期 + 已知的最近财报日 + 计算好的指标。
+# 跨重启保留；只有过了 TTL，或财报日之后新报表还没出现时才需要重新联网。
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fund (
+    symbol TEXT PRIMARY KEY,
+    filing_date TEXT,
+    checked TEXT NOT NULL,
+    earn_date TEXT,
+    data TEXT NOT NULL
+);
+"""
+
+def _date(s):
+    try: return datetime.date.fromisoformat(str(s)[:10]) if s else None
+    except ValueError: return None
+
+class FundamentalsStore:
+    def __init__(self, path, ttl_days=30, earn_window=10):
+        self.path = path
+        self.ttl_days = ttl_days  # 距上次校验超过这么多天就重新校验
+        self.earn_window = earn_window  # 财报日后这么多天内，报表没更新就每天再查一次
+        self._db = None
+
+    @property
+    def db(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(SCHEMA)
+        return self._db
+
+    def get(self, symbol):
+        row = self.db.execute("SELECT filing_date, checked, earn_date, data FROM fund WHERE symbol = ?", (symbol,)).fetchone()
+        if row is None: return None
+        return {'filing_date': row[0], 'checked': row[1], 'earn_date': row[2], 'data': json.loads(row[3])}
+
+    def put(self, symbol, filing_date, data, checked, earn_date=None):
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO fund (symbol, filing_date, checked, earn_date, data) VALUES (?, ?, ?, ?, ?)",
+                            (symbol, filing_date, checked, earn_date, json.dumps(data)))
+
+    def touch(self, symbol, checked):
+        # 报表没变: 只更新校验日期
+        with self.db:
+            self.db.execute("UPDATE fund SET checked = ? WHERE symbol = ?", (checked, symbol))
+
+    def note_earnings(self, symbol, earn_date):
+        # 记下更新的财报日 (只往后推)
+        with self.db:
+            self.db.execute("UPDATE fund SET earn_date = ? WHERE symbol = ? AND (earn_date IS NULL OR earn_date < ?)",
+                            (earn_date, symbol, earn_date))
+
+    def is_stale(self, row, today=None):
+        today = today or datetime.date.today()
+        checked = _date(row['checked'])
+        if checked is None or (today - checked).days >= self.ttl_days: return True
+        earn = _date(row['earn_date']); filing = _date(row['filing_date'])
+        # 财报已发布但手上的报表还是旧的: 窗口内每天最多查一次
+        if earn and checked < today and 0 <= (today - earn).days <= self.earn_window:
+            return filing is None or filing < earn
+        return False
+
+    def close(self):
+        if self._db is not None:
+            self._db.close(); self._db = None
@@ -0,0 +1,224 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# ================= 📐 向量化指标内核 =================
+# 所有函数沿最后一维计算，既支持单只 (bars,) 也支持整批 (symbols, bars)。
+# 数值口径与 pandas_ta 默认参数一致: WMA/HMA 线性加权，ATR/RSI 使用 RMA
+# (ewm(alpha=1/n, adjust=True, min_periods=n))。
+
+def _f64(x):
+    return np.ascontiguousarray(x, dtype=np.float64)
+
+def _nan_like(x):
+    return np.full(x.shape, np.nan)
+
+def _pad(y, x, n):
+    # 滑窗结果左侧补 NaN，对齐回原长度
+    out = _nan_like(x)
+    out[..., n - 1:] = y
+    return out
+
+def wma(x, n):
+    # Σ (k-(t-n)) x_k 用两条累加和做差得到，O(bars)，不展开滑窗 (整段回测时省内存)
+    x = _f64(x)
+    if x.shape[-1] < n: return _nan_like(x)
+    nan = np.isnan(x)
+    x0 = np.where(nan, 0.0, x)
+    k = np.arange(x.shape[-1], dtype=np.float64)
+    z = np.zeros(x.shape[:-1] + (1,))
+    c1 = np.concatenate([z, np.cumsum(x0, axis=-1)], axis=-1)
+    c2 = np.concatenate([z, np.cumsum(x0 * k, axis=-1)], axis=-1)
+    cn = np.concatenate([z, np.cumsum(nan, axis=-1)], axis=-1)
+    start = k[n - 1:] - n + 1  # 每个窗口第一根的下标
+    s = ((c2[..., n:] - c2[..., :-n]) - (start - 1) * (c1[..., n:] - c1[..., :-n])) / (n * (n + 1) / 2)
+    s[(cn[..., n:] - cn[..., :-n]) > 0] = np.nan
+    return _pad(s, x, n)
+
+def hma(x, n):
+    half = int(n / 2); sq = int(np.sqrt(n))
+    return wma(2 * wma(x, half) - wma(x, n), sq)
+
+def sma(x, n):
+    x = _f64(x)
+    if x.shape[-1] < n: return _nan_like(x)
+    nan = np.isnan(x)
+    z = np.zeros(x.shape[:-1] + (1,))
+    cs = np.concatenate([z, np.cumsum(np.where(nan, 0.0, x), axis=-1)], axis=-1)
+    cn = np.concatenate([z, np.cumsum(nan, axis=-1)], axis=-1)
+    s = (cs[..., n:] - cs[..., :-n]) / n
+    s[(cn[..., n:] - cn[..., :-n]) > 0] = np.nan
+    return _pad(s, x, n)
+
+def rolling_max(x, n):
+    x = _f64(x)
+    if x.shape[-1] < n: return _nan_like(x)
+    return _pad(sliding_window_view(x, n, axis=-1).max(axis=-1), x, n)
+
+def rolling_min(x, n):
+    x = _f64(x)
+    if x.shape[-1] < n: return _nan_like(x)
+    return _pad(sliding_window_view(x, n, axis=-1).min(axis=-1), x, n)
+
+def _iir(w, x):
+    # 一阶 IIR: y_t = x_t + w·y_{t-1}。scipy.signal 导入要 1 秒多，首次评分时才加载
+    from scipy.signal import lfilter
+    return lfilter([1.0], [1.0, -w], x, axis=-1)
+
+def preload():
+    # 进程池预热: 在子进程里提前走一遍上面的导入
+    _iir(0.5, np.zeros(1))
+
+def rma(x, n):
+    # 调整后的 EWM: y_t = Σ w^k x_{t-k} / Σ w^k (只计有效值)，用 IIR 滤波一次算完
+    x = _f64(x)
+    w = 1.0 - 1.0 / n
+    valid = ~np.isnan(x)
+    num = _iir(w, np.where(valid, x, 0.0))
+    den = _iir(w, valid.astype(np.float64))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        y = num / den
+    y[np.cumsum(valid, axis=-1) < n] = np.nan
+    return y
+
+def _shift(x, k=1):
+    out = _nan_like(x)
+    out[..., k:] = x[..., :-k]
+    return out
+
+def true_range(high, low, close):
+    high = _f64(high); low = _f64(low)
+    prev = _shift(_f64(close))
+    # 前收盘缺失 (首根或左侧补齐) 时 TR 记为 NaN，与 pandas_ta 一致
+    tr = np.where(np.isnan(prev), np.nan, np.fmax(np.abs(high - low), np.fmax(np.abs(high - prev), np.abs(prev - low))))
+    return tr
+
+def atr(high, low, close, n=14):
+    return rma(true_range(high, low, close), n)
+
+def _gain_loss(close):
+    diff = np.diff(_f64(close), axis=-1, prepend=np.nan)
+    return np.where(diff > 0, diff, np.where(np.isnan(diff), np.nan, 0.0)), np.where(diff < 0, -diff, np.where(np.isnan(diff), np.nan, 0.0))
+
+def rsi(close, n=14):
+    gain, loss = _gain_loss(close)
+    g = rma(gain, n); l = rma(loss, n)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return 100.0 * g / (g + l)
+
+# ================= 🎯 评分所需的最后一根K线 =================
+def tail_length(hma_fast=55, hma_slow=144):
+    # 计算窗口类指标最后一根所需的尾部长度
+    return max(hma_slow + int(np.sqrt(hma_slow)) - 1, hma_fast + int(np.sqrt(hma_fast)) - 1, 233, 144 + 9, 50, 22, 21 + 1)
+
+def _last(x):
+    return x[..., -1]
+
+def _window_values(high, low, close, volume, hma_fast, hma_slow):
+    # 只在尾部窗口上计算，不生成整段序列
+    t = tail_length(hma_fast, hma_slow)
+    h = high[..., -t:]; l = low[..., -t:]; c = close[..., -t:]; v = volume[..., -t:]
+    bars = c.shape[-1]
+
+    def mean_at(x, n, lag=0):
+        if bars < n + lag: return np.full(x.shape[:-1], np.nan)
+        return x[..., bars - n - lag:bars - lag].mean(axis=-1)
+
+    with np.errstate(all='ignore'):
+        prior = h[..., -21:-1]
+        if prior.shape[-1]:
+            # 对应 df['HIGH'].iloc[-21:-1].max()，跳过左侧补齐的 NaN
+            high_prior20 = np.where(np.isnan(prior).all(axis=-1), np.nan, np.nanmax(np.where(np.isnan(prior), -np.inf, prior), axis=-1))
+        else:
+            high_prior20 = np.full(c.shape[:-1], np.nan)
+        return {
+            'close': _last(c), 'high': _last(h), 'low': _last(l), 'volume': _last(v),
+            'prev_close': c[..., -2] if bars > 1 else np.full(c.shape[:-1], np.nan),
+            'hma_fast': _last(hma(c[..., -(hma_fast + int(np.sqrt(hma_fast)) - 1):], hma_fast)),
+            'hma_slow': _last(hma(c[..., -(hma_slow + int(np.sqrt(hma_slow)) - 1):], hma_slow)),
+            'vol_ma20': mean_at(v, 20), 'vol_ma50': mean_at(v, 50),
+            'ma144': mean_at(c, 144), 'ma233': mean_at(c, 233), 'ma144_lag': mean_at(c, 144, lag=9),
+            'high_prior20': high_prior20,
+            'high_22': h[..., -22:].max(axis=-1) if bars >= 22 else np.full(c.shape[:-1], np.nan),
+            'low_21': l[..., -21:].min(axis=-1) if bars >= 21 else np.full(c.shape[:-1], np.nan),
+        }
+
+def snapshot(high, low, close, volume, hma_fast=55, hma_slow=144, atr_len=14, rsi_len=14):
+    # 一次性算出评分读取的全部最后一根指标值；输入数组不会被修改
+    high = _f64(high); low = _f64(low); close = _f64(close); volume = _f64(volume)
+    out = _window_values(high, low, close, volume, hma_fast, hma_slow)
+    out['atr'] = _last(atr(high, low, close, atr_len))
+    out['rsi'] = _last(rsi(close, rsi_len))
+    return out
+
+class _RMAState:
+    # 调整后 EWM 的累加器 (num, den, 有效计数)，可逐根推进
+    def __init__(self, x, n):
+        x = _f64(x)
+        self.n = n; self.w = 1.0 - 1.0 / n
+        valid = ~np.isnan(x)
+        self.num = _iir(self.w, np.where(valid, x, 0.0))[..., -1] if x.shape[-1] else np.zeros(x.shape[:-1])
+        self.den = _iir(self.w, valid.astype(np.float64))[..., -1] if x.shape[-1] else np.zeros(x.shape[:-1])
+        self.count = valid.sum(axis=-1)
+
+    def peek(self, x):
+        valid = ~np.isnan(x)
+        num = self.w * self.num + np.where(valid, x, 0.0)
+        den = self.w * self.den + valid
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.count + valid >= self.n, num / den, np.nan), (num, den, self.count + valid)
+
+    def push(self, x):
+        _, (self.num, self.den, self.count) = self.peek(x)
+
+class IndicatorState:
+    # 已收盘K线的增量状态: 尾部窗口 + ATR/RSI 的 RMA 累加器。
+    # snapshot() 用一根新的(或盘中更新的)最后K线出结果，代价 O(尾部窗口)；push() 提交收盘K线。
+    def __init__(self, high, low, close, volume, hma_fast=55, hma_slow=144, atr_len=14, rsi_len=14):
+        high = _f64(high); low = _f64(low); close = _f64(close); volume = _f64(volume)
+        self.hma_fast = hma_fast; self.hma_slow = hma_slow
+        self.keep = tail_length(hma_fast, hma_slow) - 1
+        self.tails = [a[..., -self.keep:].copy() for a in (high, low, close, volume)]
+        self.prev_close = close[..., -1] if close.shape[-1] else np.full(close.shape[:-1], np.nan)
+        self.tr = _RMAState(true_range(high, low, close), atr_len)
+        gain, loss = _gain_loss(close)
+        self.gain = _RMAState(gain, rsi_len); self.loss = _RMAState(loss, rsi_len)
+
+    def _bar_inputs(self, h, l, c):
+        h = np.asarray(h, dtype=np.float64); l = np.asarray(l, dtype=np.float64); c = np.asarray(c, dtype=np.float64)
+        p = self.prev_close
+        tr = np.where(np.isnan(p), np.nan, np.fmax(np.abs(h - l), np.fmax(np.abs(h - p), np.abs(p - l))))
+        diff = c - p
+        gain = np.where(np.isnan(diff), np.nan, np.maximum(diff, 0.0))
+        loss = np.where(np.isnan(diff), np.nan, np.maximum(-diff, 0.0))
+        return tr, gain, loss
+
+    def snapshot(self, h, l, c, v):
+        tails = [np.concatenate([t, np.asarray(x, dtype=np.float64)[..., None]], axis=-1) for t, x in zip(self.tails, (h, l, c, v))]
+        out = _window_values(*tails, self.hma_fast, self.hma_slow)
+        tr, gain, loss = self._bar_inputs(h, l, c)
+        out['atr'] = self.tr.peek(tr)[0]
+        g = self.gain.peek(gain)[0]; lo = self.loss.peek(loss)[0]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            out['rsi'] = 100.0 * g / (g + lo)
+        return out
+
+    def push(self, h, l, c, v):
+        tr, gain, loss = self._bar_inputs(h, l, c)
+        self.tr.push(tr); self.gain.push(gain); self.loss.push(loss)
+        self.tails = [np.concatenate([t, np.asarray(x, dtype=np.float64)[..., None]], axis=-1)[..., -self.keep:] for t, x in zip(self.tails, (h, l, c, v))]
+        self.prev_close = np.asarray(c, dtype=np.float64)
+
+# ================= 📈 整段序列 (回测用) =================
+def series(high, low, close, volume, hma_fast=55, hma_slow=144, atr_len=14, rsi_len=14):
+    # 与 snapshot() 同名同义的逐日序列，每个值都只用到当日及以前的数据
+    high = _f64(high); low = _f64(low); close = _f64(close); volume = _f64(volume)
+    ma144 = sma(close, 144)
+    return {
+        'close': close, 'high': high, 'low': low, 'volume': volume, 'prev_close': _shift(close),
+        'hma_fast': hma(close, hma_fast), 'hma_slow': hma(close, hma_slow),
+        'vol_ma20': sma(volume, 20), 'vol_ma50': sma(volume, 50),
+        'ma144': ma144, 'ma233': sma(close, 233), 'ma144_lag': _shift(ma144, 9),
+        'high_prior20': _shift(rolling_max(high, 20)),
+        'high_22': rolling_max(high, 22), 'low_21': rolling_min(low, 21),
+        'atr': atr(high, low, close, atr_len), 'rsi': rsi(close, rsi_len),
+    }
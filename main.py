@@ -1,20 +1,52 @@
 import discord
 from discord import app_commands
 from discord.ext import commands, tasks
-import requests
-import pandas as pd
-import pandas_ta as ta
+import aiohttp
 import numpy as np
 import datetime
 import os
+import sys
 import json
 import asyncio
 import pytz 
 import math
 import logging
 import io
-import copy
-from dateutil import parser
+import re
+import csv
+import random
+import functools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import time
+import signal
+import threading
+import hashlib
+import importlib
+import importlib.util
+import importlib.metadata
+from urllib.parse import urlencode
+from barstore import BarStore, from_records, to_day
+import indicators
+import scoring
+import metrics
+from cache import Cache, SingleFlight, write_snapshot, read_snapshot
+from watchlist import WatchlistStore
+from fundstore import FundamentalsStore
+
+def lazy_import(name):
+    # 先登记模块，第一次访问属性时才真正执行导入 (importlib.util.LazyLoader)
+    if name in sys.modules: return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+# pandas 导入要小半秒，首次拉行情 / 读快照时才加载
+pd = lazy_import('pandas')
 
 # ================= 🛠️ 系统配置 =================
 logging.basicConfig(
@@ -29,18 +61,81 @@ logger = logging.getLogger(__name__)
 TOKEN = os.getenv('DISCORD_TOKEN') 
 CHANNEL_ID = int(os.getenv('CHANNEL_ID', '0'))
 FMP_API_KEY = os.getenv('FMP_API_KEY') 
+FMP_BASE_URL = os.getenv('FMP_BASE_URL', 'https://financialmodelingprep.com')
+FMP_MAX_INFLIGHT = int(os.getenv('FMP_MAX_INFLIGHT', '8'))  # 同时在途请求上限
+FMP_RETRIES = int(os.getenv('FMP_RETRIES', '3'))
+FMP_BACKOFF = float(os.getenv('FMP_BACKOFF', '0.5'))  # 重试退避基数 (秒)
+QUOTE_BATCH_SIZE = int(os.getenv('QUOTE_BATCH_SIZE', '100'))  # 批量报价每次请求的代码数
+EARNINGS_TTL = int(os.getenv('EARNINGS_TTL', '21600'))  # 财报日历刷新周期 (秒)
+REGIME_SPY_TTL = int(os.getenv('REGIME_SPY_TTL', '1800'))  # SPY 趋势缓存 (秒)
+REGIME_VIX_TTL = int(os.getenv('REGIME_VIX_TTL', '300'))  # VIX 缓存 (秒)
+SCORE_WORKERS = int(os.getenv('SCORE_WORKERS', str(min(4, os.cpu_count() or 1))))  # 评分进程池大小，0 = 不用进程池
+SCORE_POOL_MIN = int(os.getenv('SCORE_POOL_MIN', '64'))  # 少于这么多只直接在本进程算
+SCORE_CHUNK = int(os.getenv('SCORE_CHUNK', '256'))  # 每个进程池任务的代码数
+CACHE_MAX_MB = int(os.getenv('CACHE_MAX_MB', '256'))  # 行情 / 基本面 / 板块缓存的总内存预算
+CACHE_TTL_DAILY = int(os.getenv('CACHE_TTL_DAILY', '86400'))  # 各命名空间 TTL (秒)，另外跨日自动失效
+CACHE_TTL_FUND = int(os.getenv('CACHE_TTL_FUND', '86400'))
+FUND_TTL_DAYS = int(os.getenv('FUND_TTL_DAYS', '30'))  # 基本面本地存储多少天后联网复查一次
+SECTOR_PROFILE_TTL_DAYS = int(os.getenv('SECTOR_PROFILE_TTL_DAYS', '30'))  # 代码 -> 板块ETF 映射的本地有效期
+INTRADAY_INTERVAL = int(os.getenv('INTRADAY_INTERVAL', '0'))  # 盘中增量监控轮询间隔 (秒)，0 = 关闭
+LIST_PAGE_SIZE = int(os.getenv('LIST_PAGE_SIZE', '40'))  # /list 每页行数
+LIST_EDIT_INTERVAL = float(os.getenv('LIST_EDIT_INTERVAL', '1.5'))  # /list 刷新消息的最短间隔 (秒)
+LIST_TIMEOUT = float(os.getenv('LIST_TIMEOUT', '60'))  # /list 最长等待，0 = 不限
+LIST_MAX_TICKERS = int(os.getenv('LIST_MAX_TICKERS', '0'))  # /list 最多扫描几只，0 = 不限
+SCAN_UNIVERSE = os.getenv('SCAN_UNIVERSE', 'sp500')  # /scan 默认范围: sp500 / nasdaq100 / dowjones / 代码文件路径
+SCAN_TOP = int(os.getenv('SCAN_TOP', '20'))  # /scan 显示前几名
+SCAN_TIME = os.getenv('SCAN_TIME', '')  # 定时全市场扫描 (纽约时间 HH:MM，例如 16:40)，空 = 关闭
+SCAN_MAX_SYMBOLS = int(os.getenv('SCAN_MAX_SYMBOLS', '3000'))  # 单次扫描代码数上限 (管理员上传文件同此上限)
+SCAN_FILE_MAX = int(os.getenv('SCAN_FILE_MAX', '500'))  # 普通用户上传代码文件的上限，0 = 只允许管理员上传
+BULK_MAX_DAYS = int(os.getenv('BULK_MAX_DAYS', '5'))  # 落后超过这么多个交易日的代码改走单只历史接口
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))  # >0 时在本机开 Prometheus 文本端点
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+SCORE_PARAMS_FILE = os.getenv('SCORE_PARAMS_FILE')  # 评分参数 JSON (optimize.py 的 best_params.json)，缺省用内置口径
+SNAPSHOT_INTERVAL = int(os.getenv('SNAPSHOT_INTERVAL', '900'))  # 缓存快照落盘周期 (秒)，有新数据才写，0 = 只在任务后和退出时写
+PREWARM_LEAD = int(os.getenv('PREWARM_LEAD', '900'))  # 盘前 / 收盘任务触发前多少秒开始预热，0 = 关闭
+PREWARM_FINAL = int(os.getenv('PREWARM_FINAL', '60'))  # 触发前最后这么多秒刷新大盘和板块涨幅 (时效短的数据)
+PREWARM_BATCH = int(os.getenv('PREWARM_BATCH', '20'))  # 预热每批代码数，各批均匀铺在预热窗口里
+DISCORD_SEND_CONCURRENCY = int(os.getenv('DISCORD_SEND_CONCURRENCY', '4'))  # 广播消息同时在途条数 (再往上由 Discord 的限速 bucket 排队)
+FMP_TIMEOUTS = {
+    "historical-price-eod/full": 10,
+    "earnings-calendar": 10,
+    "eod-bulk": 60,
+}
 
-BASE_PATH = "/data" if os.path.exists("/data") else "."
-DATA_FILE = os.path.join(BASE_PATH, "watchlist_v34.json")
+BASE_PATH = os.getenv('DATA_PATH') or ("/data" if os.path.exists("/data") else ".")
+DATA_FILE = os.path.join(BASE_PATH, "watchlist_v34.json")  # 旧版 JSON，首次启动自动迁移进 DB_FILE
+DB_FILE = os.path.join(BASE_PATH, "watchlist_v34.db")
+BAR_WINDOW = int(os.getenv('BAR_WINDOW', '300'))  # 指标需要的尾部K线数 (MA233 + 余量)
+SECTOR_MAP_FILE = os.path.join(BASE_PATH, "sector_map.json")
+FUND_DB_FILE = os.path.join(BASE_PATH, "fundamentals.db")
+SNAPSHOT_FILE = os.path.join(BASE_PATH, "cache_snapshot.pkl")
+TREE_HASH_FILE = os.path.join(BASE_PATH, "command_tree.sha256")
+BAR_COLD_DAYS = int(os.getenv('BAR_COLD_DAYS', '460'))  # 本地无数据时回补的自然日
 
 intents = discord.Intents.default()
 intents.message_content = True
 bot = commands.Bot(command_prefix='!', intents=intents)
 
-watch_data = {}
-api_cache_daily = {}
-api_cache_fund = {}
-api_cache_sector = {} 
+if int(importlib.metadata.version('pandas').split('.')[0]) < 3:
+    # 缓存命中直接返回共享视图，靠写时复制防止调用方改到缓存里的数据 (旧版 pandas 只能在这里就导入)
+    pd.set_option("mode.copy_on_write", True)
+
+watchlist = WatchlistStore(DB_FILE, DATA_FILE)
+fund_store = FundamentalsStore(FUND_DB_FILE, FUND_TTL_DAYS)
+bar_store = BarStore(os.path.join(BASE_PATH, "bars"))
+quote_table = {}  # 单次扫描的批量报价表: ticker -> {'date', 'quote'}
+bars_synced = {}  # ticker -> 已确认同步到的交易日 (没有新K线时 last_date 不会前进)
+stats = metrics.Stats()
+score_params = scoring.load_params(SCORE_PARAMS_FILE) if SCORE_PARAMS_FILE else scoring.DEFAULT_PARAMS
+metrics_runner = None
+api_cache = Cache(CACHE_MAX_MB * 1024 * 1024, stats)
+api_cache.namespace('daily', CACHE_TTL_DAILY)
+api_cache.namespace('fund', CACHE_TTL_FUND)
+api_cache.namespace('score', CACHE_TTL_DAILY)
+score_memo = {}  # ticker -> 当前缓存着的评分输入 key，输入一变就删旧条目
+inflight = SingleFlight(stats)  # (接口, 代码, 日期) -> 在途加载
+stats.gauges['cache_bytes'] = lambda: api_cache.nbytes
+stats.gauges['cache_entries'] = lambda: len(api_cache)
 
 # ================= 🗺️ 板块映射 =================
 SECTOR_MAP = {
@@ -54,46 +149,56 @@ SECTOR_MAP = {
     "LABU": "XBI", "XBI": "XBI",
     "MSTR": "IBIT", "COIN": "IBIT", "MARA": "IBIT", "IBIT": "IBIT"
 }
+# 未收录代码: 公司 profile 的 industry 优先，其次 sector
+PROFILE_INDUSTRY_ETF = {"Semiconductors": "SMH", "Biotechnology": "XBI"}
+PROFILE_SECTOR_ETF = {
+    "Technology": "XLK", "Communication Services": "XLC", "Consumer Cyclical": "XLY", "Consumer Defensive": "XLP",
+    "Financial Services": "XLF", "Healthcare": "XLV", "Energy": "XLE", "Industrials": "XLI",
+    "Basic Materials": "XLB", "Real Estate": "XLRE", "Utilities": "XLU",
+    # 指数成分接口用的 GICS 叫法
+    "Information Technology": "XLK", "Consumer Discretionary": "XLY", "Consumer Staples": "XLP",
+    "Financials": "XLF", "Health Care": "XLV", "Materials": "XLB",
+}
+SECTOR_ETFS = sorted(set(SECTOR_MAP.values()) | set(PROFILE_INDUSTRY_ETF.values()) | set(PROFILE_SECTOR_ETF.values()) | {"SPY"})
 
 # ================= 📖 因子字典 =================
-FACTOR_COMMENTS = {
-    "Trend_Bull": "趋势多头排列 (x1.5)",
-    "Trend_Bear": "趋势回调，仅限极轻仓 (x0.8)", 
-    "Trend_Chop": "趋势震荡整理 (x0.9)",
-    "VSA_Lock": "缩量新高，主力锁仓 (x1.3)",
-    "VSA_Pump": "放量上涨，资金抢筹 (x1.2)",
-    "VSA_Churn": "放量滞涨，出货迹象 (x0.5)",
-    "VSA_Exit": "放量+买盘枯竭，机构派发 (x0.3)",
-    "VSA_Dump": "放量下跌，恐慌抛售 (x0.5)",
-    "VSA_Strong": "K线强势，机构护盘 (x1.1)",
-    "Fund_Fake": "真雷伪成长 (x0.0)",
-    "Fund_Growth": "成长中亏损，可极轻仓 (x0.9)", 
-    "Fund_Super": "超级成长+高毛利 (x1.25)",
-    "Fund_Good": "持续盈利，商业模式验证 (x1.1)",
-    "Fund_Cash": "高自由现金流，现金奶牛 (x1.3)",
-    "Sector_Hot": "板块强势，趋势共振 (x1.2)",
-    "Sector_Cold": "板块弱势，拖累个股 (x0.9)",
-    "Sector_Alpha": "逆势抗跌，独立行情 (x1.1)",
-    "Vol_High": "高波动率，自动降杠杆 (x0.7)",
+# 乘数不写死在文案里: factor_comments() 按当前生效的 ScoreParams 拼上 (xN)
+FACTOR_TEXT = {
+    "Trend_Bull": "趋势多头排列",
+    "Trend_Bear": "趋势回调，仅限极轻仓",
+    "Trend_Chop": "趋势震荡整理",
+    "VSA_Lock": "缩量新高，主力锁仓",
+    "VSA_Pump": "放量上涨，资金抢筹",
+    "VSA_Pump_K": "放量上涨，资金抢筹 (K线)",
+    "VSA_Churn": "放量滞涨，出货迹象",
+    "VSA_Exit": "放量+买盘枯竭，机构派发",
+    "VSA_Dump": "放量下跌，恐慌抛售",
+    "VSA_Dump_K": "放量下跌，恐慌抛售 (K线)",
+    "VSA_Strong": "K线强势，机构护盘",
+    "Fund_Fake": "真雷伪成长",
+    "Fund_Growth": "成长中亏损，可极轻仓",
+    "Fund_Super": "超级成长+高毛利",
+    "Fund_Good": "持续盈利，商业模式验证",
+    "Fund_Cash": "高自由现金流，现金奶牛",
+    "Sector_Hot": "板块强势，趋势共振",
+    "Sector_Cold": "板块弱势，拖累个股",
+    "Sector_Alpha": "逆势抗跌，独立行情",
+    "Vol_High": "高波动率，自动降杠杆",
     "Regime_Bull": "系统性牛市",
     "Regime_Bear": "系统性熊市",
     "Regime_Panic": "VIX恐慌"
 }
 
-# ================= 数据层 (带详细日志) =================
-def load_data():
-    global watch_data
-    if os.path.exists(DATA_FILE):
-        try:
-            with open(DATA_FILE, 'r') as f: watch_data = json.load(f)
-        except: watch_data = {}
-    else: save_data()
+def factor_comments(params):
+    mults = {'Vol_High': params.vol_penalty}
+    for names, scores in ((scoring.TREND_NAMES, params.trend_scores), (scoring.VSA_NAMES, params.vsa_scores),
+                          (scoring.FUND_NAMES, params.fund_scores), (scoring.SECTOR_NAMES, params.sector_scores)):
+        mults.update((n, m) for n, m in zip(names, scores) if n)
+    return {k: f"{t} (x{mults[k]:g})" if k in mults else t for k, t in FACTOR_TEXT.items()}
 
-def save_data():
-    try:
-        with open(DATA_FILE, 'w') as f: json.dump(watch_data, f, indent=4)
-    except: pass
+FACTOR_COMMENTS = factor_comments(score_params)
 
+# ================= 数据层 (带详细日志) =================
 def get_finviz_chart_url(ticker):
     timestamp = int(datetime.datetime.now().timestamp())
     return f"https://finviz.com/chart.ashx?t={ticker}&ty=c&ta=1&p=d&s=l&_{timestamp}"
@@ -104,64 +209,365 @@ def log_api_call(url, data_preview, tag="API"):
     logger.info(f"🔍 [{tag}] URL: {masked_url}")
     logger.info(f"📦 [{tag}] DATA: {data_preview}")
 
-def get_market_regime_detailed():
-    if not FMP_API_KEY: return None, None, "API缺失"
-    spy_trend = "Neutral"; vix_level = 0
-    try:
-        vix_url = f"https://financialmodelingprep.com/stable/quote?symbol=^VIX&apikey={FMP_API_KEY}"
-        vix_resp = requests.get(vix_url, timeout=5).json()
-        if vix_resp: 
-            vix_level = vix_resp[0].get('price', 0)
-            log_api_call(vix_url, f"VIX Price: {vix_level}", "MARKET_VIX")
-
-        spy_url = f"https://financialmodelingprep.com/stable/historical-price-eod/full?symbol=SPY&apikey={FMP_API_KEY}"
-        spy_resp = requests.get(spy_url, timeout=5)
-        spy_data = pd.DataFrame(spy_resp.json()).iloc[:300].iloc[::-1]
-        
-        last_close = spy_data['close'].iloc[-1]
-        ma200 = spy_data['close'].rolling(200).mean().iloc[-1]
-        log_api_call(spy_url, f"SPY Close: {last_close} vs MA200: {ma200:.2f}", "MARKET_SPY")
-
-        if last_close > ma200:
-            spy_trend = "Bull"
-        else: spy_trend = "Bear"
-        return spy_trend, vix_level, "获取成功"
-    except Exception as e:
-        logger.error(f"[ERROR] Market Regime: {e}")
-        return "Neutral", 20, f"失败: {e}"
+# ================= 🌐 FMP 异步客户端 =================
+class FMPClient:
+    # 共享 keep-alive 连接池 + 并发上限 + 分接口超时 + 指数退避重试
+    def __init__(self, base_url, api_key, max_inflight=8, retries=3, timeouts=None, default_timeout=5):
+        self.base_url = base_url.rstrip('/')
+        self.api_key = api_key
+        self.max_inflight = max_inflight
+        self.retries = retries
+        self.timeouts = timeouts or {}
+        self.default_timeout = default_timeout
+        self._session = None
+        self._sem = None
 
-def get_sector_momentum(ticker):
-    etf = SECTOR_MAP.get(ticker, "SPY") 
-    today_str = datetime.datetime.now().strftime('%Y-%m-%d')
-    if etf in api_cache_sector and api_cache_sector[etf]['date'] == today_str:
-        return api_cache_sector[etf]['ret_20d'], etf
+    def url(self, endpoint, **params):
+        params['apikey'] = self.api_key
+        return f"{self.base_url}/stable/{endpoint}?{urlencode(params)}"
 
-    if not FMP_API_KEY: return 0, etf
-    try:
-        url = f"https://financialmodelingprep.com/stable/historical-price-eod/full?symbol={etf}&apikey={FMP_API_KEY}"
-        resp = requests.get(url, timeout=5).json()
-        df = pd.DataFrame(resp).iloc[:50]
-        if len(df) > 20:
-            curr = df['close'].iloc[0]
-            prev_20 = df['close'].iloc[20]
-            ret_20d = (curr - prev_20) / prev_20
-            log_api_call(url, f"ETF {etf}: Curr {curr}, Prev20 {prev_20}, Ret {ret_20d:.2%}", "SECTOR")
-            api_cache_sector[etf] = {'date': today_str, 'ret_20d': ret_20d}
-            return ret_20d, etf
-    except: pass
-    return 0, etf
-
-def get_fundamentals_deep(ticker):
+    async def _ensure_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_inflight, keepalive_timeout=60, ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._sem = asyncio.Semaphore(self.max_inflight)
+        return self._session
+
+    async def get(self, endpoint, **params):
+        return await self._request(endpoint, params, lambda resp: resp.json(content_type=None))
+
+    async def get_csv(self, endpoint, **params):
+        # bulk 接口返回 CSV: -> [{列名: 字符串}, ...]
+        text = await self._request(endpoint, params, lambda resp: resp.text())
+        # 全市场一天几万行，解析放到线程里
+        return await asyncio.to_thread(lambda: list(csv.DictReader(io.StringIO(text))))
+
+    async def _request(self, endpoint, params, read):
+        session = await self._ensure_session()
+        url = f"{self.base_url}/stable/{endpoint}"
+        params['apikey'] = self.api_key
+        timeout = aiohttp.ClientTimeout(total=self.timeouts.get(endpoint, self.default_timeout))
+        last_err = None
+        with stats.span(f"fmp.{endpoint}"):
+            for attempt in range(self.retries + 1):
+                try:
+                    async with self._sem:
+                        async with session.get(url, params=params, timeout=timeout) as resp:
+                            if resp.status == 429 or resp.status >= 500:
+                                raise aiohttp.ClientResponseError(resp.request_info, resp.history, status=resp.status, message=resp.reason)
+                            resp.raise_for_status()
+                            return await read(resp)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    last_err = e
+                    if isinstance(e, aiohttp.ClientResponseError) and e.status < 500 and e.status != 429: break
+                    if attempt < self.retries:
+                        stats.incr(f"fmp.{endpoint}.retry")
+                        await asyncio.sleep(FMP_BACKOFF * (2 ** attempt) * (1 + random.random() * 0.25))
+        stats.incr(f"fmp.{endpoint}.error")
+        raise last_err
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+fmp = FMPClient(FMP_BASE_URL, FMP_API_KEY, max_inflight=FMP_MAX_INFLIGHT, retries=FMP_RETRIES, timeouts=FMP_TIMEOUTS)
+
+# ================= 📅 财报日历 =================
+class EarningsCalendar:
+    # 全市场 stable/earnings-calendar (今天~明天)，每天下载一次并按 symbol 建索引
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.index = {}
+        self.day = None
+        self.fetched_at = 0
+        self._retry_at = 0
+        self._lock = asyncio.Lock()
+
+    def is_fresh(self):
+        return self.day == datetime.date.today() and time.time() - self.fetched_at < self.ttl
+
+    async def refresh(self, force=False):
+        if not FMP_API_KEY: return
+        async with self._lock:
+            if not force and (self.is_fresh() or time.time() < self._retry_at): return
+            # 设定范围：今天(T) ~ 明天(T+1) => 满足"当天+提前一天预警"
+            today_obj = datetime.date.today()
+            window = {'from': today_obj.strftime('%Y-%m-%d'), 'to': (today_obj + datetime.timedelta(days=1)).strftime('%Y-%m-%d')}
+            try:
+                cal_resp = await fmp.get("earnings-calendar", **window)
+                index = {}
+                if isinstance(cal_resp, list):
+                    for item in cal_resp:
+                        sym = item.get('symbol')
+                        if sym and sym not in index: index[sym] = item.get('date')
+                self.index = index; self.day = today_obj; self.fetched_at = time.time()
+                log_api_call(fmp.url("earnings-calendar", **window), f"{len(index)} symbols indexed ({window['from']} to {window['to']})", "EARNINGS_CAL")
+            except Exception as e:
+                # 失败后 60 秒内不再重试，避免整批 ticker 轮番重下
+                self._retry_at = time.time() + 60
+                logger.error(f"⚠️ [EARNINGS CAL ERROR] {e}")
+
+    async def lookup(self, symbol):
+        await self.refresh()
+        return self.get(symbol)
+
+    def get(self, symbol):
+        if self.day != datetime.date.today(): return None
+        return self.index.get(symbol)
+
+earnings_calendar = EarningsCalendar(EARNINGS_TTL)
+
+# ================= 🌡️ 大盘环境 =================
+class MarketRegime:
+    # SPY 趋势 / VIX 分别按 TTL 缓存，过期后台刷新，调用方立即拿到缓存值
+    def __init__(self, spy_ttl, vix_ttl):
+        self.spy_ttl = spy_ttl
+        self.vix_ttl = vix_ttl
+        self.spy_trend = "Neutral"; self.spy_at = 0
+        self.vix_level = 20; self.vix_at = 0
+        self.errors = {}
+        self._tasks = {}
+        self._loop_task = None
+
+    async def refresh_spy(self):
+        try:
+            from_str = (datetime.date.today() - datetime.timedelta(days=450)).strftime('%Y-%m-%d')
+            spy_json = await fmp.get("historical-price-eod/full", symbol="SPY", **{'from': from_str})
+            spy_data = pd.DataFrame(spy_json).iloc[:300].iloc[::-1]
+            
+            last_close = spy_data['close'].iloc[-1]
+            ma200 = spy_data['close'].rolling(200).mean().iloc[-1]
+            log_api_call(fmp.url("historical-price-eod/full", symbol="SPY"), f"SPY Close: {last_close} vs MA200: {ma200:.2f}", "MARKET_SPY")
+
+            self.spy_trend = "Bull" if last_close > ma200 else "Bear"
+            self.spy_at = time.time(); self.errors.pop('spy', None)
+        except Exception as e:
+            logger.error(f"[ERROR] Market Regime SPY: {e}")
+            self.errors['spy'] = str(e)
+
+    async def refresh_vix(self):
+        try:
+            vix_resp = await fmp.get("quote", symbol="^VIX")
+            if vix_resp: 
+                self.vix_level = vix_resp[0].get('price', 0)
+                log_api_call(fmp.url("quote", symbol="^VIX"), f"VIX Price: {self.vix_level}", "MARKET_VIX")
+            self.vix_at = time.time(); self.errors.pop('vix', None)
+        except Exception as e:
+            logger.error(f"[ERROR] Market Regime VIX: {e}")
+            self.errors['vix'] = str(e)
+
+    def _kick(self, name, refresh_fn):
+        # 同一数据源只保留一个在途刷新
+        task = self._tasks.get(name)
+        if task is None or task.done():
+            task = self._tasks[name] = asyncio.create_task(refresh_fn())
+        return task
+
+    def _stale(self):
+        now = time.time(); stale = {}
+        if now - self.spy_at > self.spy_ttl: stale['spy'] = self.refresh_spy
+        if now - self.vix_at > self.vix_ttl: stale['vix'] = self.refresh_vix
+        return stale
+
+    async def refresh(self):
+        await asyncio.gather(self._kick('spy', self.refresh_spy), self._kick('vix', self.refresh_vix))
+
+    async def get(self):
+        if not FMP_API_KEY: return None, None, "API缺失"
+        cold = []
+        for name, fn in self._stale().items():
+            task = self._kick(name, fn)
+            # 从未成功获取过的数据源必须等一次，其余直接返回缓存
+            if (self.spy_at if name == 'spy' else self.vix_at) == 0: cold.append(task)
+        if cold: await asyncio.gather(*cold)
+        return self.spy_trend, self.vix_level, self.status()
+
+    def status(self):
+        if self.errors: return f"失败: {'; '.join(self.errors.values())}"
+        return "获取成功"
+
+    def fetched_at(self):
+        # 取较旧的一侧，代表整体数据年龄
+        return min(self.spy_at, self.vix_at)
+
+    def age_text(self):
+        ts = self.fetched_at()
+        if not ts: return "未获取"
+        age = time.time() - ts
+        if age < 60: return "刚刚"
+        if age < 3600: return f"{int(age // 60)}分钟前"
+        return f"{int(age // 3600)}小时前"
+
+    async def _run(self):
+        while True:
+            stale = self._stale()
+            if stale: await asyncio.gather(*(self._kick(n, fn) for n, fn in stale.items()))
+            await asyncio.sleep(max(30, min(self.spy_ttl, self.vix_ttl) / 2))
+
+    def start(self):
+        if FMP_API_KEY and (self._loop_task is None or self._loop_task.done()):
+            self._loop_task = asyncio.create_task(self._run())
+
+market_regime = MarketRegime(REGIME_SPY_TTL, REGIME_VIX_TTL)
+
+async def get_market_regime_detailed():
+    with stats.span("stage.regime"):
+        return await market_regime.get()
+
+# ================= 🧭 板块服务 =================
+class SectorService:
+    # 所有板块 ETF 的 20 日涨幅一次并发刷新成表，评分时只查表；
+    # 没收录的代码用公司 profile 解析到板块 ETF，结果落盘 (SECTOR_MAP_FILE) 长期复用
+    def __init__(self, path, etfs):
+        self.path = path
+        self.etfs = etfs
+        self.returns = {}
+        self.day = None
+        self.profiles = None  # ticker -> [etf 或 None, 'YYYY-MM-DD']，首次使用才读盘
+        self._retry_at = 0
+        self._lock = asyncio.Lock()
+
+    def _load_profiles(self):
+        if self.profiles is None:
+            try:
+                with open(self.path, 'r') as f: self.profiles = json.load(f)
+            except (OSError, ValueError): self.profiles = {}
+        return self.profiles
+
+    def _save_profiles(self):
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, 'w') as f: json.dump(self.profiles, f)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.error(f"⚠️ [SECTOR MAP] save failed: {e}")
+
+    def etf_for(self, ticker):
+        if ticker in SECTOR_MAP: return SECTOR_MAP[ticker]
+        hit = self._load_profiles().get(ticker)
+        return (hit and hit[0]) or "SPY"
+
+    def _needs_profile(self, ticker):
+        if ticker in SECTOR_MAP: return False
+        hit = self._load_profiles().get(ticker)
+        if not hit: return True
+        try: return (datetime.date.today() - datetime.date.fromisoformat(hit[1])).days > SECTOR_PROFILE_TTL_DAYS
+        except (TypeError, ValueError): return True
+
+    async def _etf_return(self, etf):
+        # 只拉最近 45 个自然日，最新一行 vs 往前第 20 行
+        window = {'from': (datetime.date.today() - datetime.timedelta(days=45)).strftime('%Y-%m-%d')}
+        resp = await fmp.get("historical-price-eod/full", symbol=etf, **window)
+        rows = sorted((r for r in resp or [] if isinstance(r, dict) and r.get('close')), key=lambda r: r['date'], reverse=True)
+        if len(rows) <= 20: return None
+        curr, prev_20 = rows[0]['close'], rows[20]['close']
+        return (curr - prev_20) / prev_20
+
+    def is_fresh(self):
+        return self.day == datetime.date.today()
+
+    async def refresh(self, force=False):
+        if not FMP_API_KEY or (not force and self.is_fresh()): return
+        async with self._lock:
+            if not force and (self.is_fresh() or time.time() < self._retry_at): return
+            resps = await asyncio.gather(*(self._etf_return(e) for e in self.etfs), return_exceptions=True)
+            table = {e: r for e, r in zip(self.etfs, resps) if r is not None and not isinstance(r, Exception)}
+            if not table:
+                # 全部失败: 60 秒内不再重试，保留旧表
+                self._retry_at = time.time() + 60
+                logger.error(f"⚠️ [SECTOR] refresh failed for all {len(self.etfs)} ETFs")
+                return
+            self.returns.update(table); self.day = datetime.date.today()
+            log_api_call(fmp.url("historical-price-eod/full", symbol=f"<{len(self.etfs)} ETFs>"),
+                         ", ".join(f"{e} {r:+.2%}" for e, r in sorted(table.items())), "SECTOR")
+
+    async def _profile(self, ticker):
+        resp = await fmp.get("profile", symbol=ticker)
+        p = resp[0] if isinstance(resp, list) and resp else {}
+        return PROFILE_INDUSTRY_ETF.get(p.get('industry')) or PROFILE_SECTOR_ETF.get(p.get('sector'))
+
+    async def resolve(self, tickers):
+        todo = sorted({t for t in tickers if self._needs_profile(t)})
+        if not todo or not FMP_API_KEY: return
+        today_str = datetime.datetime.now().strftime('%Y-%m-%d')
+        resps = await asyncio.gather(*(inflight.do(('profile', t, today_str), self._profile, t) for t in todo), return_exceptions=True)
+        ok = 0
+        for t, etf in zip(todo, resps):
+            if isinstance(etf, Exception): continue  # 网络失败不落盘，下次再试
+            self.profiles[t] = [etf, today_str]; ok += 1
+        if ok: self._save_profiles()
+        logger.info(f"🧭 [SECTOR MAP] resolved {ok}/{len(todo)} tickers via profile")
+
+    def seed(self, entries):
+        # 指数成分接口自带板块: [(ticker, industry, sector), ...] 直接写进映射，省掉逐只 profile 请求
+        today_str = datetime.datetime.now().strftime('%Y-%m-%d')
+        n = 0
+        for t, industry, sector in entries:
+            etf = PROFILE_INDUSTRY_ETF.get(industry) or PROFILE_SECTOR_ETF.get(sector)
+            if etf and self._needs_profile(t):
+                self.profiles[t] = [etf, today_str]; n += 1
+        if n: self._save_profiles()
+
+    async def prepare(self, tickers):
+        # 扫描前调用: 表过期就刷新，新代码批量解析板块
+        await asyncio.gather(self.refresh(), self.resolve(tickers))
+
+    def get(self, ticker):
+        etf = self.etf_for(ticker)
+        return self.returns.get(etf, 0), etf
+
+sector_service = SectorService(SECTOR_MAP_FILE, SECTOR_ETFS)
+
+async def get_sector_momentum(ticker):
+    # 读预计算的板块表；只有表过期或代码未解析时才走网络
+    if not FMP_API_KEY: return 0, SECTOR_MAP.get(ticker, "SPY")
+    await sector_service.prepare([ticker])
+    return sector_service.get(ticker)
+
+def known_earnings_date(ticker):
+    # 财报日历 (今明两天) 或批量报价里的 earningsAnnouncement，取 'YYYY-MM-DD'
+    hit = quote_table.get(ticker)
+    d = earnings_calendar.get(ticker) or (hit and hit['quote'].get('earningsAnnouncement'))
+    return str(d)[:10] if d else None
+
+def _filing_date(inc_resp):
+    if not inc_resp: return None
+    return inc_resp[0].get('filingDate') or inc_resp[0].get('date')
+
+async def get_fundamentals_deep(ticker):
+    # 内存缓存 -> 本地基本面库 (未过期就不联网) -> 联网 (同 key 合并)
     if not FMP_API_KEY: return None
+    hit = api_cache.get('fund', ticker)
+    if hit is not None:
+        return hit
     today_str = datetime.datetime.now().strftime('%Y-%m-%d')
-    if ticker in api_cache_fund and api_cache_fund[ticker]['date'] == today_str:
-        return api_cache_fund[ticker]['data']
+    row = fund_store.get(ticker)
+    if row is not None:
+        earn = known_earnings_date(ticker)
+        if earn and earn <= today_str and (not row['earn_date'] or row['earn_date'] < earn):
+            fund_store.note_earnings(ticker, earn); row['earn_date'] = earn
+        if not fund_store.is_stale(row):
+            stats.hit("fund_store", True)
+            return api_cache.put('fund', ticker, row['data'])
+    stats.hit("fund_store", False)
+    return await inflight.do(('fund', ticker, today_str), _load_fundamentals, ticker, row)
 
+async def _load_fundamentals(ticker, row=None):
     try:
-        inc_url = f"https://financialmodelingprep.com/stable/income-statement?symbol={ticker}&limit=2&apikey={FMP_API_KEY}"
-        inc_resp = requests.get(inc_url, timeout=5).json()
-        ratio_url = f"https://financialmodelingprep.com/stable/ratios-ttm?symbol={ticker}&apikey={FMP_API_KEY}"
-        ratio_resp = requests.get(ratio_url, timeout=5).json()
+        today_str = datetime.datetime.now().strftime('%Y-%m-%d')
+        if row is not None:
+            # 复查: 先只拉 income-statement，filingDate 没变就沿用库里的指标
+            inc_resp = await fmp.get("income-statement", symbol=ticker, limit=2)
+            if _filing_date(inc_resp) == row['filing_date']:
+                fund_store.touch(ticker, today_str)
+                logger.info(f"🏦 [FUNDAMENTALS] {ticker} unchanged since filing {row['filing_date']}")
+                return api_cache.put('fund', ticker, row['data'])
+            ratio_resp = await fmp.get("ratios-ttm", symbol=ticker)
+        else:
+            inc_resp, ratio_resp = await asyncio.gather(
+                fmp.get("income-statement", symbol=ticker, limit=2),
+                fmp.get("ratios-ttm", symbol=ticker),
+            )
         
         data = {}
         if inc_resp and len(inc_resp) >= 2:
@@ -174,70 +580,177 @@ def get_fundamentals_deep(ticker):
             data['gross_margin'] = ratio_resp[0].get('grossProfitMarginTTM', 0.35)
             data['fcf_yield'] = ratio_resp[0].get('freeCashFlowYieldTTM', 0)
             
-        log_api_call(inc_url, f"Fund Data for {ticker}: {data}", "FUNDAMENTALS")
+        log_api_call(fmp.url("income-statement", symbol=ticker, limit=2), f"Fund Data for {ticker}: {data}", "FUNDAMENTALS")
         
-        api_cache_fund[ticker] = {'date': today_str, 'data': data}
+        fund_store.put(ticker, _filing_date(inc_resp), data, today_str, row and row['earn_date'])
+        api_cache.put('fund', ticker, data)
         return data
-    except: return None
+    except (aiohttp.ClientError, asyncio.TimeoutError, KeyError, IndexError, TypeError, ValueError, AttributeError) as e:
+        # 复查失败 (FMP 故障 / 响应格式不对) 继续用库里的旧指标，不让基本面因子掉成中性；下次调用再复查
+        stats.incr("fund.revalidate_failed" if row is not None else "fund.load_failed")
+        logger.error(f"⚠️ [FUNDAMENTALS] {ticker} {'revalidation' if row is not None else 'load'} failed: {e}")
+        return row['data'] if row is not None else None
+
+async def prefetch_quotes(tickers):
+    # 分块批量拉取报价，填充 quote_table，省掉 N-1 次往返
+    if not FMP_API_KEY: return
+    today_str = datetime.datetime.now().strftime('%Y-%m-%d')
+    syms = sorted({t for t in tickers if not api_cache.contains('daily', t)})
+    if not syms: return
+    for sym, q in (await fetch_batch_quotes(syms)).items():
+        quote_table[sym] = {'date': today_str, 'quote': q}
+
+async def fetch_batch_quotes(syms):
+    # 每 QUOTE_BATCH_SIZE 个代码一次请求，并发拉取: -> {symbol: quote}
+    chunks = [syms[i:i + QUOTE_BATCH_SIZE] for i in range(0, len(syms), QUOTE_BATCH_SIZE)]
+    resps = await asyncio.gather(*(fmp.get("batch-quote", symbols=",".join(c)) for c in chunks), return_exceptions=True)
+    out = {}
+    for chunk, resp in zip(chunks, resps):
+        if isinstance(resp, Exception) or not isinstance(resp, list):
+            logger.error(f"⚠️ [BATCH QUOTE] {len(chunk)} symbols failed: {resp}")
+            continue
+        for q in resp:
+            sym = q.get('symbol')
+            if sym: out[sym] = q
+    log_api_call(fmp.url("batch-quote", symbols=f"<{len(syms)} symbols>"), f"{len(out)}/{len(syms)} quotes in {len(chunks)} requests", "BATCH_QUOTE")
+    return out
+
+async def get_quote(ticker):
+    today_str = datetime.datetime.now().strftime('%Y-%m-%d')
+    hit = quote_table.get(ticker)
+    stats.hit("quote", bool(hit and hit['date'] == today_str))
+    if hit and hit['date'] == today_str:
+        return hit['quote']
+    quote_resp = await fmp.get("quote", symbol=ticker)
+    return quote_resp[0]
+
+def last_session(today):
+    # 今天之前最近的工作日 (不单独处理节假日: 假日后只是多一次空的增量请求)
+    d = today - datetime.timedelta(days=1)
+    while d.weekday() >= 5: d -= datetime.timedelta(days=1)
+    return d
+
+async def _fetch_history(ticker, from_obj):
+    window = {'from': from_obj.strftime('%Y-%m-%d')}
+    resp_json = await fmp.get("historical-price-eod/full", symbol=ticker, **window)
+    if isinstance(resp_json, list) and len(resp_json) > 0:
+        log_api_call(fmp.url("historical-price-eod/full", symbol=ticker, **window), f"{len(resp_json)} rows, Last Hist Row: {resp_json[0]}", "HISTORY_DATA")
+    return resp_json
+
+async def sync_bars(ticker):
+    # 本地K线库增量同步：只拉最后存储日期起的K线，返回尾部 BAR_WINDOW 根 (+今天未收盘的行)
+    today_obj = datetime.date.today()
+    last = bar_store.last_date(ticker)
+    target = last_session(today_obj)
+    fresh = last is not None and (last >= target or bars_synced.get(ticker) == target)
+    stats.hit("bars", fresh)
+    if fresh:
+        return bar_store.load(ticker, BAR_WINDOW)
+
+    # 从本地最后一根开始拉 (多重叠一根)，用来发现拆股 / 分红后被回溯调整的历史
+    from_obj = last if last else today_obj - datetime.timedelta(days=BAR_COLD_DAYS)
+    resp_json = await _fetch_history(ticker, from_obj)
+    if last is None and not (isinstance(resp_json, list) and resp_json): logger.warning(f"❌ {ticker} History Empty or Invalid")
+
+    fetched = from_records(resp_json if isinstance(resp_json, list) else [])
+    today_day = to_day(today_obj)
+    # 只落盘已收盘的K线，今天的行仅用于本次计算
+    if last is not None and not bar_store.overlap_matches(ticker, fetched):
+        first = bar_store.first_date(ticker)
+        logger.warning(f"🔁 [BARS] {ticker} history re-adjusted (split/dividend), rewriting from {first}")
+        stats.incr("bars.rewrite")
+        full = from_records(await _fetch_history(ticker, first))
+        closed = full[full['date'] < today_day]
+        if len(closed): bar_store.rewrite(ticker, closed)
+        fetched = full
+    else:
+        bar_store.append(ticker, fetched[fetched['date'] < today_day])
+    if isinstance(resp_json, list): bars_synced[ticker] = target  # 假日没有新K线也算已同步
+    bars = bar_store.load(ticker, BAR_WINDOW)
+    partial = fetched[fetched['date'] >= today_day]
+    return np.concatenate([bars, partial]) if len(partial) else bars
+
+def _bulk_rows(rows, wanted):
+    # eod-bulk CSV 行 -> {symbol: [行, ...]}，只留需要的代码，数值转 float
+    out = {}
+    for r in rows:
+        sym = r.get('symbol')
+        if sym not in wanted: continue
+        try: out.setdefault(sym, []).append({'date': r['date'], **{k: float(r.get(k) or 0) for k in ('open', 'high', 'low', 'close', 'volume')}})
+        except (KeyError, ValueError): continue
+    return out
 
-def get_daily_data_stable(ticker):
+async def bulk_sync_bars(symbols):
+    # 本地已有K线、只落后 BULK_MAX_DAYS 个交易日以内的代码: 按日期用 eod-bulk (一天一个请求，全市场) 补齐；
+    # 本地没有或落后更多的，之后照常由 sync_bars 走单只历史接口
+    if not FMP_API_KEY: return
+    target = last_session(datetime.date.today())
+    sessions = [target]
+    while len(sessions) < BULK_MAX_DAYS: sessions.insert(0, last_session(sessions[0]))
+    floor = last_session(sessions[0])
+    behind = {}
+    for t in symbols:
+        last = bar_store.last_date(t)
+        if last is not None and floor <= last < target and bars_synced.get(t) != target: behind[t] = last
+    if not behind: return
+    # 连本地最后一根那天一起拉: 重叠那根对不上 (拆股 / 分红调整) 的代码不追加，交给 sync_bars 整份重写
+    days = [d for d in [floor] + sessions if d >= min(behind.values())]
+    resps = await asyncio.gather(*(fmp.get_csv("eod-bulk", date=d.isoformat()) for d in days), return_exceptions=True)
+    per_sym = {}; reached = None
+    for d, rows in zip(days, resps):
+        # 某天失败就停在前一天: 只追加更新的日期，跳过一天会在K线里留洞
+        if isinstance(rows, Exception):
+            logger.error(f"⚠️ [EOD BULK] {d} failed: {rows}")
+            break
+        for t, rs in _bulk_rows(rows, behind).items(): per_sym.setdefault(t, []).extend(rs)
+        # 空文件 = 假日或当天还没发布，不算同步到这一天
+        if rows: reached = d
+    written = 0; adjusted = set()
+    for t in behind:
+        bars = from_records(per_sym.get(t))
+        if not bar_store.overlap_matches(t, bars):
+            adjusted.add(t); continue
+        written += bar_store.append(t, bars)
+    if reached == target:
+        for t in behind.keys() - adjusted: bars_synced[t] = target
+    if adjusted: stats.incr("bars.adjusted", len(adjusted))
+    log_api_call(fmp.url("eod-bulk", date=f"<{len(days)} days>"), f"{written} bars for {len(per_sym)}/{len(behind)} symbols, synced to {reached}, {len(adjusted)} re-adjusted", "EOD_BULK")
+
+async def get_daily_data_stable(ticker):
     if not FMP_API_KEY: return None, None
     today_str = datetime.datetime.now().strftime('%Y-%m-%d')
-    if ticker in api_cache_daily and api_cache_daily[ticker]['date'] == today_str:
-        return api_cache_daily[ticker]['df'].copy(), api_cache_daily[ticker]['quote']
+    hit = api_cache.get('daily', ticker)
+    if hit is None:
+        # 同一代码同时未命中时只下载一次，其余调用方等同一个结果
+        df, quote = await inflight.do(('daily', ticker, today_str), _load_daily_data, ticker, today_str)
+        if df is None: return None, None
+        hit = {'df': df, 'quote': quote}
+    # 浅拷贝共享数据缓冲区 (写时复制)，不再整份复制历史
+    return hit['df'].copy(deep=False), hit['quote']
 
+async def _load_daily_data(ticker, today_str):
     try:
-        hist_url = f"https://financialmodelingprep.com/stable/historical-price-eod/full?symbol={ticker}&apikey={FMP_API_KEY}"
-        resp_json = requests.get(hist_url, timeout=10).json()
-        
-        if isinstance(resp_json, list) and len(resp_json) > 0:
-            log_api_call(hist_url, f"Last Hist Row: {resp_json[0]}", "HISTORY_DATA")
-        else:
-            logger.warning(f"❌ {ticker} History Empty or Invalid")
+        bars, curr_quote = await asyncio.gather(sync_bars(ticker), get_quote(ticker))
+        if len(bars) == 0: raise ValueError("no bars")
 
-        df = pd.DataFrame(resp_json)
-        df = df[['date', 'open', 'high', 'low', 'close', 'volume']]
-        df['date'] = pd.to_datetime(df['date']); df.sort_values(by='date', ascending=True, inplace=True)
+        df = pd.DataFrame({
+            'date': pd.to_datetime(bars['date'], unit='D'), 'open': bars['open'], 'high': bars['high'],
+            'low': bars['low'], 'close': bars['close'], 'volume': bars['volume'],
+        })
         
-        quote_url = f"https://financialmodelingprep.com/stable/quote?symbol={ticker}&apikey={FMP_API_KEY}"
-        curr_quote = requests.get(quote_url, timeout=5).json()[0]
+        quote_url = fmp.url("quote", symbol=ticker)
         
         # 🔥 V34.98 修正：使用 stable/earnings-calendar 且只查 今天~明天
         earn_date = curr_quote.get('earningsAnnouncement')
         
         if not earn_date:
-            try:
-                # 设定范围：今天(T) ~ 明天(T+1) => 满足"当天+提前一天预警"
-                today_obj = datetime.date.today()
-                next_obj = today_obj + datetime.timedelta(days=1)
-                
-                from_str = today_obj.strftime('%Y-%m-%d')
-                to_str = next_obj.strftime('%Y-%m-%d')
-
-                # 使用 stable/earnings-calendar (最准确的日历接口)
-                cal_url = f"https://financialmodelingprep.com/stable/earnings-calendar?from={from_str}&to={to_str}&apikey={FMP_API_KEY}"
-                
-                log_api_call(cal_url, f"Searching Stable Calendar for {ticker} ({from_str} to {to_str})", "FALLBACK_STABLE")
-                
-                cal_resp = requests.get(cal_url, timeout=5).json()
-                
-                # 在全市场数据中匹配 symbol
-                found_date = None
-                if isinstance(cal_resp, list):
-                    for item in cal_resp:
-                        if item.get('symbol') == ticker:
-                            found_date = item.get('date')
-                            break 
-                
-                if found_date:
-                    curr_quote['earningsAnnouncement'] = found_date
-                    earn_date = found_date
-                    logger.info(f"✅ [FALLBACK HIT] Found {ticker} in stable calendar: {earn_date}")
-                else:
-                    logger.warning(f"⚠️ [FALLBACK MISS] {ticker} not found in Today/Tomorrow calendar")
-
-            except Exception as e:
-                logger.error(f"⚠️ [FALLBACK ERROR] {e}")
+            found_date = await earnings_calendar.lookup(ticker)
+            if found_date:
+                curr_quote['earningsAnnouncement'] = found_date
+                earn_date = found_date
+                logger.info(f"✅ [FALLBACK HIT] Found {ticker} in stable calendar: {earn_date}")
+            else:
+                logger.warning(f"⚠️ [FALLBACK MISS] {ticker} not found in Today/Tomorrow calendar")
 
         log_api_call(quote_url, f"Live Quote: P={curr_quote.get('price')}, Earn={earn_date}", "QUOTE_DATA")
 
@@ -258,7 +771,7 @@ def get_daily_data_stable(ticker):
         df.columns = [str(c).upper() for c in df.columns]
         df = df.ffill().fillna(0)
         
-        api_cache_daily[ticker] = {'date': today_str, 'df': df, 'quote': curr_quote}
+        api_cache.put('daily', ticker, {'df': df, 'quote': curr_quote})
         return df, curr_quote
     except Exception as e:
         logger.error(f"❌ Error getting daily data for {ticker}: {e}")
@@ -266,177 +779,199 @@ def get_daily_data_stable(ticker):
 
 # ================= 🧠 V34.98 引擎 =================
 
-def calculate_v34_score(df, quote_data, fundamentals, spy_trend, vix_level, ticker):
-    curr = df.iloc[-1]; prev = df.iloc[-2]; price = curr['CLOSE']
-    
-    base_score = 3.0; regime_msg = ""
-    if spy_trend == "Bull": base_score = 3.5; regime_msg = "牛市"
-    elif spy_trend == "Bear": base_score = 2.5; regime_msg = "熊市"
-    if vix_level > 25: base_score -= 0.5; regime_msg = f"恐慌 (VIX:{vix_level:.1f})"
-    if vix_level > 35: base_score = 1.5; regime_msg = f"崩盘 (VIX:{vix_level:.1f})"
-    base_score = max(1.5, base_score)
+TREND_MSGS = {scoring.TREND_BULL: 'Trend_Bull', scoring.TREND_BEAR: 'Trend_Bear', scoring.TREND_CHOP: 'Trend_Chop'}
+VSA_MSGS = {code: name for code, name in enumerate(scoring.VSA_NAMES) if name}
+FUND_MSGS = {scoring.FUND_FAKE: 'Fund_Fake', scoring.FUND_GROWTH: 'Fund_Growth', scoring.FUND_SUPER: 'Fund_Super', scoring.FUND_CASH: 'Fund_Cash', scoring.FUND_GOOD: 'Fund_Good'}
+STOP_MSGS = {scoring.STOP_CHANDELIER: "(吊灯止盈)", scoring.STOP_STRUCTURE: "(结构前低)", scoring.STOP_FALLBACK: "(默认兜底)"}
 
+def earnings_soon(earn_date_str):
+    # 🚨 财报雷达 (V34.98): 仅预警今天和明天 (-1<=diff<=1)
+    # diff=0 是今天，diff=1 是明天，diff=-1 是今天刚过几个小时(时区)
+    if not earn_date_str: return False
+    # dateutil.parser 导入要十几毫秒，第一次用到时才加载
+    from dateutil import parser
     try:
-        df['HMA_55'] = df.ta.hma(length=55); df['HMA_144'] = df.ta.hma(length=144)
-        hma55 = df['HMA_55'].iloc[-1]; hma144 = df['HMA_144'].iloc[-1]
-    except: hma55=0; hma144=0
-    
-    trend_score = 1.0; trend_msg = ""
-    if hma55 > hma144 and price > hma55: 
-        trend_score = 1.5; trend_msg = f"{FACTOR_COMMENTS['Trend_Bull']}"
-    elif price < hma144: 
-        trend_score = 0.8; trend_msg = f"{FACTOR_COMMENTS['Trend_Bear']}"
-    else: 
-        trend_score = 0.9; trend_msg = f"{FACTOR_COMMENTS['Trend_Chop']}"
-
-    vol_ma20 = df['VOLUME'].rolling(20).mean().iloc[-1]
-    rvol = curr['VOLUME'] / vol_ma20 if vol_ma20 > 0 else 1.0
-    price_change = (curr['CLOSE'] - prev['CLOSE']) / prev['CLOSE']
-    up_vol = quote_data.get('upVolume') if quote_data else None
-    down_vol = quote_data.get('downVolume') if quote_data else None
-    
-    vsa_score = 1.0; vsa_msg = ""
-    if up_vol is not None and down_vol is not None:
-        uv_ratio = up_vol / (up_vol + down_vol) if (up_vol+down_vol) > 0 else 0.5
-        if rvol > 1.5:
-            if uv_ratio < 0.35 and abs(price_change) < 0.02: vsa_score = 0.3; vsa_msg = f"{FACTOR_COMMENTS['VSA_Exit']}"
-            elif abs(price_change) < 0.005: vsa_score = 0.5; vsa_msg = f"{FACTOR_COMMENTS['VSA_Churn']}"
-            elif price_change > 0.03: vsa_score = 1.2; vsa_msg = f"{FACTOR_COMMENTS['VSA_Pump']}"
-            elif price_change < -0.02: vsa_score = 0.5; vsa_msg = f"{FACTOR_COMMENTS['VSA_Dump']}"
-        elif rvol < 0.7 and price > df['HIGH'].iloc[-21:-1].max(): vsa_score = 1.3; vsa_msg = f"{FACTOR_COMMENTS['VSA_Lock']}"
-    else:
-        range_len = curr['HIGH'] - curr['LOW']
-        clv = (curr['CLOSE'] - curr['LOW']) / range_len if range_len > 0 else 0.5
-        if rvol > 1.5 and price_change > 0.02 and clv > 0.7: vsa_score = 1.2; vsa_msg = f"{FACTOR_COMMENTS['VSA_Pump']} (K线)"
-        elif rvol > 1.5 and clv < 0.3: vsa_score = 0.5; vsa_msg = f"{FACTOR_COMMENTS['VSA_Dump']} (K线)"
-        elif rvol > 1.0 and price_change > 0 and clv > 0.8: vsa_score = 1.1; vsa_msg = f"{FACTOR_COMMENTS['VSA_Strong']}"
-
-    fund_score = 1.0; fund_msg = ""
-    if fundamentals:
-        eps = fundamentals.get('eps', 0)
-        rev_growth = fundamentals.get('rev_growth', 0)
-        gross_margin = fundamentals.get('gross_margin', 0)
-        fcf_yield = fundamentals.get('fcf_yield', 0)
-        
-        if eps < 0:
-            if rev_growth < 0.15 and gross_margin < 0.30: 
-                fund_score = 0.0; fund_msg = f"{FACTOR_COMMENTS['Fund_Fake']}"
-            else:
-                fund_score = 0.9; fund_msg = f"{FACTOR_COMMENTS['Fund_Growth']}"
-        elif rev_growth > 0.50 and gross_margin > 0.50:
-            fund_score = 1.25; fund_msg = f"{FACTOR_COMMENTS['Fund_Super']}"
-        elif fcf_yield > 0.05: 
-            fund_score = 1.3; fund_msg = f"{FACTOR_COMMENTS['Fund_Cash']}"
-        else: 
-            fund_score = 1.1; fund_msg = f"{FACTOR_COMMENTS['Fund_Good']}"
-
-    sector_ret, etf_name = get_sector_momentum(ticker)
-    sector_score = 1.0; sector_msg = ""
-    if sector_ret > 0.05: 
-        sector_score = 1.2; sector_msg = f"{FACTOR_COMMENTS['Sector_Hot']} ({etf_name}: +{sector_ret*100:.1f}%)"
-    elif sector_ret < -0.02: 
-        if trend_score >= 1.3:
-            sector_score = 1.1; sector_msg = f"{FACTOR_COMMENTS['Sector_Alpha']} ({etf_name}: {sector_ret*100:.1f}%)"
-        else:
-            sector_score = 0.9; sector_msg = f"{FACTOR_COMMENTS['Sector_Cold']} ({etf_name}: {sector_ret*100:.1f}%)"
-
-    atr = df.ta.atr(length=14).iloc[-1]
-    atr_pct = atr / price if price > 0 else 0
-    vol_score = 1.0; vol_msg = ""
-    if atr_pct > 0.06: vol_score = 0.7; vol_msg = f"{FACTOR_COMMENTS['Vol_High']}"
-
-    final_score = base_score * trend_score * vsa_score * fund_score * vol_score * sector_score
-    logger.info(f"🧮 [SCORE CALC] {ticker}: Base{base_score}*Trend{trend_score}*VSA{vsa_score}*Fund{fund_score}*Sect{sector_score} = {final_score:.2f}")
-    
-    special_signals = []
-    
-    # 🚨 财报雷达 (V34.98)
-    earn_msg = ""
-    try:
-        earn_date_str = quote_data.get('earningsAnnouncement')
-        if earn_date_str:
-            earn_dt = parser.parse(earn_date_str).replace(tzinfo=None)
-            now_dt = datetime.datetime.now().replace(tzinfo=None) 
-            days_diff = (earn_dt - now_dt).days
-            
-            # 仅预警今天和明天 (-1<=diff<=1)
-            # diff=0 是今天，diff=1 是明天，diff=-1 是今天刚过几个小时(时区)
-            if -1 <= days_diff <= 1:
-                special_signals.append(f"🧨 **财报高危**: {earn_date_str}")
-                final_score *= 0.8
-                earn_msg = f"财报预警(x0.8)"
+        earn_dt = parser.parse(earn_date_str).replace(tzinfo=None)
+        now_dt = datetime.datetime.now().replace(tzinfo=None) 
+        return -1 <= (earn_dt - now_dt).days <= 1
     except Exception as e:
         logger.error(f"Earnings Check Error: {e}")
+        return False
 
-    try:
-        df.ta.rsi(length=14, append=True)
-        rsi = df['RSI_14'].iloc[-1]
-        daily_range = curr['HIGH'] - curr['LOW']
-        close_pos = (curr['CLOSE'] - curr['LOW']) / daily_range if daily_range > 0 else 0
-        if rsi < 30 and price_change > 0.05 and rvol > 2.0 and close_pos > 0.7:
-            final_score = 9.5; special_signals.append(f"🧊 **冰点反转确认**")
-    except: pass
+def _num(v):
+    # None / 'N/A' 之类统一为 NaN
+    try: return float(v)
+    except (TypeError, ValueError): return float('nan')
+
+def score_inputs(quote_data, fundamentals, sector_ret, earn, spy_trend, vix_level):
+    quote_data = quote_data or {}
+    fund = fundamentals or {}
+    return {
+        'up_vol': _num(quote_data.get('upVolume')), 'down_vol': _num(quote_data.get('downVolume')),
+        'has_fund': bool(fundamentals),
+        'eps': _num(fund.get('eps', 0) or 0), 'rev_growth': _num(fund.get('rev_growth', 0) or 0),
+        'gross_margin': _num(fund.get('gross_margin', 0) or 0), 'fcf_yield': _num(fund.get('fcf_yield', 0) or 0),
+        'sector_ret': sector_ret, 'earn': earn,
+        'spy': scoring.SPY_CODES.get(spy_trend, scoring.SPY_NEUTRAL), 'vix': vix_level or 0,
+    }
+
+def describe_score(r, ticker, spy_trend, vix_level, etf_name, sector_ret, earn_date_str):
+    # 评分记录 -> 原有的 12 元组 (分数 / 信号 / 止损 / 各因子说明)
+    regime_msg = ""
+    if spy_trend == "Bull": regime_msg = "牛市"
+    elif spy_trend == "Bear": regime_msg = "熊市"
+    # 阈值与评分同源 (score_params)，文案和实际的 VIX 扣分一致
+    if vix_level and vix_level > score_params.vix_high: regime_msg = f"恐慌 (VIX:{vix_level:.1f})"
+    if vix_level and vix_level > score_params.vix_panic: regime_msg = f"崩盘 (VIX:{vix_level:.1f})"
+
+    base_score = float(r['base']); trend_score = float(r['trend']); vsa_score = float(r['vsa'])
+    fund_score = float(r['fund']); sector_score = float(r['sector']); vol_score = float(r['vol'])
+    final_score = float(r['score'])
+
+    trend_msg = FACTOR_COMMENTS[TREND_MSGS[int(r['trend_code'])]]
+    vsa_msg = FACTOR_COMMENTS[VSA_MSGS[int(r['vsa_code'])]] if int(r['vsa_code']) in VSA_MSGS else ""
+    fund_msg = FACTOR_COMMENTS[FUND_MSGS[int(r['fund_code'])]] if int(r['fund_code']) in FUND_MSGS else ""
+    sector_msg = ""
+    if r['sector_code'] == scoring.SECTOR_HOT: sector_msg = f"{FACTOR_COMMENTS['Sector_Hot']} ({etf_name}: +{sector_ret*100:.1f}%)"
+    elif r['sector_code'] == scoring.SECTOR_ALPHA: sector_msg = f"{FACTOR_COMMENTS['Sector_Alpha']} ({etf_name}: {sector_ret*100:.1f}%)"
+    elif r['sector_code'] == scoring.SECTOR_COLD: sector_msg = f"{FACTOR_COMMENTS['Sector_Cold']} ({etf_name}: {sector_ret*100:.1f}%)"
+    vol_msg = FACTOR_COMMENTS['Vol_High'] if r['vol_high'] else ""
+
+    logger.info(f"🧮 [SCORE CALC] {ticker}: Base{base_score}*Trend{trend_score}*VSA{vsa_score}*Fund{fund_score}*Sect{sector_score} = {base_score * trend_score * vsa_score * fund_score * vol_score * sector_score:.2f}")
+
+    special_signals = []
+    if r['earn']: special_signals.append(f"🧨 **财报高危**: {earn_date_str}")
+    if r['ice']: special_signals.append(f"🧊 **冰点反转确认**")
+    if r['zone']: special_signals.append(f"☢️ **机构建仓区启动**")
 
-    try:
-        ma144 = df['CLOSE'].rolling(144).mean().iloc[-1]
-        ma233 = df['CLOSE'].rolling(233).mean().iloc[-1]
-        vol_ma50 = df['VOLUME'].rolling(50).mean().iloc[-1]
-        rvol_50 = curr['VOLUME'] / vol_ma50 if vol_ma50 > 0 else 1.0
-        in_zone = (price < ma144 * 1.02 and price > ma233 * 0.98) or (abs(price - ma144)/price < 0.02)
-        if in_zone and rvol_50 < 0.6 and ma144 > df['CLOSE'].rolling(144).mean().iloc[-10]:
-            final_score = max(final_score, 9.9); special_signals.append(f"☢️ **机构建仓区启动**")
-    except: pass
-    
-    stop_msg = ""
-    try:
-        if final_score >= 6.0:
-            stop_multiplier = 2.5 if final_score >= 8.5 else 3.0
-            highest_22 = df['HIGH'].rolling(22).max().iloc[-1]
-            chandelier_stop = highest_22 - stop_multiplier * atr
-            chandelier_stop = min(chandelier_stop, price * 0.98) 
-            stop_msg = "(吊灯止盈)"
-        else:
-            lowest_21 = df['LOW'].rolling(21).min().iloc[-1]
-            chandelier_stop = lowest_21 - 0.5 * atr 
-            max_loss_price = price * 0.90
-            chandelier_stop = max(chandelier_stop, max_loss_price)
-            stop_msg = "(结构前低)"
-
-    except: 
-        chandelier_stop = price * 0.90
-        stop_msg = "(默认兜底)"
-    
     debug_formula = f"{base_score}*{trend_score:.1f}*{vsa_score:.1f}*{fund_score:.1f}*{sector_score:.1f}"
     if vol_score != 1.0: debug_formula += f"*{vol_score:.1f}"
-    if earn_msg: debug_formula += f"*{0.8}(财报)"
-    
-    return final_score, special_signals, chandelier_stop, atr_pct, trend_msg, vsa_msg, fund_msg, sector_msg, regime_msg, vol_msg, debug_formula, stop_msg
+    if r['earn']: debug_formula += f"*{score_params.earn_penalty}(财报)"
+
+    return final_score, special_signals, float(r['stop']), float(r['atr_pct']), trend_msg, vsa_msg, fund_msg, sector_msg, regime_msg, vol_msg, debug_formula, STOP_MSGS[int(r['stop_code'])]
+
+def _pack_frames(items, spy_trend, vix_level):
+    # items: [(ticker, df, quote, fund, sector), ...] -> 对齐的 (symbols × bars) 数组 + 每只的标量输入
+    window = max(len(df) for _, df, _, _, _ in items)
+    cols = [scoring.align([df[c].to_numpy() for _, df, _, _, _ in items], window) for c in ('HIGH', 'LOW', 'CLOSE', 'VOLUME')]
+    metas = []; per_symbol = []
+    for t, df, quote, fund, sector in items:
+        sector_ret, etf_name = sector if sector else (0, SECTOR_MAP.get(t, "SPY"))
+        earn_date_str = (quote or {}).get('earningsAnnouncement') or earnings_calendar.get(t)
+        earn = earnings_soon(earn_date_str)
+        metas.append((t, etf_name, sector_ret, earn_date_str))
+        per_symbol.append(score_inputs(quote, fund, sector_ret, earn, spy_trend, vix_level))
+    inputs = {k: np.array([p[k] for p in per_symbol]) for k in per_symbol[0]}
+    return cols, inputs, metas
+
+def _describe_all(records, metas, spy_trend, vix_level):
+    with stats.span("stage.describe"):
+        return [describe_score(r, t, spy_trend, vix_level, etf_name, sector_ret, earn_date_str)
+                for r, (t, etf_name, sector_ret, earn_date_str) in zip(records, metas)]
+
+def _score_local(cols, inputs):
+    records, t_ind, t_score = scoring.score_batch_timed(*cols, params=score_params, **inputs)
+    stats.observe("stage.indicators", t_ind); stats.observe("stage.score", t_score)
+    return records
+
+def score_key(t, df, quote, fund, sector, spy_trend, vix_level):
+    # 评分的全部输入: 最后一根K线 (盘中是报价合成的今天行)、盘口量、基本面、板块、财报窗口、大盘。
+    # K线只追加，最后一行和长度相同即整段历史相同
+    q = quote or {}
+    earn_date_str = q.get('earningsAnnouncement') or earnings_calendar.get(t)
+    last = tuple(float(df[c].iat[-1]) for c in ('OPEN', 'HIGH', 'LOW', 'CLOSE', 'VOLUME'))
+    return (df.index[-1], len(df), last, q.get('upVolume'), q.get('downVolume'), tuple(sorted((fund or {}).items())),
+            tuple(sector) if sector else None, earn_date_str, earnings_soon(earn_date_str), spy_trend, vix_level)
+
+def _memo_lookup(items, spy_trend, vix_level):
+    # -> (结果列表，未命中处为 None; 每只的 key; 未命中的下标)
+    with stats.span("stage.memo"):
+        keys = [score_key(*item, spy_trend, vix_level) for item in items]
+        out = [api_cache.get('score', (item[0], k)) for item, k in zip(items, keys)]
+    return out, keys, [i for i, r in enumerate(out) if r is None]
+
+def _memo_store(items, keys, todo, out, results):
+    for i, res in zip(todo, results):
+        t = items[i][0]; old = score_memo.get(t)
+        if old is not None and old != keys[i]: api_cache.discard('score', (t, old))
+        score_memo[t] = keys[i]
+        out[i] = api_cache.put('score', (t, keys[i]), res)
+    return out
+
+def score_frames(items, spy_trend, vix_level):
+    # 同步版本: 直接在当前进程一次算完 (/check 这类小任务)；输入没变的直接取上次结果
+    if not items: return []
+    out, keys, todo = _memo_lookup(items, spy_trend, vix_level)
+    if not todo: return out
+    sub = [items[i] for i in todo]
+    with stats.span("stage.pack"):
+        cols, inputs, metas = _pack_frames(sub, spy_trend, vix_level)
+    return _memo_store(items, keys, todo, out, _describe_all(_score_local(cols, inputs), metas, spy_trend, vix_level))
+
+# ================= ⚙️ 评分进程池 =================
+score_pool = None
+
+def get_score_pool():
+    global score_pool
+    if score_pool is None and SCORE_WORKERS > 0:
+        # forkserver/spawn: 不在带着事件循环和网络线程的进程上直接 fork
+        methods = multiprocessing.get_all_start_methods()
+        ctx = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+        score_pool = ProcessPoolExecutor(max_workers=SCORE_WORKERS, mp_context=ctx)
+    return score_pool
+
+async def warm_score_pool():
+    # 子进程按需启动，第一次评分要等进程起来 + 导入 scipy: 提前每个进程跑一次导入
+    pool = get_score_pool()
+    if pool is None: return
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(*(loop.run_in_executor(pool, indicators.preload) for _ in range(SCORE_WORKERS)))
+
+async def score_frames_async(items, spy_trend, vix_level):
+    # 输入没变的直接取上次结果；其余按 SCORE_CHUNK 切块丢进进程池，事件循环只做打包和文案
+    if not items: return []
+    out, keys, todo = _memo_lookup(items, spy_trend, vix_level)
+    if not todo: return out
+    records = await _score_records_async([items[i] for i in todo], spy_trend, vix_level)
+    return _memo_store(items, keys, todo, out, records)
+
+async def _score_records_async(items, spy_trend, vix_level):
+    with stats.span("stage.pack"):
+        cols, inputs, metas = _pack_frames(items, spy_trend, vix_level)
+    pool = get_score_pool() if len(items) >= SCORE_POOL_MIN else None
+    if pool is None:
+        return _describe_all(_score_local(cols, inputs), metas, spy_trend, vix_level)
+
+    loop = asyncio.get_running_loop()
+    n = len(items); jobs = []
+    for i in range(0, n, SCORE_CHUNK):
+        sl = slice(i, i + SCORE_CHUNK)
+        # 只发紧凑的 numpy 数组，不发 DataFrame
+        part = {k: v[sl] for k, v in inputs.items()}
+        jobs.append(loop.run_in_executor(pool, functools.partial(scoring.score_batch_timed, *(c[sl] for c in cols), params=score_params, **part)))
+    try:
+        with stats.span("stage.pool_wait"):
+            done = await asyncio.gather(*jobs)
+        for _, t_ind, t_score in done:
+            stats.observe("stage.indicators", t_ind); stats.observe("stage.score", t_score)
+        records = np.concatenate([r for r, _, _ in done])
+    except BrokenProcessPool as e:
+        global score_pool
+        logger.error(f"⚠️ [SCORE POOL] broken, falling back to in-process: {e}")
+        stats.incr("score_pool.broken")
+        score_pool = None
+        records = _score_local(cols, inputs)
+    return _describe_all(records, metas, spy_trend, vix_level)
+
+def calculate_v34_score(df, quote_data, fundamentals, spy_trend, vix_level, ticker, sector=None):
+    return score_frames([(ticker, df, quote_data, fundamentals, sector)], spy_trend, vix_level)[0]
 
 def calculate_position_size(atr_pct, final_score, price, stop_price, specials):
     is_special = len(specials) > 0
-    if final_score < 4.0 and not is_special:
+    if final_score < score_params.flat_score and not is_special:
         return "0%"
-
-    stop_distance_pct = (price - stop_price) / price
-    if stop_distance_pct <= 0: return "0% (数据异常)"
-
-    if final_score >= 9.0:
-        risk_per_trade = 0.020 
-    elif final_score >= 7.5:
-        risk_per_trade = 0.015 
-    elif final_score >= 6.0:
-        risk_per_trade = 0.010 
-    else:
-        risk_per_trade = 0.005 
-        
-    position_size = risk_per_trade / stop_distance_pct
-    pos_pct = position_size * 100
-    
-    if final_score >= 9.0: 
-        pos_pct = max(pos_pct, 5.0) 
-        
-    pos_pct = min(pos_pct, 40)
-    
+    pos_pct = float(scoring.position_size(final_score, price, stop_price, is_special, params=score_params))
+    if math.isnan(pos_pct): return "0% (数据异常)"
     return f"{int(pos_pct)}%"
 
 def get_short_comment(score, trend_msg):
@@ -452,19 +987,131 @@ def get_pos_comment(score):
     if score >= 4.0: return "轻仓试错"
     return "空仓观望"
 
+# ================= 🗂️ 扫描计划 =================
+async def fetch_ticker_inputs(t):
+    # 行情 / 基本面 / 板块 三路并发，受 fmp 在途上限约束
+    with stats.span("stage.fetch"):
+        (df, quote), fund, sector = await asyncio.gather(
+            get_daily_data_stable(t), get_fundamentals_deep(t), get_sector_momentum(t)
+        )
+    return df, quote, fund, sector
+
+async def scan_tickers(tickers, spy_trend, vix_level):
+    tickers = list(tickers)
+    with stats.span("stage.prefetch"):
+        await asyncio.gather(prefetch_quotes(tickers), sector_service.prepare(tickers))
+    with stats.span("stage.fetch_all"):
+        inputs = await asyncio.gather(*(fetch_ticker_inputs(t) for t in tickers))
+    items = [(t, df, quote, fund, sector) for t, (df, quote, fund, sector) in zip(tickers, inputs) if df is not None]
+    results = await score_items(items, spy_trend, vix_level)
+    logger.info(f"🗂️ [SCAN] {len(results)}/{len(tickers)} tickers scored")
+    return results
+
+async def score_items(items, spy_trend, vix_level):
+    results = {}
+    for (t, df, _, _, _), res in zip(items, await score_frames_async(items, spy_trend, vix_level)):
+        score, specials, stop, atr_pct, _, _, _, _, _, _, _, _ = res
+        results[t] = {'price': df['CLOSE'].iloc[-1], 'score': score, 'specials': specials, 'stop': stop, 'atr_pct': atr_pct}
+    return results
+
+async def scan_stream(tickers, spy_trend, vix_level, interval=LIST_EDIT_INTERVAL, timeout=0):
+    # 所有代码同时开拉，拉完一批就打分一批: yield {ticker: 结果 或 None(数据失败)}
+    # 第一批在最快的代码完成时立即给出，之后至少间隔 interval 秒再给下一批
+    tickers = list(tickers)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout if timeout else None
+    left = lambda: None if deadline is None else max(0.0, deadline - loop.time())
+    await asyncio.gather(prefetch_quotes(tickers), sector_service.prepare(tickers))
+    # 同时在拉的代码数受限: 否则所有代码的请求在 fmp 信号量里交错排队，几乎同时完成
+    gate = asyncio.Semaphore(max(1, FMP_MAX_INFLIGHT // 2))
+    async def fetch(t):
+        async with gate: return await fetch_ticker_inputs(t)
+    tasks = {asyncio.ensure_future(fetch(t)): t for t in tickers}
+    pending = set(tasks); last = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=left(), return_when=asyncio.FIRST_COMPLETED)
+            if not done: break  # 超时
+            if last is not None and pending:
+                gap = interval - (loop.time() - last)
+                if deadline is not None: gap = min(gap, left())
+                if gap > 0:
+                    more, pending = await asyncio.wait(pending, timeout=gap)
+                    done |= more
+            items, failed = [], {}
+            for task in done:
+                t = tasks[task]
+                df, quote, fund, sector = task.result()
+                if df is None: failed[t] = None
+                else: items.append((t, df, quote, fund, sector))
+            batch = await score_items(items, spy_trend, vix_level) if items else {}
+            batch.update(failed)
+            last = loop.time()
+            yield batch
+    finally:
+        # 超时没完成的直接放弃；同 key 的底层加载有 shield，会继续跑完写进缓存
+        for task in pending: task.cancel()
+
+# ================= 🛰️ 全市场扫描 =================
+UNIVERSE_ENDPOINTS = {"sp500": "sp500-constituent", "nasdaq100": "nasdaq-constituent", "dowjones": "dowjones-constituent"}
+SYMBOL_RE = re.compile(r"^[A-Z0-9^][A-Z0-9.\-]{0,9}$")
+
+def parse_symbols(text, limit=SCAN_MAX_SYMBOLS):
+    # 代码列表: 换行 / 逗号 / 空白分隔，# 之后是注释；去重保序
+    out = {}
+    for line in text.splitlines():
+        for tok in line.split('#', 1)[0].replace(',', ' ').split():
+            t = tok.upper()
+            if SYMBOL_RE.match(t): out.setdefault(t, None)
+    return list(out)[:limit]
+
+class Universe:
+    # 扫描范围: 指数成分 (FMP constituent 接口) 或本地代码文件，每天读一次
+    def __init__(self):
+        self.lists = {}  # 名称 -> (日期, [代码])
+
+    async def load(self, name):
+        today_obj = datetime.date.today()
+        hit = self.lists.get(name)
+        if hit and hit[0] == today_obj: return hit[1]
+        endpoint = UNIVERSE_ENDPOINTS.get(name.lower())
+        if endpoint:
+            resp = await fmp.get(endpoint)
+            rows = [r for r in resp or [] if isinstance(r, dict) and r.get('symbol')]
+            symbols = parse_symbols("\n".join(r['symbol'] for r in rows))
+            sector_service.seed([(r['symbol'], r.get('subSector'), r.get('sector')) for r in rows])
+        else:
+            with open(name, 'r') as f: symbols = parse_symbols(f.read())
+        self.lists[name] = (today_obj, symbols)
+        logger.info(f"🛰️ [UNIVERSE] {name}: {len(symbols)} symbols")
+        return symbols
+
+universe = Universe()
+scan_lock = asyncio.Lock()
+
+async def scan_universe(symbols):
+    # 先用 eod-bulk 把本地K线补到上一交易日，再走常规扫描 (批量报价 + 板块表 + 本地基本面)；
+    # 同时只跑一个，后到的直接吃前一次留下的缓存
+    async with scan_lock:
+        spy_trend, vix_level, _ = await get_market_regime_detailed()
+        with stats.span("stage.bulk_bars"):
+            await bulk_sync_bars(symbols)
+        return await scan_tickers(symbols, spy_trend, vix_level)
+
 @bot.tree.command(name="check", description="V34.98 战术指令版")
 async def check_stocks(interaction: discord.Interaction, ticker: str):
+    t_cmd = time.perf_counter()
     if not interaction.response.is_done(): await interaction.response.defer()
     t = ticker.split()[0].replace(',', '').upper()
     
     try:
-        loop = asyncio.get_running_loop()
-        spy_trend, vix_level, _ = await loop.run_in_executor(None, get_market_regime_detailed)
-        df, quote = await loop.run_in_executor(None, get_daily_data_stable, t)
+        (spy_trend, vix_level, _), (df, quote, fund, sector) = await asyncio.gather(
+            get_market_regime_detailed(), fetch_ticker_inputs(t)
+        )
         if df is None: return await interaction.followup.send(f"❌ 数据失败: {t}")
-        fund = await loop.run_in_executor(None, get_fundamentals_deep, t)
         
-        score, specials, chandelier, atr_pct, t_msg, v_msg, f_msg, s_msg, r_msg, vl_msg, formula, stop_source_msg = calculate_v34_score(df, quote, fund, spy_trend, vix_level, t)
+        score, specials, chandelier, atr_pct, t_msg, v_msg, f_msg, s_msg, r_msg, vl_msg, formula, stop_source_msg = calculate_v34_score(df, quote, fund, spy_trend, vix_level, t, sector)
+        t_render = time.perf_counter()
         
         price = df['CLOSE'].iloc[-1]
         pos_advice = calculate_position_size(atr_pct, score, price, chandelier, specials)
@@ -517,110 +1164,681 @@ async def check_stocks(interaction: discord.Interaction, ticker: str):
 
         ny_time = datetime.datetime.now(pytz.timezone('America/New_York')).strftime('%H:%M')
         embed.set_image(url=get_finviz_chart_url(t))
-        embed.set_footer(text=f"FMP Ultimate API • 机构级多因子模型 • 今天 {ny_time}")
+        embed.set_footer(text=f"FMP Ultimate API • 机构级多因子模型 • 今天 {ny_time} • 大盘数据 {market_regime.age_text()}")
+        stats.observe("stage.render", time.perf_counter() - t_render)
         
         await interaction.followup.send(embed=embed)
+        stats.observe("cmd.check", time.perf_counter() - t_cmd)
     except Exception as e:
         logger.error(f"Error in check_stocks: {e}")
         await interaction.followup.send(f"⚠️ 分析中断: {str(e)}")
 
+class ListPager(discord.ui.View):
+    # /list 翻页按钮；扫描过程中 pages 会被不断替换成最新排序
+    def __init__(self):
+        super().__init__(timeout=600)
+        self.pages = []; self.page = 0
+
+    def current(self):
+        self.page = min(self.page, len(self.pages) - 1)
+        return self.pages[self.page]
+
+    @discord.ui.button(label="◀", style=discord.ButtonStyle.secondary)
+    async def prev_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page = max(0, self.page - 1)
+        await interaction.response.edit_message(embed=self.current(), view=self)
+
+    @discord.ui.button(label="▶", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page = min(len(self.pages) - 1, self.page + 1)
+        await interaction.response.edit_message(embed=self.current(), view=self)
+
+def score_icon(r):
+    if any("冰点" in s for s in r['specials']): return "🧊"
+    return "🔥" if r['score'] > 7 else "💀" if r['score'] < 4 else "⚖️"
+
+def render_list_pages(results, total, pending=None, skipped=0):
+    # results: ticker -> 结果 / None；按分数从高到低，每 LIST_PAGE_SIZE 行一页
+    rows = sorted(((t, r) for t, r in results.items() if r), key=lambda kv: -kv[1]['score'])
+    lines = [f"**{t}**: `{r['score']:.1f}` {score_icon(r)}" for t, r in rows]
+    chunks = [lines[i:i + LIST_PAGE_SIZE] for i in range(0, len(lines), LIST_PAGE_SIZE)] or [[]]
+
+    failed = [t for t, r in results.items() if r is None]
+    notes = []
+    if pending is None: notes.append(f"⏳ 扫描中 {len(results)}/{total}")
+    elif pending: notes.append(f"⏳ 超时未完成 ({len(pending)}): {', '.join(pending)}")
+    if failed: notes.append(f"❌ 数据失败: {', '.join(failed)}")
+    if skipped: notes.append(f"✂️ 超出上限 {LIST_MAX_TICKERS}，另有 {skipped} 只未扫描")
+
+    pages = []
+    for i, chunk in enumerate(chunks):
+        embed = discord.Embed(title="📊 V34.98 机构看板", description="\n".join(chunk) or "⏳ 扫描中...", color=discord.Color.blue())
+        if notes: embed.add_field(name="状态", value="\n".join(notes)[:1000], inline=False)
+        page_str = f"第 {i + 1}/{len(chunks)} 页 • " if len(chunks) > 1 else ""
+        embed.set_footer(text=f"{page_str}已完成 {len(results)}/{total} • 大盘数据 {market_regime.age_text()}")
+        pages.append(embed)
+    return pages
+
 @bot.tree.command(name="list", description="扫描观察池")
 async def list_stocks(interaction: discord.Interaction):
+    t_cmd = time.perf_counter()
     if not interaction.response.is_done(): await interaction.response.defer(ephemeral=True)
     user_id = str(interaction.user.id)
-    user_stocks = watch_data.get(user_id, {})
-    if not user_stocks: return await interaction.followup.send("📭 列表为空")
-    
-    loop = asyncio.get_running_loop()
-    spy_trend, vix_level, _ = await loop.run_in_executor(None, get_market_regime_detailed)
-    
-    lines = []
-    tickers = list(user_stocks.keys())
-    for t in tickers:
-        df, quote = await loop.run_in_executor(None, get_daily_data_stable, t)
-        if df is None: continue
-        fund = await loop.run_in_executor(None, get_fundamentals_deep, t)
-        score, specials, _, _, _, _, _, _, _, _, _, _ = calculate_v34_score(df, quote, fund, spy_trend, vix_level, t)
-        icon = "🔥" if score > 7 else "💀" if score < 4 else "⚖️"
-        if any("冰点" in s for s in specials): icon = "🧊"
-        lines.append(f"**{t}**: `{score:.1f}` {icon}")
-    
-    embed = discord.Embed(title="📊 V34.98 机构看板", description="\n".join(lines), color=discord.Color.blue())
-    await interaction.followup.send(embed=embed)
+    tickers = watchlist.tickers(user_id)
+    if not tickers: return await interaction.followup.send("📭 列表为空")
+
+    skipped = 0
+    if LIST_MAX_TICKERS and len(tickers) > LIST_MAX_TICKERS:
+        skipped = len(tickers) - LIST_MAX_TICKERS; tickers = tickers[:LIST_MAX_TICKERS]
+
+    spy_trend, vix_level, _ = await get_market_regime_detailed()
+    pager = ListPager()
+    pager.pages = render_list_pages({}, len(tickers), skipped=skipped)
+    msg = await interaction.followup.send(embed=pager.current(), view=pager, wait=True)
+
+    results = {}
+    async for batch in scan_stream(tickers, spy_trend, vix_level, timeout=LIST_TIMEOUT):
+        if not results: stats.observe("cmd.list.first", time.perf_counter() - t_cmd)
+        results.update(batch)
+        if len(results) < len(tickers):
+            t_render = time.perf_counter()
+            pager.pages = render_list_pages(results, len(tickers), skipped=skipped)
+            stats.observe("stage.render", time.perf_counter() - t_render)
+            await msg.edit(embed=pager.current(), view=pager)
+
+    pending = [t for t in tickers if t not in results]
+    pager.pages = render_list_pages(results, len(tickers), pending=pending, skipped=skipped)
+    if len(pager.pages) == 1: pager.stop()
+    await msg.edit(embed=pager.current(), view=pager if len(pager.pages) > 1 else None)
+    stats.observe("cmd.list", time.perf_counter() - t_cmd)
+
+def render_scan_pages(name, results, total, top):
+    # 前 top 名 + 所有触发特殊信号的代码，按分数排序，每 LIST_PAGE_SIZE 行一页
+    rows = sorted(((t, r) for t, r in results.items() if r), key=lambda kv: -kv[1]['score'])
+    signals = [(t, r) for t, r in rows if r['specials']]
+    lines = [f"__🏆 前 {min(top, len(rows))} 名__"]
+    lines += [f"**{t}**: `{r['score']:.1f}` {score_icon(r)} ${r['price']:.2f}" for t, r in rows[:top]]
+    lines += ["", f"__☢️ 特殊信号 ({len(signals)})__"] if signals else []
+    lines += [f"{score_icon(r)} **{t}** ({r['score']:.1f}): {' '.join(r['specials'])}" for t, r in signals]
+    chunks = [lines[i:i + LIST_PAGE_SIZE] for i in range(0, len(lines), LIST_PAGE_SIZE)]
+    pages = []
+    for i, chunk in enumerate(chunks):
+        embed = discord.Embed(title=f"🛰️ 全市场扫描 · {name}", description="\n".join(chunk)[:4000], color=discord.Color.purple())
+        page_str = f"第 {i + 1}/{len(chunks)} 页 • " if len(chunks) > 1 else ""
+        embed.set_footer(text=f"{page_str}已评分 {len(rows)}/{total} • 大盘数据 {market_regime.age_text()}")
+        pages.append(embed)
+    return pages
+
+@bot.tree.command(name="scan", description="全市场扫描: 指数成分或上传的代码列表")
+@app_commands.describe(index="指数成分 (默认 SCAN_UNIVERSE)", file="代码列表文件 (换行 / 逗号分隔)", top="显示前几名")
+@app_commands.choices(index=[app_commands.Choice(name=n, value=n) for n in UNIVERSE_ENDPOINTS])
+async def scan_market(interaction: discord.Interaction, index: str = None, file: discord.Attachment = None, top: app_commands.Range[int, 1, 100] = SCAN_TOP):
+    t_cmd = time.perf_counter()
+    await interaction.response.defer(ephemeral=True)
+    name = file.filename if file is not None else (index or SCAN_UNIVERSE)
+    try:
+        if file is not None:
+            if file.size > 256 * 1024: return await interaction.followup.send("❌ 文件过大 (上限 256KB)")
+            # 上传文件等于任意代码的冷启动回补: 普通用户限 SCAN_FILE_MAX 只，管理员 SCAN_MAX_SYMBOLS 只
+            perms = getattr(interaction.user, 'guild_permissions', None)
+            cap = SCAN_MAX_SYMBOLS if perms is not None and perms.administrator else min(SCAN_FILE_MAX, SCAN_MAX_SYMBOLS)
+            if cap <= 0: return await interaction.followup.send("⛔ 上传代码文件扫描仅限管理员")
+            symbols = parse_symbols((await file.read()).decode('utf-8', 'ignore'), limit=None)
+            if len(symbols) > cap: return await interaction.followup.send(f"❌ 文件里有 {len(symbols)} 只代码，上限 {cap} 只")
+        else:
+            symbols = await universe.load(name)
+    except Exception as e:
+        return await interaction.followup.send(f"❌ 无法读取扫描范围 {name}: {e}")
+    if not symbols: return await interaction.followup.send(f"📭 {name} 里没有可用代码")
+
+    results = await scan_universe(symbols)
+    pager = ListPager()
+    pager.pages = render_scan_pages(name, results, len(symbols), top)
+    if len(pager.pages) == 1: pager.stop()
+    await interaction.followup.send(embed=pager.current(), view=pager if len(pager.pages) > 1 else None)
+    stats.observe("cmd.scan", time.perf_counter() - t_cmd)
+
+@bot.tree.command(name="stats", description="运行指标 (管理员)")
+@app_commands.default_permissions(administrator=True)
+async def show_stats(interaction: discord.Interaction):
+    lines = [f"{'stage (ms)':<32}{'n':>6}{'p50':>9}{'p95':>9}{'p99':>9}"]
+    for key, s in stats.summary().items():
+        lines.append(f"{key[:31]:<32}{s['count']:>6}{s['p50'] * 1000:>9.1f}{s['p95'] * 1000:>9.1f}{s['p99'] * 1000:>9.1f}")
+    usage = api_cache.usage(); cache_lines = []
+    for name, (h, m) in stats.hit_rates().items():
+        if not h + m: continue
+        line = f"{name:<8} {h}/{h + m} ({h / (h + m):.0%})"
+        if name in usage: line += f" | {usage[name][0]} 条 {usage[name][1] / 1048576:.1f}MB 淘汰 {stats.counters[f'cache.{name}.evict']}"
+        cache_lines.append(line)
+    cache_lines.append(f"内存 {api_cache.nbytes / 1048576:.1f}/{CACHE_MAX_MB}MB")
+    errs = [f"{k}: {v}" for k, v in sorted(stats.counters.items()) if not k.startswith('cache.')]
+
+    embed = discord.Embed(title="📈 运行指标", color=discord.Color.dark_teal())
+    embed.description = "```\n" + "\n".join(lines)[:3900] + "\n```"
+    if cache_lines: embed.add_field(name="缓存命中", value="```\n" + "\n".join(cache_lines)[:1000] + "\n```", inline=False)
+    if errs: embed.add_field(name="重试 / 错误", value="```\n" + "\n".join(errs)[:1000] + "\n```", inline=False)
+    uptime = int(time.time() - stats.started)
+    embed.set_footer(text=f"统计窗口: 最近 {stats.window} 次 • 运行 {uptime // 3600}h{uptime % 3600 // 60:02d}m • 发送队列 {dispatcher.pending} • 大盘数据 {market_regime.age_text()}")
+    await interaction.response.send_message(embed=embed, ephemeral=True)
 
 @bot.tree.command(name="add", description="添加")
 async def add_stock(interaction: discord.Interaction, ticker: str):
     user_id = str(interaction.user.id)
-    if user_id not in watch_data: watch_data[user_id] = {}
-    for t in ticker.upper().replace(',', ' ').split(): watch_data[user_id][t] = {}
-    save_data()
+    watchlist.add(user_id, ticker.upper().replace(',', ' ').split())
     await interaction.response.send_message(f"✅")
 
 @bot.tree.command(name="remove", description="删除")
 async def remove_stock(interaction: discord.Interaction, ticker: str):
     user_id = str(interaction.user.id)
-    if user_id in watch_data and ticker.upper() in watch_data[user_id]:
-        del watch_data[user_id][ticker.upper()]
-        save_data()
+    if watchlist.remove(user_id, ticker.upper()):
         await interaction.response.send_message(f"🗑️")
 
-@tasks.loop(time=datetime.time(hour=16, minute=15, tzinfo=pytz.timezone('America/New_York')))
+# ================= 📮 消息发送 =================
+# 定时任务的广播走统一出站队列: 多个用户的简报拼进同一条消息 (不超过 Discord 的 2000 字)，
+# 单个用户太长就按行分页，不再截断。各组消息并发发送，按 Discord 返回的 X-RateLimit bucket
+# 排队和 429 重试由 discord.py 的 HTTP 客户端负责，这里只限制在途条数、统计排队深度和发送耗时
+DISCORD_MSG_LIMIT = 2000
+
+def _paginate(header, lines, limit):
+    # 按行切页，每页标题带页码；单行超长的硬切
+    room = limit - len(header) - 12  # 预留 " (99/99)\n"
+    parts = [line[i:i + room] for line in lines for i in range(0, max(len(line), 1), room)]
+    pages, cur = [], ""
+    for line in parts:
+        if cur and len(cur) + 1 + len(line) > room:
+            pages.append(cur); cur = ""
+        cur = f"{cur}\n{line}" if cur else line
+    if cur: pages.append(cur)
+    return [f"{header} ({i}/{len(pages)})\n{body}" for i, body in enumerate(pages, 1)]
+
+def pack_messages(blocks, limit=DISCORD_MSG_LIMIT):
+    # blocks: [(标题行, [行, ...]), ...] -> [[消息, ...], ...]
+    # 组内消息按顺序发 (同一用户的分页)，组与组之间并发
+    groups, buf = [], ""
+    for header, lines in blocks:
+        text = "\n".join([header, *lines])
+        if len(text) <= limit:
+            if buf and len(buf) + 2 + len(text) > limit:
+                groups.append([buf]); buf = ""
+            buf = f"{buf}\n\n{text}" if buf else text
+        else:
+            groups.append(_paginate(header, lines, limit))
+    if buf: groups.append([buf])
+    return groups
+
+class Dispatcher:
+    def __init__(self, concurrency):
+        self.concurrency = max(1, concurrency)
+        self.queue = None
+        self.workers = []
+        self.pending = 0  # 排队 + 在途的组数
+
+    def _ensure_workers(self):
+        if self.queue is None: self.queue = asyncio.Queue()
+        self.workers = [w for w in self.workers if not w.done()]
+        while len(self.workers) < self.concurrency:
+            self.workers.append(asyncio.create_task(self._work()))
+
+    def submit(self, channel, messages):
+        # messages: [{'content': ...} 或 {'embed': ...}, ...] 按顺序发; -> Future[已发出的消息列表]
+        self._ensure_workers()
+        fut = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((channel, messages, fut, time.perf_counter()))
+        self.pending += 1
+        return fut
+
+    async def _work(self):
+        while True:
+            channel, messages, fut, queued_at = await self.queue.get()
+            stats.observe("discord.queue_wait", time.perf_counter() - queued_at)
+            sent = []
+            try:
+                for kw in messages:
+                    t0 = time.perf_counter()
+                    try: sent.append(await channel.send(**kw))
+                    finally: stats.observe("discord.send", time.perf_counter() - t0)
+                    stats.incr("discord.sent")
+            except Exception as e:
+                # 组内后面的分页不再发，免得用户只看到后半截
+                stats.incr("discord.failed")
+                logger.error(f"⚠️ [DISPATCH] send failed after {len(sent)}/{len(messages)} messages: {e}")
+            finally:
+                self.pending -= 1
+                if not fut.done(): fut.set_result(sent)
+
+    async def broadcast(self, channel, groups):
+        # groups: [[文本 或 Embed, ...], ...] -> 实际发出的消息条数
+        futs = [self.submit(channel, [{'embed': m} if isinstance(m, discord.Embed) else {'content': m} for m in g]) for g in groups]
+        return sum(len(r) for r in await asyncio.gather(*futs))
+
+dispatcher = Dispatcher(DISCORD_SEND_CONCURRENCY)
+stats.gauges['discord_queue'] = lambda: dispatcher.pending
+
+# ================= 🔥 任务预热 =================
+NY_TZ = pytz.timezone('America/New_York')
+
+def ny_clock(hhmm):
+    h, m = hhmm.split(':')
+    return datetime.time(hour=int(h), minute=int(m), tzinfo=NY_TZ)
+
+JOB_TIMES = {'premarket_alert': ny_clock("09:25"), 'daily_monitor': ny_clock("16:15")}
+
+def job_lag(name, now=None):
+    # 距今天该任务计划触发时刻过了多少秒
+    now = now or datetime.datetime.now(NY_TZ)
+    due = NY_TZ.localize(datetime.datetime.combine(now.date(), JOB_TIMES[name].replace(tzinfo=None)))
+    return (now - due).total_seconds()
+
+class Prewarmer:
+    # 定时任务触发前 lead 秒开始，把观察池并集的K线 / 基本面 / 板块映射 / 财报日历分批拉好，
+    # 批次均匀铺到触发前 final 秒为止；最后 final 秒刷新大盘和板块涨幅、拉起评分进程池。
+    # 任务触发时只剩批量报价 (必须是触发时刻的价格) + 打分 + 发送
+    def __init__(self, jobs, lead, final, batch):
+        self.jobs = jobs
+        self.lead = lead; self.final = min(final, lead); self.batch = max(1, batch)
+        self.warmed = {}  # 任务名 -> 预热完成对应的触发时刻
+        self._task = None
+
+    def next_deadline(self, now=None):
+        # -> (任务名, 下一次触发时刻)
+        now = now or datetime.datetime.now(NY_TZ)
+        out = []
+        for name, t in self.jobs.items():
+            for days in (0, 1):
+                due = NY_TZ.localize(datetime.datetime.combine(now.date() + datetime.timedelta(days=days), t.replace(tzinfo=None)))
+                if due > now:
+                    out.append((due, name)); break
+        due, name = min(out)
+        return name, due
+
+    def ready(self, name):
+        # 本次触发对应的预热已经跑完
+        due = self.warmed.get(name)
+        return due is not None and abs((datetime.datetime.now(NY_TZ) - due).total_seconds()) < max(self.lead, 60)
+
+    async def _sleep_until(self, when):
+        delay = (when - datetime.datetime.now(NY_TZ)).total_seconds()
+        if delay > 0: await asyncio.sleep(delay)
+
+    async def _warm_one(self, t):
+        res = await asyncio.gather(sync_bars(t), get_fundamentals_deep(t), return_exceptions=True)
+        return not any(isinstance(r, Exception) for r in res)
+
+    async def warm(self, name, due):
+        t0 = time.perf_counter()
+        tickers = sorted(watchlist.plan())
+        with stats.span(f"job.prewarm.{name}"):
+            # 基本面重新过一遍本地库的过期判断 (财报日之后要复查)，和任务原来整体清缓存的效果一样
+            api_cache.clear('fund')
+            await asyncio.gather(earnings_calendar.refresh(), sector_service.resolve(tickers), bulk_sync_bars(tickers))
+            batches = [tickers[i:i + self.batch] for i in range(0, len(tickers), self.batch)]
+            start = datetime.datetime.now(NY_TZ)
+            step = max(0.0, (due - datetime.timedelta(seconds=self.final) - start).total_seconds()) / max(len(batches), 1)
+            failed = 0
+            for i, chunk in enumerate(batches):
+                await self._sleep_until(start + datetime.timedelta(seconds=i * step))
+                failed += sum(not ok for ok in await asyncio.gather(*(self._warm_one(t) for t in chunk)))
+            await self._sleep_until(due - datetime.timedelta(seconds=self.final))
+            await asyncio.gather(market_regime.refresh(), sector_service.refresh(force=True), warm_score_pool())
+        self.warmed[name] = due
+        stats.incr(f"prewarm.{name}.failed", failed)
+        logger.info(f"🔥 [PREWARM] {name}: {len(tickers)} tickers in {len(batches)} batches, {failed} failed, {time.perf_counter() - t0:.1f}s")
+
+    async def _run(self):
+        while True:
+            name, due = self.next_deadline()
+            # 启动时已在窗口内: 立即开始，批次间隔按剩余时间缩短
+            await self._sleep_until(due - datetime.timedelta(seconds=self.lead))
+            try: await self.warm(name, due)
+            except Exception as e: logger.error(f"⚠️ [PREWARM] {name} failed: {e}")
+            await self._sleep_until(due + datetime.timedelta(seconds=1))
+
+    def start(self):
+        if FMP_API_KEY and self.lead > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+prewarmer = Prewarmer(JOB_TIMES, PREWARM_LEAD, PREWARM_FINAL, PREWARM_BATCH)
+
+async def job_inputs(name):
+    # 预热跑过就直接用它刷新好的大盘 / 板块，否则现拉; -> 是否预热过
+    warmed = prewarmer.ready(name)
+    if not warmed: await asyncio.gather(market_regime.refresh(), sector_service.refresh(force=True))
+    return warmed
+
+def job_done(name):
+    # 最后一条消息发出时距计划时刻的延迟
+    lag = job_lag(name)
+    stats.observe(f"job.{name}.lag", lag)
+    logger.info(f"⏱️ [JOB] {name} delivered {lag:.1f}s after schedule")
+
+@tasks.loop(time=JOB_TIMES['daily_monitor'])
+@stats.timed("job.daily_monitor")
 async def daily_monitor():
     channel = bot.get_channel(CHANNEL_ID)
     if not channel: return
-    loop = asyncio.get_running_loop()
-    spy_trend, vix_level, _ = await loop.run_in_executor(None, get_market_regime_detailed)
-    api_cache_daily.clear(); api_cache_fund.clear(); api_cache_sector.clear()
+    warmed = await job_inputs('daily_monitor')
+    spy_trend, vix_level, _ = await get_market_regime_detailed()
+    # 预热过的基本面刚按本地库校验过，只丢当天行情 (报价要取触发时刻的)
+    if warmed: api_cache.clear('daily')
+    else: api_cache.clear()
+    quote_table.clear()
     
-    for uid, stocks in watch_data.items():
+    results = await scan_tickers(watchlist.plan(), spy_trend, vix_level)
+    
+    blocks = []
+    for uid, tickers in watchlist.by_user().items():
         summary_lines = []
-        tickers = list(stocks.keys())
         for t in tickers:
-            df, quote = await loop.run_in_executor(None, get_daily_data_stable, t)
-            if df is None: continue
-            fund = await loop.run_in_executor(None, get_fundamentals_deep, t)
-            score, specials, stop, atr_pct, _, _, _, _, _, _, _, _ = calculate_v34_score(df, quote, fund, spy_trend, vix_level, t)
-            
+            r = results.get(t)
+            if r is None: continue
+            score, specials = r['score'], r['specials']
             if score >= 7.0 or score < 4.0 or specials:
-                price = df['CLOSE'].iloc[-1]
                 icon = "🔥" if score >= 7 else "💀"
                 if any("冰点" in s for s in specials): icon = "🧊"
                 spec_str = f" | {', '.join(specials)}" if specials else ""
-                summary_lines.append(f"{icon} **{t}** ({score:.1f}): ${price:.2f}{spec_str}")
+                summary_lines.append(f"{icon} **{t}** ({score:.1f}): ${r['price']:.2f}{spec_str}")
 
         if summary_lines:
-            msg = f"📊 <@{uid}> **V34.98 核心简报** (VIX:{vix_level:.1f}):\n" + "\n".join(summary_lines)
-            await channel.send(msg[:1900])
-            await asyncio.sleep(1)
+            blocks.append((f"📊 <@{uid}> **V34.98 核心简报** (VIX:{vix_level:.1f}):", summary_lines))
+    await dispatcher.broadcast(channel, pack_messages(blocks))
+    job_done('daily_monitor')
+    await save_snapshot()
 
-@tasks.loop(time=datetime.time(hour=9, minute=25, tzinfo=pytz.timezone('America/New_York')))
+@tasks.loop(time=JOB_TIMES['premarket_alert'])
+@stats.timed("job.premarket_alert")
 async def premarket_alert():
     channel = bot.get_channel(CHANNEL_ID)
     if not channel: return
-    loop = asyncio.get_running_loop()
-    spy_trend, vix_level, _ = await loop.run_in_executor(None, get_market_regime_detailed)
-    api_cache_daily.clear()
-    for uid, stocks in watch_data.items():
+    await job_inputs('premarket_alert')
+    spy_trend, vix_level, _ = await get_market_regime_detailed()
+    api_cache.clear('daily'); quote_table.clear()
+    
+    results = await scan_tickers(watchlist.plan(), spy_trend, vix_level)
+    
+    ny_time = datetime.datetime.now(pytz.timezone('America/New_York')).strftime('%H:%M')
+    blocks = []
+    for uid, tickers in watchlist.by_user().items():
         pre_alerts = []
-        for t in list(stocks.keys()):
-            df, quote = await loop.run_in_executor(None, get_daily_data_stable, t)
-            if df is None: continue
-            fund = await loop.run_in_executor(None, get_fundamentals_deep, t)
-            score, specials, _, _, _, _, _, _, _, _, _, _ = calculate_v34_score(df, quote, fund, spy_trend, vix_level, t)
-            if specials:
-                price = df['CLOSE'].iloc[-1]
-                pre_alerts.append(f"☢️ **{t}**: ${price:.2f} | {' '.join(specials)}")
-        if pre_alerts:
-            ny_time = datetime.datetime.now(pytz.timezone('America/New_York')).strftime('%H:%M')
-            await channel.send(f"🌅 <@{uid}> **盘前绝密情报** ({ny_time}):\n" + "\n".join(pre_alerts))
+        for t in tickers:
+            r = results.get(t)
+            if r is None or not r['specials']: continue
+            pre_alerts.append(f"☢️ **{t}**: ${r['price']:.2f} | {' '.join(r['specials'])}")
+        if pre_alerts: blocks.append((f"🌅 <@{uid}> **盘前绝密情报** ({ny_time}):", pre_alerts))
+    await dispatcher.broadcast(channel, pack_messages(blocks))
+    job_done('premarket_alert')
+    await save_snapshot()
+
+@tasks.loop(time=ny_clock(SCAN_TIME or "16:40"))
+@stats.timed("job.universe_scan")
+async def universe_scan():
+    channel = bot.get_channel(CHANNEL_ID)
+    if not channel: return
+    try: symbols = await universe.load(SCAN_UNIVERSE)
+    except Exception as e:
+        logger.error(f"⚠️ [UNIVERSE] {SCAN_UNIVERSE} unavailable: {e}")
+        return
+    results = await scan_universe(symbols)
+    await dispatcher.broadcast(channel, [render_scan_pages(SCAN_UNIVERSE, results, len(symbols), SCAN_TOP)])
+    await save_snapshot()
+
+# ================= 📡 盘中增量监控 =================
+SCORE_BUCKETS = ("💀", "⚖️", "🔥")  # 与 /list 图标同一套分档
+
+def score_bucket(score):
+    return np.where(score > 7, 2, np.where(score < 4, 0, 1))
+
+def is_market_hours(now=None):
+    now = now or datetime.datetime.now(pytz.timezone('America/New_York'))
+    return now.weekday() < 5 and datetime.time(9, 30) <= now.time() <= datetime.time(16, 0)
+
+class IntradayMonitor:
+    # 已收盘K线只在开盘后 (或观察池变化时) 建一次 IndicatorState；
+    # 之后每轮只拉批量报价，把它当作"今天"这根K线，O(尾部窗口) 出分，
+    # 只有分档或绝密信号变化的代码才推送。
+    def __init__(self, interval):
+        self.interval = interval
+        self.day = None; self.symbols = []; self.watched = frozenset()
+        self.state = None; self.static = {}; self.earn = None; self.earn_dates = []
+        self.last = {}  # ticker -> (分档, 信号位, 分数)
+        self._task = None
+
+    async def rebuild(self, watched):
+        today_obj = datetime.date.today(); today_day = to_day(today_obj)
+        watched = sorted(watched)
+        bars = await asyncio.gather(*(sync_bars(t) for t in watched), return_exceptions=True)
+        # 个别代码 (退市 / 代码错误) 拉不到K线就跳过，不拖累整个观察池
+        failed = [t for t, b in zip(watched, bars) if isinstance(b, BaseException)]
+        if failed:
+            stats.incr("intraday.rebuild_failed", len(failed))
+            logger.error(f"⚠️ [INTRADAY] bars unavailable, skipped: {', '.join(failed)}")
+        closed = {t: b[b['date'] < today_day] for t, b in zip(watched, bars) if not isinstance(b, BaseException)}
+        self.symbols = [t for t in watched if len(closed.get(t, ()))]
+        cols = [scoring.align([closed[t][c] for t in self.symbols], BAR_WINDOW) for c in ('high', 'low', 'close', 'volume')]
+        self.state = indicators.IndicatorState(*cols, **score_params.lengths())
+
+        # 基本面 / 板块一天只取一次 (走缓存)，按代码排成数组
+        funds, sectors = await asyncio.gather(
+            asyncio.gather(*(get_fundamentals_deep(t) for t in self.symbols)),
+            asyncio.gather(*(get_sector_momentum(t) for t in self.symbols)),
+        )
+        per_symbol = [score_inputs(None, f, sr, False, None, 0) for f, (sr, _) in zip(funds, sectors)]
+        self.static = {k: np.array([p[k] for p in per_symbol]) for k in ('has_fund', 'eps', 'rev_growth', 'gross_margin', 'fcf_yield', 'sector_ret')} if per_symbol else {}
+        self.day = today_obj; self.watched = frozenset(watched)
+        self.earn = None; self.last = {}
+        logger.info(f"📡 [INTRADAY] state rebuilt for {len(self.symbols)}/{len(watched)} symbols")
+
+    async def tick(self, watched):
+        # 返回本轮分档 / 信号发生变化的代码: [(ticker, 旧分数, 记录, quote)]
+        if self.day != datetime.date.today() or frozenset(watched) != self.watched:
+            await self.rebuild(watched)
+        if not self.symbols: return []
+        quotes = await fetch_batch_quotes(self.symbols)
+        n = len(self.symbols)
+        h, l, c, v, up, down = (np.full(n, np.nan) for _ in range(6))
+        for i, t in enumerate(self.symbols):
+            q = quotes.get(t)
+            if not q: continue
+            h[i], l[i], c[i], v[i] = _num(q.get('dayHigh')), _num(q.get('dayLow')), _num(q.get('price')), _num(q.get('volume'))
+            up[i], down[i] = _num(q.get('upVolume')), _num(q.get('downVolume'))
+        if self.earn is None:
+            # 财报日盘中不会变，第一轮算好后整天复用
+            self.earn_dates = [(quotes.get(t) or {}).get('earningsAnnouncement') or earnings_calendar.get(t) for t in self.symbols]
+            self.earn = np.array([earnings_soon(d) for d in self.earn_dates], dtype=bool)
+
+        spy_trend, vix_level, _ = await market_regime.get()
+        snap = self.state.snapshot(h, l, c, v)
+        rec = scoring.score_snapshot(snap, up_vol=up, down_vol=down, earn=self.earn,
+                                     spy=scoring.SPY_CODES.get(spy_trend, scoring.SPY_NEUTRAL), vix=vix_level or 0, params=score_params, **self.static)
+        buckets = score_bucket(rec['score'])
+        bits = rec['earn'].astype(np.int8) | (rec['ice'].astype(np.int8) << 1) | (rec['zone'].astype(np.int8) << 2)
+
+        changes = []
+        for i, t in enumerate(self.symbols):
+            if np.isnan(c[i]): continue
+            key = (int(buckets[i]), int(bits[i]))
+            prev = self.last.get(t)
+            self.last[t] = key + (float(rec['score'][i]),)
+            if prev is not None and prev[:2] != key:
+                changes.append((t, prev[2], rec[i], self.earn_dates[i]))
+        return changes
+
+    async def alert(self, changes, plan):
+        channel = bot.get_channel(CHANNEL_ID)
+        if not channel or not changes: return
+        ny_time = datetime.datetime.now(pytz.timezone('America/New_York')).strftime('%H:%M')
+        per_user = {}
+        for t, old_score, r, earn_date in changes:
+            score = float(r['score'])
+            specials = []
+            if r['earn']: specials.append(f"🧨 **财报高危**: {earn_date}")
+            if r['ice']: specials.append(f"🧊 **冰点反转确认**")
+            if r['zone']: specials.append(f"☢️ **机构建仓区启动**")
+            icon = "🧊" if r['ice'] else SCORE_BUCKETS[int(score_bucket(score))]
+            spec_str = f" | {', '.join(specials)}" if specials else ""
+            line = f"{icon} **{t}** ({old_score:.1f} → {score:.1f}): ${float(r['price']):.2f}{spec_str}"
+            for uid in plan.get(t, []): per_user.setdefault(uid, []).append(line)
+        await dispatcher.broadcast(channel, pack_messages([(f"📡 <@{uid}> **盘中异动** ({ny_time}):", lines) for uid, lines in per_user.items()]))
+        stats.incr("intraday.alerts", len(changes))
+
+    async def _run(self):
+        while True:
+            try:
+                if is_market_hours():
+                    plan = watchlist.plan()
+                    with stats.span("job.intraday_tick"):
+                        changes = await self.tick(plan)
+                    await self.alert(changes, plan)
+            except Exception as e:
+                logger.error(f"⚠️ [INTRADAY] tick failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self.interval > 0 and FMP_API_KEY and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+intraday_monitor = IntradayMonitor(INTRADAY_INTERVAL)
+
+# ================= 💾 缓存快照 =================
+# 行情 / 基本面缓存、批量报价表、板块表、财报日历、大盘环境一起落盘；
+# 重启时只恢复当天仍有效的部分，重新部署后 /check 直接命中缓存。K线库本身已在磁盘上。
+SNAPSHOT_VERSION = 1
+snapshot_mark = None
+
+def snapshot_state():
+    # 在事件循环线程里取引用 (DataFrame 走写时复制，不会被改)，序列化交给线程
+    today_str = datetime.datetime.now().strftime('%Y-%m-%d')
+    return {
+        'version': SNAPSHOT_VERSION, 'day': today_str,
+        'cache': api_cache.dump(),
+        'quotes': {t: q for t, q in quote_table.items() if q['date'] == today_str},
+        'sector': (sector_service.day, dict(sector_service.returns)),
+        'earnings': (earnings_calendar.day, earnings_calendar.fetched_at, dict(earnings_calendar.index)),
+        'regime': (market_regime.spy_trend, market_regime.spy_at, market_regime.vix_level, market_regime.vix_at),
+    }
+
+def snapshot_dirty():
+    mark = (api_cache.writes, len(quote_table), sector_service.day, earnings_calendar.fetched_at)
+    return mark != snapshot_mark, mark
+
+async def save_snapshot(force=False):
+    global snapshot_mark
+    dirty, mark = snapshot_dirty()
+    if not dirty and not force: return
+    try:
+        with stats.span("job.snapshot"):
+            await asyncio.to_thread(write_snapshot, SNAPSHOT_FILE, snapshot_state())
+        snapshot_mark = mark
+    except Exception as e:
+        logger.error(f"⚠️ [SNAPSHOT] save failed: {e}")
+
+def restore_snapshot():
+    global snapshot_mark
+    t0 = time.perf_counter()
+    state = read_snapshot(SNAPSHOT_FILE, SNAPSHOT_VERSION)
+    today = datetime.date.today()
+    if not state or state['day'] != today.strftime('%Y-%m-%d'): return
+    n = api_cache.load(state['cache'])
+    score_memo.update((k[0], k[1]) for ns, k, *_ in state['cache'] if ns == 'score' and api_cache.contains(ns, k))
+    quote_table.update(state['quotes'])
+    day, returns = state['sector']
+    if day == today: sector_service.returns.update(returns); sector_service.day = day
+    day, fetched_at, index = state['earnings']
+    if day == today: earnings_calendar.index, earnings_calendar.day, earnings_calendar.fetched_at = index, day, fetched_at
+    # 大盘环境带时间戳，沿用各自的 TTL 判断是否需要刷新
+    market_regime.spy_trend, market_regime.spy_at, market_regime.vix_level, market_regime.vix_at = state['regime']
+    snapshot_mark = snapshot_dirty()[1]
+    logger.info(f"💾 [SNAPSHOT] restored {n} cache entries, {len(state['quotes'])} quotes in {time.perf_counter() - t0:.2f}s")
+
+@tasks.loop(seconds=max(SNAPSHOT_INTERVAL, 1))
+async def snapshot_job():
+    await save_snapshot()
+
+# ================= 🧭 命令同步 =================
+def _command_dict(c):
+    # discord.py 2.4 起 to_dict 要传 tree，2.3 不接受参数
+    try: return c.to_dict(bot.tree)
+    except TypeError: return c.to_dict()
+
+def command_tree_digest():
+    payload = json.dumps([_command_dict(c) for c in bot.tree.get_commands()], sort_keys=True, default=str)
+    return hashlib.sha256(f"{bot.application_id}:{payload}".encode()).hexdigest()
+
+async def sync_commands():
+    # 命令定义 (连同 application id) 没变就跳过 tree.sync，省一次全局同步往返和限速；
+    # 算不出摘要就照常同步，不影响启动
+    try: digest = command_tree_digest()
+    except Exception as e:
+        logger.error(f"⚠️ [TREE] digest failed, syncing anyway: {e}")
+        digest = None
+    try:
+        with open(TREE_HASH_FILE, 'r') as f:
+            if digest and f.read().strip() == digest:
+                logger.info("🧭 Command tree unchanged, sync skipped.")
+                return
+    except OSError: pass
+    await bot.tree.sync()
+    if digest is None: return
+    try:
+        with open(TREE_HASH_FILE, 'w') as f: f.write(digest)
+    except OSError as e:
+        logger.error(f"⚠️ [TREE] hash save failed: {e}")
+
+# ================= 📈 指标端点 =================
+async def start_metrics_server():
+    # 只在 METRICS_PORT > 0 时启动；默认只监听本机
+    global metrics_runner
+    if METRICS_PORT <= 0 or metrics_runner is not None: return
+    from aiohttp import web
+    async def handle(request):
+        return web.Response(text=stats.prometheus(), content_type="text/plain")
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    metrics_runner = web.AppRunner(app, access_log=None)
+    await metrics_runner.setup()
+    await web.TCPSite(metrics_runner, METRICS_HOST, METRICS_PORT).start()
+    logger.info(f"📈 Metrics on http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+
+booted = False
+background_tasks = set()  # 一次性后台任务的强引用，防止跑到一半被回收
+
+def spawn(coro, what):
+    # 不等结果的后台任务: 保留引用直到结束，异常写日志而不是无声丢掉
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    def done(t):
+        background_tasks.discard(t)
+        if not t.cancelled() and t.exception() is not None:
+            logger.error(f"⚠️ [TASK] {what} failed: {t.exception()!r}")
+    task.add_done_callback(done)
+    return task
 
 @bot.event
 async def on_ready():
-    load_data()
-    api_cache_daily.clear(); api_cache_fund.clear(); api_cache_sector.clear()
+    # 断线重连也会触发 on_ready，初始化只做一次
+    global booted
+    if booted: return
+    booted = True
+    restore_snapshot()
+    market_regime.start()
+    spawn(sector_service.refresh(), "sector refresh")
+    intraday_monitor.start()
+    prewarmer.start()
+    await start_metrics_server()
+    try:
+        # 平台停机发 SIGTERM: 正常关闭，bot.run 返回后写最后一次快照
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, lambda: spawn(bot.close(), "shutdown"))
+    except (NotImplementedError, RuntimeError): pass
     logger.info("✅ V34.98 Tactical Command Edition Started.")
-    await bot.tree.sync()
+    # 定时任务先启动: 命令同步出错 (网络 / 权限) 也不能让它们停摆
     daily_monitor.start()
     premarket_alert.start()
+    if SCAN_TIME: universe_scan.start()
+    if SNAPSHOT_INTERVAL > 0: snapshot_job.start()
+    try: await sync_commands()
+    except discord.HTTPException as e: logger.error(f"⚠️ [TREE] sync failed: {e}")
 
-bot.run(TOKEN)
+if __name__ == "__main__":
+    # 评分内核用到的 scipy 导入要 1 秒多: 登录网关的同时在后台线程加载，不让第一条 /check 等它
+    threading.Thread(target=importlib.import_module, args=('scipy.signal',), daemon=True).start()
+    bot.run(TOKEN)
+    if booted: write_snapshot(SNAPSHOT_FILE, snapshot_state())
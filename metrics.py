@@ -0,0 +1,94 @@
+import time
+import functools
+import collections
+import numpy as np
+
+# ================= 📈 运行指标 =================
+# 热路径只做 perf_counter 相减 + deque.append / dict 加一，
+# 分位数只在 /stats 或 /metrics 读取时才用 numpy 现算。
+QUANTILES = (0.5, 0.95, 0.99)
+
+class _Span:
+    __slots__ = ('stats', 'key', 't0')
+
+    def __init__(self, stats, key):
+        self.stats = stats; self.key = key
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.stats.observe(self.key, time.perf_counter() - self.t0)
+        return False
+
+class Stats:
+    def __init__(self, window=2048):
+        self.window = window  # 每个分段保留最近多少次耗时
+        self.samples = {}
+        self.totals = {}  # key -> [次数, 总耗时]，不受窗口限制
+        self.counters = collections.Counter()
+        self.gauges = {}  # name -> 无参函数，读取时才求值
+        self.started = time.time()
+
+    def observe(self, key, seconds):
+        buf = self.samples.get(key)
+        if buf is None:
+            buf = self.samples[key] = collections.deque(maxlen=self.window)
+            self.totals[key] = [0, 0.0]
+        buf.append(seconds)
+        tot = self.totals[key]; tot[0] += 1; tot[1] += seconds
+
+    def span(self, key):
+        # with stats.span('fetch.bars'): ...
+        return _Span(self, key)
+
+    def timed(self, key):
+        # 给整个 async 函数 (定时任务) 计时的装饰器
+        def deco(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                with self.span(key): return await fn(*args, **kwargs)
+            return wrapper
+        return deco
+
+    def incr(self, key, n=1):
+        self.counters[key] += n
+
+    def hit(self, cache, ok):
+        self.counters[f"cache.{cache}.{'hit' if ok else 'miss'}"] += 1
+
+    def summary(self):
+        out = {}
+        for key, buf in sorted(self.samples.items()):
+            qs = np.quantile(np.fromiter(buf, dtype=np.float64, count=len(buf)), QUANTILES) if buf else [np.nan] * len(QUANTILES)
+            count, total = self.totals[key]
+            out[key] = {'count': count, 'total': total, 'p50': qs[0], 'p95': qs[1], 'p99': qs[2]}
+        return out
+
+    def hit_rates(self):
+        # cache 名 -> (命中, 未命中)
+        names = {k[6:].rsplit('.', 1)[0] for k in self.counters if k.startswith('cache.')}
+        return {n: (self.counters[f"cache.{n}.hit"], self.counters[f"cache.{n}.miss"]) for n in sorted(names)}
+
+    def reset(self):
+        self.samples.clear(); self.totals.clear(); self.counters.clear()
+        self.started = time.time()
+
+    def prometheus(self, prefix="drawbot"):
+        # Prometheus 文本格式: 分段耗时用 summary，计数器用 counter
+        lines = [f"# TYPE {prefix}_stage_seconds summary"]
+        for key, s in self.summary().items():
+            for q, name in zip(QUANTILES, ('p50', 'p95', 'p99')):
+                lines.append(f'{prefix}_stage_seconds{{stage="{key}",quantile="{q}"}} {s[name]:.6f}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{key}"}} {s["total"]:.6f}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{key}"}} {s["count"]}')
+        lines.append(f"# TYPE {prefix}_events_total counter")
+        for key, v in sorted(self.counters.items()):
+            lines.append(f'{prefix}_events_total{{event="{key}"}} {v}')
+        lines.append(f"# TYPE {prefix}_gauge gauge")
+        for key, fn in sorted(self.gauges.items()):
+            lines.append(f'{prefix}_gauge{{name="{key}"}} {fn()}')
+        lines.append(f"# TYPE {prefix}_uptime_seconds gauge")
+        lines.append(f"{prefix}_uptime_seconds {time.time() - self.started:.0f}")
+        return "\n".join(lines) + "\n"
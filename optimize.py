@@ -0,0 +1,201 @@
+import os
+import json
+import time
+import random
+import shutil
+import argparse
+import logging
+import itertools
+import tempfile
+import dataclasses
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+import indicators
+import scoring
+import backtest
+from barstore import BarStore
+
+# ================= 🎯 评分参数寻优 =================
+# 本地K线库只读一次: 父进程把面板、大盘 / 板块逐日输入、所有候选用到的指标长度对应的序列
+# 全部算好，写成 .npy 放进临时目录；子进程 np.load(mmap_mode='r') 共享同一份页缓存，
+# 每个候选只跑 score_snapshot + simulate (与 backtest.py 同一套回测)。网格或随机采样，按目标指标排序。
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+logger = logging.getLogger(__name__)
+
+METRICS = ('sharpe', 'cagr', 'total_return', 'max_drawdown')  # 都是越大越好 (回撤为负数)
+# 与指标长度无关、所有候选共用的序列
+FIXED_KEYS = ('close', 'high', 'low', 'volume', 'prev_close', 'vol_ma20', 'vol_ma50', 'ma144', 'ma233', 'ma144_lag',
+              'high_prior20', 'high_22', 'low_21')
+FIELD_TYPES = {f.name: f.type for f in dataclasses.fields(scoring.ScoreParams)}
+
+# ================= 🧭 搜索空间 =================
+def _cast(name, value):
+    kind = FIELD_TYPES[name]
+    return int(round(float(value))) if kind in (int, 'int') else float(value)
+
+def parse_space(specs):
+    # ["rvol_heavy=1.2,1.5,2.0", "atr_pct_high=0.04:0.08", "hma_fast=34:89:5"]
+    # -> {name: 候选值列表 或 (lo, hi) 连续区间}；a:b:step 按步长展开成列表
+    space = {}
+    for spec in specs:
+        name, _, values = spec.partition('=')
+        name = name.strip()
+        if name not in FIELD_TYPES: raise ValueError(f"unknown score param: {name}")
+        if FIELD_TYPES[name] in (tuple, 'tuple'): raise ValueError(f"{name} 是乘数表，只能通过 --base JSON 设置")
+        if ':' in values:
+            parts = [float(x) for x in values.split(':')]
+            if len(parts) == 3:
+                lo, hi, step = parts
+                space[name] = sorted({_cast(name, x) for x in np.arange(lo, hi + step / 2, step)})
+            else:
+                space[name] = (_cast(name, parts[0]), _cast(name, parts[1]))
+        else:
+            space[name] = [_cast(name, x) for x in values.split(',') if x.strip()]
+    return space
+
+def grid_candidates(base, space):
+    ranges = [k for k, v in space.items() if isinstance(v, tuple)]
+    if ranges: raise ValueError(f"网格模式需要离散取值 (a,b,c 或 lo:hi:step): {', '.join(ranges)}")
+    names = list(space)
+    return [dataclasses.replace(base, **dict(zip(names, combo))) for combo in itertools.product(*(space[n] for n in names))]
+
+def random_candidates(base, space, samples, seed=0):
+    rnd = random.Random(seed)
+    def draw(name, v):
+        if isinstance(v, list): return rnd.choice(v)
+        lo, hi = v
+        return rnd.randint(lo, hi) if isinstance(lo, int) else rnd.uniform(lo, hi)
+    out = {}
+    # 离散空间可能比 samples 小: 限定尝试次数，去重后有多少算多少
+    for _ in range(samples * 20):
+        if len(out) >= samples: break
+        p = dataclasses.replace(base, **{n: draw(n, v) for n, v in space.items()})
+        out.setdefault(p, None)
+    return list(out)
+
+# ================= 🧮 预计算 (父进程) =================
+def precompute(directory, panel, inputs, candidates):
+    # 写出所有候选共用的数组；HMA / ATR / RSI 按用到的长度各算一次
+    t0 = time.perf_counter()
+    h, l, c, v = panel['high'], panel['low'], panel['close'], panel['volume']
+    arrays = {k: x for k, x in indicators.series(h, l, c, v).items() if k in FIXED_KEYS}
+    arrays['open'] = panel['open']
+    arrays.update(inputs)
+    for n in sorted({p.hma_fast for p in candidates} | {p.hma_slow for p in candidates}): arrays[f"hma_{n}"] = indicators.hma(c, n)
+    for n in sorted({p.atr_len for p in candidates}): arrays[f"atr_{n}"] = indicators.atr(h, l, c, n)
+    for n in sorted({p.rsi_len for p in candidates}): arrays[f"rsi_{n}"] = indicators.rsi(c, n)
+    for key, arr in arrays.items(): np.save(os.path.join(directory, f"{key}.npy"), np.ascontiguousarray(arr))
+    logger.info(f"🧮 [OPTIMIZE] {len(arrays)} shared arrays ({sum(a.nbytes for a in arrays.values()) / 1048576:.0f}MB) in {time.perf_counter() - t0:.1f}s")
+
+# ================= ⚙️ 子进程 =================
+_worker = {}
+
+def _init_worker(directory, dates, horizon, cost_bps):
+    _worker.update(dir=directory, dates=dates, horizon=horizon, cost_bps=cost_bps, arrays={})
+
+def _arr(key):
+    a = _worker['arrays'].get(key)
+    if a is None:
+        a = _worker['arrays'][key] = np.load(os.path.join(_worker['dir'], f"{key}.npy"), mmap_mode='r')
+    return a
+
+def evaluate(params):
+    snap = {k: _arr(k) for k in FIXED_KEYS}
+    snap['hma_fast'] = _arr(f"hma_{params.hma_fast}"); snap['hma_slow'] = _arr(f"hma_{params.hma_slow}")
+    snap['atr'] = _arr(f"atr_{params.atr_len}"); snap['rsi'] = _arr(f"rsi_{params.rsi_len}")
+    records = scoring.score_snapshot(snap, sector_ret=_arr('sector_ret'), spy=_arr('spy'), vix=_arr('vix'), params=params)
+    panel = {k: _arr(k) for k in ('open', 'high', 'low', 'close')}
+    weight, daily, equity, turnover, _, _ = backtest.simulate(panel, records, _worker['horizon'], _worker['cost_bps'], params=params)
+    return backtest.summarize(_worker['dates'], daily, equity, turnover, weight)
+
+# ================= 🏁 扫参 =================
+def run_sweep(store, symbols, candidates, start=None, end=None, horizon=5, cost_bps=5.0, sector_map=None, workers=None):
+    # -> [(ScoreParams, summary), ...]，与 candidates 同序
+    t0 = time.perf_counter()
+    names, dates, panel, inputs = backtest.load_inputs(store, symbols, start, end, sector_map)
+    logger.info(f"📂 [OPTIMIZE] {len(names)} symbols × {len(dates)} days loaded in {time.perf_counter() - t0:.1f}s")
+    directory = tempfile.mkdtemp(prefix="v34opt_")
+    try:
+        precompute(directory, panel, inputs, candidates)
+        del panel, inputs
+        workers = workers or os.cpu_count() or 1
+        t1 = time.perf_counter()
+        if workers > 1:
+            methods = multiprocessing.get_all_start_methods()
+            ctx = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+            with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker,
+                                     initargs=(directory, dates, horizon, cost_bps)) as pool:
+                chunk = max(1, len(candidates) // (workers * 8))
+                results = list(pool.map(evaluate, candidates, chunksize=chunk))
+        else:
+            _init_worker(directory, dates, horizon, cost_bps)
+            results = [evaluate(p) for p in candidates]
+        dt = time.perf_counter() - t1
+        logger.info(f"🏁 [OPTIMIZE] {len(candidates)} candidates on {workers} workers in {dt:.1f}s ({dt / max(len(candidates), 1) * workers:.2f}s per candidate-core)")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return list(zip(candidates, results))
+
+def rank(results, metric):
+    return sorted(results, key=lambda r: -np.nan_to_num(r[1][metric], nan=-np.inf))
+
+def main():
+    ap = argparse.ArgumentParser(description="V34 评分参数寻优 (网格 / 随机采样)")
+    ap.add_argument('--param', action='append', default=[], help="name=a,b,c | name=lo:hi | name=lo:hi:step，可重复")
+    ap.add_argument('--mode', choices=('grid', 'random'), default='random')
+    ap.add_argument('--samples', type=int, default=200, help="随机采样的候选数")
+    ap.add_argument('--seed', type=int, default=0)
+    ap.add_argument('--base', help="作为起点的参数 JSON (其余字段沿用)；缺省为内置口径")
+    ap.add_argument('--metric', choices=METRICS, default='sharpe')
+    ap.add_argument('--top', type=int, default=20)
+    ap.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    ap.add_argument('--symbols', help="逗号分隔；缺省为本地K线库全部代码")
+    ap.add_argument('--universe', help="每行一个代码的文件")
+    ap.add_argument('--start'); ap.add_argument('--end')
+    ap.add_argument('--horizon', type=int, default=5)
+    ap.add_argument('--cost-bps', type=float, default=5.0)
+    ap.add_argument('--sector-map', help="JSON: {代码: 板块ETF}")
+    ap.add_argument('--data', default=backtest.BASE_PATH)
+    ap.add_argument('--out', default='optimize_out')
+    args = ap.parse_args()
+
+    store = BarStore(os.path.join(args.data, "bars"))
+    if args.symbols: symbols = [s.strip().upper() for s in args.symbols.split(',') if s.strip()]
+    elif args.universe: symbols = [l.strip().upper() for l in open(args.universe) if l.strip() and not l.startswith('#')]
+    else: symbols = [s for s in store.symbols() if s not in ('SPY', '^VIX', '_VIX')]
+    sector_map = json.load(open(args.sector_map)) if args.sector_map else {}
+    base = scoring.load_params(args.base) if args.base else scoring.DEFAULT_PARAMS
+
+    space = parse_space(args.param)
+    if not space: ap.error("至少给一个 --param")
+    candidates = grid_candidates(base, space) if args.mode == 'grid' else random_candidates(base, space, args.samples, args.seed)
+    # 起点参数永远参与比较，排在第一个
+    candidates = [base] + [p for p in candidates if p != base]
+    logger.info(f"🎯 [OPTIMIZE] {args.mode}: {len(candidates)} candidates over {', '.join(space)}")
+
+    results = run_sweep(store, symbols, candidates, backtest._parse_date(args.start), backtest._parse_date(args.end),
+                        args.horizon, args.cost_bps, sector_map, args.workers)
+    ranked = rank(results, args.metric)
+
+    os.makedirs(args.out, exist_ok=True)
+    names = list(space)
+    with open(os.path.join(args.out, 'ranking.csv'), 'w') as f:
+        f.write(",".join(['rank', *METRICS, 'avg_turnover', 'avg_exposure', *names]) + "\n")
+        for i, (p, s) in enumerate(ranked, 1):
+            f.write(",".join([str(i), *(f"{s[m]:.6f}" for m in METRICS), f"{s['avg_turnover']:.6f}", f"{s['avg_exposure']:.6f}",
+                              *(str(getattr(p, n)) for n in names)]) + "\n")
+    with open(os.path.join(args.out, 'best_params.json'), 'w') as f: json.dump(ranked[0][0].to_dict(), f, indent=2)
+
+    baseline = results[0][1]
+    logger.info(f"📏 baseline: sharpe {baseline['sharpe']:.2f} CAGR {baseline['cagr']:.2%} MaxDD {baseline['max_drawdown']:.2%}")
+    for i, (p, s) in enumerate(ranked[:args.top], 1):
+        tag = " (baseline)" if p == base else ""
+        varied = " ".join(f"{n}={getattr(p, n):.4g}" for n in names)
+        logger.info(f"   #{i:<3} sharpe {s['sharpe']:>5.2f} CAGR {s['cagr']:>7.2%} MaxDD {s['max_drawdown']:>7.2%} | {varied}{tag}")
+    logger.info(f"💾 {os.path.join(args.out, 'ranking.csv')}, best_params.json")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+import json
+import time
+import dataclasses
+import numpy as np
+import indicators
+
+# ================= 🧮 V34 批量评分 =================
+# 规则与 calculate_v34_score 逐条对应，但全部写成掩码向量运算:
+# 输入任意形状 (单只 / symbols / symbols×dates)，逐元素出分、止损和因子代码。
+
+SPY_BEAR, SPY_NEUTRAL, SPY_BULL = -1, 0, 1
+SPY_CODES = {"Bull": SPY_BULL, "Bear": SPY_BEAR}
+
+TREND_BULL, TREND_BEAR, TREND_CHOP = 0, 1, 2
+VSA_NONE, VSA_EXIT, VSA_CHURN, VSA_PUMP, VSA_DUMP, VSA_LOCK, VSA_PUMP_K, VSA_DUMP_K, VSA_STRONG = range(9)
+FUND_NONE, FUND_FAKE, FUND_GROWTH, FUND_SUPER, FUND_CASH, FUND_GOOD = range(6)
+SECTOR_NONE, SECTOR_HOT, SECTOR_COLD, SECTOR_ALPHA = range(4)
+STOP_CHANDELIER, STOP_STRUCTURE, STOP_FALLBACK = range(3)
+
+# 代码 -> FACTOR_COMMENTS 键名 (回测报表用)
+TREND_NAMES = ['Trend_Bull', 'Trend_Bear', 'Trend_Chop']
+VSA_NAMES = [None, 'VSA_Exit', 'VSA_Churn', 'VSA_Pump', 'VSA_Dump', 'VSA_Lock', 'VSA_Pump_K', 'VSA_Dump_K', 'VSA_Strong']
+FUND_NAMES = [None, 'Fund_Fake', 'Fund_Growth', 'Fund_Super', 'Fund_Cash', 'Fund_Good']
+SECTOR_NAMES = [None, 'Sector_Hot', 'Sector_Cold', 'Sector_Alpha']
+
+# ================= 🎛️ 评分参数 =================
+@dataclasses.dataclass(frozen=True)
+class ScoreParams:
+    # 评分 / 止损 / 仓位规则里的全部常量，默认值即线上 V34.98 口径。
+    # frozen: 可哈希 (按指标长度共享预计算)，可直接传进子进程。乘数表按因子代码顺序排列。
+    # 指标长度
+    hma_fast: int = 55
+    hma_slow: int = 144
+    atr_len: int = 14
+    rsi_len: int = 14
+    # 大盘基础分
+    base_bull: float = 3.5
+    base_neutral: float = 3.0
+    base_bear: float = 2.5
+    vix_high: float = 25.0
+    vix_high_cut: float = 0.5
+    vix_panic: float = 35.0
+    base_panic: float = 1.5
+    base_floor: float = 1.5
+    # 因子乘数
+    trend_scores: tuple = (1.5, 0.8, 0.9)
+    vsa_scores: tuple = (1.0, 0.3, 0.5, 1.2, 0.5, 1.3, 1.2, 0.5, 1.1)
+    fund_scores: tuple = (1.0, 0.0, 0.9, 1.25, 1.3, 1.1)
+    sector_scores: tuple = (1.0, 1.2, 0.9, 1.1)
+    # VSA 量价
+    rvol_heavy: float = 1.5
+    rvol_light: float = 0.7
+    rvol_strong: float = 1.0
+    exit_uv_ratio: float = 0.35
+    exit_move: float = 0.02
+    churn_move: float = 0.005
+    pump_move: float = 0.03
+    dump_move: float = -0.02
+    pump_k_move: float = 0.02
+    clv_high: float = 0.7
+    clv_low: float = 0.3
+    clv_strong: float = 0.8
+    # 基本面
+    fake_rev_growth: float = 0.15
+    fake_gross_margin: float = 0.30
+    super_rev_growth: float = 0.50
+    super_gross_margin: float = 0.50
+    cash_fcf_yield: float = 0.05
+    # 板块
+    sector_hot: float = 0.05
+    sector_cold: float = -0.02
+    # 波动率 / 财报
+    atr_pct_high: float = 0.06
+    vol_penalty: float = 0.7
+    earn_penalty: float = 0.8
+    # 🧊 冰点反转
+    ice_rsi: float = 30.0
+    ice_move: float = 0.05
+    ice_rvol: float = 2.0
+    ice_close_pos: float = 0.7
+    ice_score: float = 9.5
+    # ☢️ 机构建仓区
+    zone_upper: float = 1.02
+    zone_lower: float = 0.98
+    zone_near: float = 0.02
+    zone_rvol50: float = 0.6
+    zone_score: float = 9.9
+    # 止损
+    stop_strong_score: float = 6.0
+    chandelier_tight_score: float = 8.5
+    chandelier_tight: float = 2.5
+    chandelier_wide: float = 3.0
+    chandelier_cap: float = 0.98
+    structure_atr: float = 0.5
+    structure_floor: float = 0.90
+    stop_fallback: float = 0.90
+    # 仓位: 分数档 -> 单笔风险
+    tier_top: float = 9.0
+    tier_high: float = 7.5
+    tier_mid: float = 6.0
+    risk_top: float = 0.020
+    risk_high: float = 0.015
+    risk_mid: float = 0.010
+    risk_low: float = 0.005
+    min_pos: float = 5.0
+    max_pos: float = 40.0
+    flat_score: float = 4.0
+
+    def lengths(self):
+        # 传给 indicators.snapshot / series / IndicatorState 的指标长度
+        return {'hma_fast': self.hma_fast, 'hma_slow': self.hma_slow, 'atr_len': self.atr_len, 'rsi_len': self.rsi_len}
+
+    def to_dict(self):
+        return dataclasses.asdict(self)
+
+    @classmethod
+    def from_dict(cls, data):
+        # 未知键直接报错 (拼错的参数名不能悄悄按默认值跑)；乘数表 JSON 里是列表，转回元组
+        fields = {f.name for f in dataclasses.fields(cls)}
+        unknown = set(data) - fields
+        if unknown: raise ValueError(f"unknown score params: {', '.join(sorted(unknown))}")
+        return cls(**{k: tuple(v) if isinstance(v, list) else v for k, v in data.items()})
+
+def load_params(path):
+    # JSON 文件 (optimize.py 输出的 best_params.json 或手写的部分字段) -> ScoreParams
+    with open(path, 'r') as f: return ScoreParams.from_dict(json.load(f))
+
+DEFAULT_PARAMS = ScoreParams()
+
+SCORE_DTYPE = np.dtype([
+    ('score', 'f8'), ('base', 'f8'), ('trend', 'f8'), ('vsa', 'f8'), ('fund', 'f8'),
+    ('sector', 'f8'), ('vol', 'f8'), ('stop', 'f8'), ('atr_pct', 'f8'), ('price', 'f8'),
+    ('trend_code', 'i1'), ('vsa_code', 'i1'), ('fund_code', 'i1'), ('sector_code', 'i1'),
+    ('stop_code', 'i1'), ('vol_high', '?'), ('earn', '?'), ('ice', '?'), ('zone', '?'),
+])
+
+def regime_base(spy, vix, params=DEFAULT_PARAMS):
+    p = params
+    spy = np.asarray(spy); vix = np.asarray(vix, dtype=np.float64)
+    base = np.where(spy == SPY_BULL, p.base_bull, np.where(spy == SPY_BEAR, p.base_bear, p.base_neutral))
+    base = np.where(vix > p.vix_high, base - p.vix_high_cut, base)
+    base = np.where(vix > p.vix_panic, p.base_panic, base)
+    return np.maximum(p.base_floor, base)
+
+def score_snapshot(snap, up_vol=np.nan, down_vol=np.nan, has_fund=False, eps=0.0, rev_growth=0.0,
+                   gross_margin=0.0, fcf_yield=0.0, sector_ret=0.0, earn=False, spy=SPY_NEUTRAL, vix=0.0, params=DEFAULT_PARAMS):
+    # snap: indicators.snapshot() 的输出 (或同形状的逐日序列)
+    p = params
+    f = lambda x: np.asarray(x, dtype=np.float64)
+    price = f(snap['close']); prev = f(snap['prev_close']); high = f(snap['high']); low = f(snap['low']); volume = f(snap['volume'])
+    shape = np.broadcast_shapes(price.shape, np.shape(up_vol), np.shape(has_fund), np.shape(sector_ret), np.shape(earn), np.shape(spy), np.shape(vix))
+    out = np.zeros(shape, dtype=SCORE_DTYPE)
+
+    with np.errstate(all='ignore'):
+        base = regime_base(spy, vix, p)
+
+        hma_fast = f(snap['hma_fast']); hma_slow = f(snap['hma_slow'])
+        trend_code = np.select([(hma_fast > hma_slow) & (price > hma_fast), price < hma_slow], [TREND_BULL, TREND_BEAR], TREND_CHOP)
+        trend = np.asarray(p.trend_scores)[trend_code]
+
+        vol_ma20 = f(snap['vol_ma20'])
+        rvol = np.where(vol_ma20 > 0, volume / vol_ma20, 1.0)
+        price_change = (price - prev) / prev
+        up_vol = f(up_vol); down_vol = f(down_vol)
+        has_uv = ~np.isnan(up_vol) & ~np.isnan(down_vol)
+        uv_total = up_vol + down_vol
+        uv_ratio = np.where(uv_total > 0, up_vol / uv_total, 0.5)
+        day_range = high - low
+        clv = np.where(day_range > 0, (price - low) / day_range, 0.5)
+        heavy = rvol > p.rvol_heavy
+        abs_change = np.abs(price_change)
+        vsa_code = np.select([
+            has_uv & heavy & (uv_ratio < p.exit_uv_ratio) & (abs_change < p.exit_move),
+            has_uv & heavy & (abs_change < p.churn_move),
+            has_uv & heavy & (price_change > p.pump_move),
+            has_uv & heavy & (price_change < p.dump_move),
+            has_uv & ~heavy & (rvol < p.rvol_light) & (price > f(snap['high_prior20'])),
+            ~has_uv & heavy & (price_change > p.pump_k_move) & (clv > p.clv_high),
+            ~has_uv & heavy & (clv < p.clv_low),
+            ~has_uv & (rvol > p.rvol_strong) & (price_change > 0) & (clv > p.clv_strong),
+        ], [VSA_EXIT, VSA_CHURN, VSA_PUMP, VSA_DUMP, VSA_LOCK, VSA_PUMP_K, VSA_DUMP_K, VSA_STRONG], VSA_NONE)
+        vsa = np.asarray(p.vsa_scores)[vsa_code]
+
+        has_fund = np.asarray(has_fund, dtype=bool)
+        eps = f(eps); rev_growth = f(rev_growth); gross_margin = f(gross_margin); fcf_yield = f(fcf_yield)
+        fund_code = np.select([
+            has_fund & (eps < 0) & (rev_growth < p.fake_rev_growth) & (gross_margin < p.fake_gross_margin),
+            has_fund & (eps < 0),
+            has_fund & (rev_growth > p.super_rev_growth) & (gross_margin > p.super_gross_margin),
+            has_fund & (fcf_yield > p.cash_fcf_yield),
+            has_fund,
+        ], [FUND_FAKE, FUND_GROWTH, FUND_SUPER, FUND_CASH, FUND_GOOD], FUND_NONE)
+        fund = np.asarray(p.fund_scores)[fund_code]
+
+        sector_ret = f(sector_ret)
+        sector_code = np.select([
+            sector_ret > p.sector_hot,
+            (sector_ret < p.sector_cold) & (trend_code == TREND_BULL),
+            sector_ret < p.sector_cold,
+        ], [SECTOR_HOT, SECTOR_ALPHA, SECTOR_COLD], SECTOR_NONE)
+        sector = np.asarray(p.sector_scores)[sector_code]
+
+        atr = f(snap['atr'])
+        atr_pct = np.where(price > 0, atr / price, 0.0)
+        vol_high = atr_pct > p.atr_pct_high
+        vol = np.where(vol_high, p.vol_penalty, 1.0)
+
+        final = base * trend * vsa * fund * vol * sector
+
+        # 🚨 财报雷达
+        earn = np.asarray(earn, dtype=bool)
+        final = np.where(earn, final * p.earn_penalty, final)
+
+        # 🧊 冰点反转
+        close_pos = np.where(day_range > 0, (price - low) / day_range, 0.0)
+        ice = (f(snap['rsi']) < p.ice_rsi) & (price_change > p.ice_move) & (rvol > p.ice_rvol) & (close_pos > p.ice_close_pos)
+        final = np.where(ice, p.ice_score, final)
+
+        # ☢️ 机构建仓区
+        ma144 = f(snap['ma144']); ma233 = f(snap['ma233']); vol_ma50 = f(snap['vol_ma50'])
+        rvol_50 = np.where(vol_ma50 > 0, volume / vol_ma50, 1.0)
+        in_zone = ((price < ma144 * p.zone_upper) & (price > ma233 * p.zone_lower)) | (np.abs(price - ma144) / price < p.zone_near)
+        zone = in_zone & (rvol_50 < p.zone_rvol50) & (ma144 > f(snap['ma144_lag']))
+        final = np.where(zone, np.maximum(final, p.zone_score), final)
+
+        # 止损: 高分用吊灯止盈，低分用结构前低；算不出来时兜底 -10%
+        strong = final >= p.stop_strong_score
+        mult = np.where(final >= p.chandelier_tight_score, p.chandelier_tight, p.chandelier_wide)
+        chandelier = np.minimum(f(snap['high_22']) - mult * atr, price * p.chandelier_cap)
+        structure = np.maximum(f(snap['low_21']) - p.structure_atr * atr, price * p.structure_floor)
+        stop = np.where(strong, chandelier, structure)
+        stop_code = np.where(strong, STOP_CHANDELIER, STOP_STRUCTURE)
+        fallback = np.isnan(stop)
+        stop = np.where(fallback, price * p.stop_fallback, stop)
+        stop_code = np.where(fallback, STOP_FALLBACK, stop_code)
+
+    out['score'] = final; out['base'] = base; out['trend'] = trend; out['vsa'] = vsa
+    out['fund'] = fund; out['sector'] = sector; out['vol'] = vol; out['stop'] = stop
+    out['atr_pct'] = atr_pct; out['price'] = price
+    out['trend_code'] = trend_code; out['vsa_code'] = vsa_code; out['fund_code'] = fund_code
+    out['sector_code'] = sector_code; out['stop_code'] = stop_code
+    out['vol_high'] = vol_high; out['earn'] = earn; out['ice'] = ice; out['zone'] = zone
+    return out
+
+def score_batch(high, low, close, volume, params=DEFAULT_PARAMS, **inputs):
+    # 对齐的 (symbols × bars) 数组 -> 每只一条评分记录
+    return score_snapshot(indicators.snapshot(high, low, close, volume, **params.lengths()), params=params, **inputs)
+
+def score_batch_timed(high, low, close, volume, params=DEFAULT_PARAMS, **inputs):
+    # 同 score_batch，另外返回 (指标耗时, 评分耗时) 秒；进程池里跑时用它把分段耗时带回主进程
+    t0 = time.perf_counter()
+    snap = indicators.snapshot(high, low, close, volume, **params.lengths())
+    t1 = time.perf_counter()
+    out = score_snapshot(snap, params=params, **inputs)
+    return out, t1 - t0, time.perf_counter() - t1
+
+def align(series, window):
+    # 不等长序列 -> 右对齐、左侧补 NaN 的 (n, window) 数组
+    out = np.full((len(series), window), np.nan)
+    for i, x in enumerate(series):
+        x = np.asarray(x, dtype=np.float64)[-window:]
+        if len(x): out[i, window - len(x):] = x
+    return out
+
+def position_size(score, price, stop, special, params=DEFAULT_PARAMS):
+    # 返回仓位百分比；止损距离异常时为 NaN
+    p = params
+    score = np.asarray(score, dtype=np.float64)
+    with np.errstate(all='ignore'):
+        dist = (np.asarray(price, dtype=np.float64) - stop) / price
+        risk = np.select([score >= p.tier_top, score >= p.tier_high, score >= p.tier_mid], [p.risk_top, p.risk_high, p.risk_mid], p.risk_low)
+        pct = risk / dist * 100
+        pct = np.where(score >= p.tier_top, np.maximum(pct, p.min_pos), pct)
+        pct = np.minimum(pct, p.max_pos)
+        pct = np.where(dist > 0, pct, np.nan)
+    return np.where((score < p.flat_score) & ~np.asarray(special, dtype=bool), 0.0, pct)
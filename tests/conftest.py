@@ -0,0 +1,43 @@
+import os
+import sys
+import asyncio
+import tempfile
+import importlib
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import bench
+
+# ================= 🧪 测试公共夹具 =================
+# main 在导入时读环境变量: 先起 bench 的 FMP 替身服务器、指向临时数据目录，再导入
+
+@pytest.fixture(scope="session")
+def server():
+    # 空 fixture 目录: 全部用合成数据，不受本地录制的影响
+    srv = bench.StandInServer(bench.FixtureBook(tempfile.mkdtemp(prefix="v34fixtures_")))
+    srv.base_url = srv.start()
+    return srv
+
+@pytest.fixture(scope="session")
+def main(server):
+    os.environ.update(FMP_API_KEY="test", FMP_BASE_URL=server.base_url, DATA_PATH=tempfile.mkdtemp(prefix="v34test_"),
+                      FMP_BACKOFF="0.01", QUOTE_BATCH_SIZE="10", SCORE_WORKERS="0")
+    return importlib.import_module("main")
+
+@pytest.fixture
+def run(main, server):
+    # 每个用例前清空进程内状态和请求计数; 协程跑完关掉连接池 (下个用例是新的事件循环)
+    bench.reset_state(main, main.BASE_PATH)
+    server.reset()
+    def go(coro):
+        async def wrapped():
+            try: return await coro
+            finally: await main.fmp.close()
+        return asyncio.run(wrapped())
+    return go
+
+def requests(server, endpoint):
+    return server.stats.get(endpoint, {}).get('requests', 0)
@@ -0,0 +1,30 @@
+import logging
+
+import backtest
+from barstore import BarStore
+from conftest import requests
+
+# ================= ⏪ 回测输入 =================
+
+SECTOR_MAP = {"BTA": "XLK", "BTB": "XLF"}
+
+def test_missing_regime_and_sector_bars_are_reported(server, tmp_path, caplog):
+    store = BarStore(str(tmp_path))
+    backtest.backfill(store, ["BTA", "BTB"], "test", server.base_url, years=3)
+    with caplog.at_level(logging.WARNING, logger=backtest.logger.name):
+        report, _ = backtest.run_backtest(store, ["BTA", "BTB"], sector_map=SECTOR_MAP)
+    assert report['coverage'] == {'SPY': 0.0, '^VIX': 0.0, 'XLF': 0.0, 'XLK': 0.0}
+    assert report['neutral_factors'] == ['spy_regime', 'vix', 'sector']
+    assert "SPY covers 0%" in caplog.text
+
+def test_backfill_fills_long_history_in_chunks(server, tmp_path):
+    server.reset()
+    store = BarStore(str(tmp_path))
+    wanted = ["BTA", "BTB", *backtest.REGIME_SYMBOLS, "XLF", "XLK"]
+    written = backtest.backfill(store, wanted, "test", server.base_url, years=9)
+    assert set(written) == set(wanted) and min(written.values()) > 9 * 250
+    # 9 年按 BACKFILL_CHUNK_DAYS 分段
+    assert requests(server, "historical-price-eod/full") == len(wanted) * 2
+    report, _ = backtest.run_backtest(store, ["BTA", "BTB"], sector_map=SECTOR_MAP)
+    assert report['neutral_factors'] == []
+    assert report['summary']['days'] > 9 * 250
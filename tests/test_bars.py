@@ -0,0 +1,66 @@
+import os
+import numpy as np
+
+import barstore
+from conftest import requests
+
+# ================= 💾 K线增量同步 / 拆股重写 =================
+
+def _drop_last_bar(main, sym):
+    # 模拟隔天: 本地最后一根截掉，最后日期落后于上一交易日
+    path = main.bar_store._path(sym); n = main.bar_store._count(path)
+    os.truncate(path, (n - 1) * barstore.BAR_DTYPE.itemsize)
+    main.bars_synced.clear()
+
+def _split(server, sym, ratio):
+    # 替身服务器上的整段历史按拆股回溯调整: 价格 / ratio，成交量 × ratio
+    rows = server.book.history(sym)
+    server.book._hist[sym] = [dict(r, **{k: r[k] / ratio for k in ('open', 'high', 'low', 'close')}, volume=r['volume'] * ratio) for r in rows]
+    getattr(server.book, '_by_date', {}).pop(sym, None)
+
+def _expected(server, sym, dates):
+    by_date = {barstore.to_day(r['date']): r['close'] for r in server.book.history(sym)}
+    return np.array([by_date[d] for d in dates])
+
+def test_incremental_sync_appends_with_overlap(main, server, run):
+    run(main.sync_bars("INCR"))
+    n = len(main.bar_store.load("INCR"))
+    _drop_last_bar(main, "INCR")
+    server.reset()
+    run(main.sync_bars("INCR"))
+    assert len(main.bar_store.load("INCR")) == n
+    assert requests(server, "historical-price-eod/full") == 1
+    assert main.stats.counters["bars.rewrite"] == 0
+
+def test_split_rewrites_stored_history(main, server, run):
+    run(main.sync_bars("SPLT"))
+    first = main.bar_store.first_date("SPLT")
+    _drop_last_bar(main, "SPLT")
+    _split(server, "SPLT", 4)
+    server.reset()
+    rewrites = main.stats.counters["bars.rewrite"]
+    bars = run(main.sync_bars("SPLT"))
+    stored = main.bar_store.load("SPLT")
+    # 重叠那根对不上 -> 从最早一根起整段重拉、整份重写
+    assert requests(server, "historical-price-eod/full") == 2
+    assert main.stats.counters["bars.rewrite"] == rewrites + 1
+    assert main.bar_store.first_date("SPLT") == first
+    np.testing.assert_allclose(stored['close'], _expected(server, "SPLT", stored['date']))
+    np.testing.assert_allclose(bars['close'][-len(stored):], stored['close'][-len(bars):])
+
+def test_bulk_sync_leaves_adjusted_symbols_to_sync_bars(main, server, run):
+    server.universe = {"BULKA", "BULKB"}
+    async def seed():
+        for t in server.universe: await main.sync_bars(t)
+    run(seed())
+    counts = {t: len(main.bar_store.load(t)) for t in server.universe}
+    for t in server.universe: _drop_last_bar(main, t)
+    _split(server, "BULKB", 2)
+    run(main.bulk_sync_bars(sorted(server.universe)))
+    # 没拆股的照常补齐；拆股的不追加、不标记已同步
+    assert len(main.bar_store.load("BULKA")) == counts["BULKA"]
+    assert len(main.bar_store.load("BULKB")) == counts["BULKB"] - 1
+    assert "BULKA" in main.bars_synced and "BULKB" not in main.bars_synced
+    run(main.sync_bars("BULKB"))
+    stored = main.bar_store.load("BULKB")
+    np.testing.assert_allclose(stored['close'], _expected(server, "BULKB", stored['date']))
@@ -0,0 +1,32 @@
+import os
+
+# ================= 🧭 命令同步 =================
+
+class OldStyleCommand:
+    # discord.py 2.3: to_dict() 不接受参数
+    def to_dict(self): return {'name': 'old'}
+
+def _fake_sync(main, monkeypatch):
+    calls = []
+    async def sync(): calls.append(1)
+    monkeypatch.setattr(main.bot.tree, "sync", sync)
+    if os.path.exists(main.TREE_HASH_FILE): os.remove(main.TREE_HASH_FILE)
+    return calls
+
+def test_unchanged_tree_skips_sync(main, run, monkeypatch):
+    calls = _fake_sync(main, monkeypatch)
+    run(main.sync_commands()); run(main.sync_commands())
+    assert len(calls) == 1
+
+def test_digest_accepts_pre_2_4_to_dict(main, monkeypatch):
+    monkeypatch.setattr(main.bot.tree, "get_commands", lambda: [OldStyleCommand()])
+    assert len(main.command_tree_digest()) == 64
+
+def test_digest_failure_falls_back_to_sync(main, run, monkeypatch):
+    calls = _fake_sync(main, monkeypatch)
+    def boom(): raise RuntimeError("bad command")
+    monkeypatch.setattr(main, "command_tree_digest", boom)
+    run(main.sync_commands()); run(main.sync_commands())
+    # 没有摘要: 每次都同步，也不写摘要文件
+    assert len(calls) == 2
+    assert not os.path.exists(main.TREE_HASH_FILE)
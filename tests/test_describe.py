@@ -0,0 +1,36 @@
+import dataclasses
+
+import scoring
+
+# ================= 📖 评分说明文案 =================
+
+def _record(**kw):
+    r = dict(base=3.0, trend=1.5, vsa=1.0, fund=1.0, sector=1.0, vol=1.0, score=4.5, trend_code=scoring.TREND_BULL,
+             vsa_code=scoring.VSA_NONE, fund_code=scoring.FUND_NONE, sector_code=scoring.SECTOR_NONE, vol_high=False,
+             earn=False, ice=False, zone=False, stop=90.0, atr_pct=0.02, stop_code=scoring.STOP_CHANDELIER)
+    r.update(kw)
+    return r
+
+def _regime(main, vix):
+    return main.describe_score(_record(), "AAA", "Bull", vix, "XLK", 0.0, None)[8]
+
+def test_default_comments_carry_default_multipliers(main):
+    assert main.FACTOR_COMMENTS['Trend_Bull'] == "趋势多头排列 (x1.5)"
+    assert main.FACTOR_COMMENTS['VSA_Pump_K'] == "放量上涨，资金抢筹 (K线) (x1.2)"
+    assert main.FACTOR_COMMENTS['Vol_High'] == "高波动率，自动降杠杆 (x0.7)"
+    assert main.FACTOR_COMMENTS['Regime_Panic'] == "VIX恐慌"
+
+def test_comments_follow_tuned_params(main):
+    tuned = dataclasses.replace(scoring.DEFAULT_PARAMS, trend_scores=(1.8, 0.8, 0.9), vol_penalty=0.6,
+                                vsa_scores=(1.0, 0.3, 0.5, 1.2, 0.5, 1.3, 1.15, 0.5, 1.1))
+    comments = main.factor_comments(tuned)
+    assert comments['Trend_Bull'].endswith("(x1.8)")
+    assert comments['Vol_High'].endswith("(x0.6)")
+    assert comments['VSA_Pump'].endswith("(x1.2)") and comments['VSA_Pump_K'].endswith("(x1.15)")
+
+def test_regime_text_uses_active_vix_thresholds(main, monkeypatch):
+    assert _regime(main, 30) == "恐慌 (VIX:30.0)"
+    assert _regime(main, 40) == "崩盘 (VIX:40.0)"
+    monkeypatch.setattr(main, "score_params", dataclasses.replace(scoring.DEFAULT_PARAMS, vix_high=32.0, vix_panic=45.0))
+    assert _regime(main, 30) == "牛市"
+    assert _regime(main, 40) == "恐慌 (VIX:40.0)"
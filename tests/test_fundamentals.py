@@ -0,0 +1,28 @@
+import datetime
+
+import bench
+
+# ================= 🏦 基本面复查 =================
+
+def _outage(monkeypatch):
+    respond = bench.StandInServer.respond
+    def down(self, ep, q):
+        if ep in ("income-statement", "ratios-ttm"): raise RuntimeError("outage")
+        return respond(self, ep, q)
+    monkeypatch.setattr(bench.StandInServer, "respond", down)
+
+def test_stale_row_survives_failed_revalidation(main, run, monkeypatch):
+    stored = {'rev_growth': 0.25, 'eps': 3.1, 'gross_margin': 0.6, 'fcf_yield': 0.04}
+    checked = (datetime.date.today() - datetime.timedelta(days=main.FUND_TTL_DAYS + 5)).isoformat()
+    main.fund_store.put("STAL", "2026-01-30", stored, checked)
+    _outage(monkeypatch)
+    failed = main.stats.counters["fund.revalidate_failed"]
+    assert run(main.get_fundamentals_deep("STAL")) == stored
+    assert main.stats.counters["fund.revalidate_failed"] == failed + 1
+    # 失败不更新校验日期，下次照样复查
+    assert main.fund_store.get("STAL")['checked'] == checked
+
+def test_cold_load_failure_returns_none(main, run, monkeypatch):
+    _outage(monkeypatch)
+    assert run(main.get_fundamentals_deep("NEWF")) is None
+    assert main.fund_store.get("NEWF") is None
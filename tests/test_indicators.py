@@ -0,0 +1,161 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import indicators
+
+# ================= 📐 指标口径对照 =================
+# 参照实现按 pandas_ta 默认参数的公式用 pandas 写出 (WMA 线性加权、RMA = ewm(alpha=1/n, adjust=True, min_periods=n))；
+# 装了 pandas_ta 时再直接对照一遍。整批输入的短代码左侧补 NaN，与 main 打包的方式一致。
+TOL = dict(rtol=1e-9, atol=1e-9, equal_nan=True)
+LENGTHS = (2, 5, 14, 55, 144)
+
+def ref_sma(s, n): return s.rolling(n).mean()
+
+def ref_wma(s, n):
+    w = np.arange(1, n + 1, dtype=np.float64)
+    return s.rolling(n, min_periods=n).apply(lambda x: np.dot(x, w) / w.sum(), raw=True)
+
+def ref_hma(s, n): return ref_wma(2 * ref_wma(s, int(n / 2)) - ref_wma(s, n), int(np.sqrt(n)))
+
+def ref_rma(s, n): return s.ewm(alpha=1.0 / n, adjust=True, min_periods=n).mean()
+
+def ref_atr(h, l, c, n):
+    pc = c.shift(1)
+    tr = pd.concat([h - l, (h - pc).abs(), (l - pc).abs()], axis=1).max(axis=1)
+    tr.iloc[0] = np.nan
+    return ref_rma(tr, n)
+
+def ref_rsi(c, n):
+    diff = c.diff()
+    pos = ref_rma(diff.clip(lower=0), n); neg = ref_rma(diff.clip(upper=0).abs(), n)
+    return 100 * pos / (pos + neg)
+
+def make_bars(n, seed):
+    rnd = np.random.default_rng(seed)
+    c = 100 * np.exp(np.cumsum(rnd.normal(0.0003, 0.02, n)))
+    o = c * (1 + rnd.normal(0, 0.005, n))
+    h = np.maximum(o, c) * (1 + np.abs(rnd.normal(0, 0.01, n)))
+    l = np.minimum(o, c) * (1 - np.abs(rnd.normal(0, 0.01, n)))
+    v = rnd.uniform(1e5, 5e6, n)
+    return h, l, c, v
+
+def padded_batch(lengths, width, seed=0):
+    # (代码, 根数) 矩阵，短的左侧补 NaN；同时返回未补齐的原序列
+    raw = [make_bars(n, seed + i) for i, n in enumerate(lengths)]
+    batch = [np.full((len(lengths), width), np.nan) for _ in range(4)]
+    for i, bars in enumerate(raw):
+        for k in range(4): batch[k][i, width - len(bars[k]):] = bars[k]
+    return batch, raw
+
+# ================= 单序列 =================
+@pytest.mark.parametrize("n", LENGTHS)
+def test_window_indicators_match_reference(n):
+    _, _, c, _ = make_bars(400, 1)
+    s = pd.Series(c)
+    np.testing.assert_allclose(indicators.sma(c, n), ref_sma(s, n), **TOL)
+    np.testing.assert_allclose(indicators.wma(c, n), ref_wma(s, n), **TOL)
+    np.testing.assert_allclose(indicators.hma(c, n), ref_hma(s, n), **TOL)
+
+@pytest.mark.parametrize("n", (2, 5, 14, 30))
+def test_rma_indicators_match_reference(n):
+    h, l, c, _ = make_bars(400, 2)
+    H, L, C = pd.Series(h), pd.Series(l), pd.Series(c)
+    np.testing.assert_allclose(indicators.rma(c, n), ref_rma(C, n), **TOL)
+    np.testing.assert_allclose(indicators.atr(h, l, c, n), ref_atr(H, L, C, n), **TOL)
+    np.testing.assert_allclose(indicators.rsi(c, n), ref_rsi(C, n), **TOL)
+
+@pytest.mark.parametrize("bars", (1, 2, 13, 14, 15, 60))
+def test_short_histories(bars):
+    h, l, c, v = make_bars(bars, 3)
+    H, L, C = pd.Series(h), pd.Series(l), pd.Series(c)
+    for n in (14, 55, 144):
+        out = indicators.hma(c, n)
+        assert out.shape == c.shape
+        np.testing.assert_allclose(out, ref_hma(C, n), **TOL)
+        np.testing.assert_allclose(indicators.sma(c, n), ref_sma(C, n), **TOL)
+    np.testing.assert_allclose(indicators.atr(h, l, c, 14), ref_atr(H, L, C, 14), **TOL)
+    np.testing.assert_allclose(indicators.rsi(c, 14), ref_rsi(C, 14), **TOL)
+
+# ================= 整批 (左侧补 NaN) =================
+def test_padded_batch_rows_match_single_series():
+    lengths = (400, 250, 150, 30, 1)
+    (h, l, c, v), raw = padded_batch(lengths, 400)
+    fns = {
+        'sma': lambda H, L, C: indicators.sma(C, 20), 'wma': lambda H, L, C: indicators.wma(C, 14),
+        'hma': lambda H, L, C: indicators.hma(C, 55), 'rma': lambda H, L, C: indicators.rma(C, 14),
+        'atr': lambda H, L, C: indicators.atr(H, L, C, 14), 'rsi': lambda H, L, C: indicators.rsi(C, 14),
+    }
+    for name, fn in fns.items():
+        out = fn(h, l, c)
+        for i, (rh, rl, rc, _) in enumerate(raw):
+            tail = out[i, 400 - len(rc):]
+            np.testing.assert_allclose(tail, fn(rh, rl, rc), **TOL, err_msg=name)
+            # 补齐的部分不泄漏出数值
+            assert np.isnan(out[i, :400 - len(rc)]).all(), name
+    ref = ref_atr(pd.Series(raw[1][0]), pd.Series(raw[1][1]), pd.Series(raw[1][2]), 14)
+    np.testing.assert_allclose(indicators.atr(h, l, c, 14)[1, 150:], ref, **TOL)
+
+# ================= 最后一根 / 增量状态 =================
+def _assert_snap_equal(a, b):
+    assert a.keys() == b.keys()
+    for k in a: np.testing.assert_allclose(a[k], b[k], **TOL, err_msg=k)
+
+def test_snapshot_matches_series_and_reference():
+    (h, l, c, v), raw = padded_batch((400, 300, 160, 60, 12), 400, seed=10)
+    snap = indicators.snapshot(h, l, c, v)
+    full = indicators.series(h, l, c, v)
+    # 前 20 日高点: snapshot 沿用实时评分 df['HIGH'].iloc[-21:-1].max() 的口径 (不足 20 根取已有的)，
+    # series 给回测用、要求满窗口，只在历史够长的代码上一致
+    _assert_snap_equal({k: x[:4] for k, x in snap.items()}, {k: full[k][:4, -1] for k in snap})
+    for i, (rh, _, _, _) in enumerate(raw):
+        assert snap['high_prior20'][i] == pytest.approx(pd.Series(rh).iloc[-21:-1].max())
+    rh, rl, rc, rv = raw[0]
+    C = pd.Series(rc)
+    assert snap['hma_fast'][0] == pytest.approx(ref_hma(C, 55).iloc[-1], rel=1e-9)
+    assert snap['hma_slow'][0] == pytest.approx(ref_hma(C, 144).iloc[-1], rel=1e-9)
+    assert snap['ma233'][0] == pytest.approx(C.rolling(233).mean().iloc[-1], rel=1e-9)
+    assert snap['ma144_lag'][0] == pytest.approx(C.rolling(144).mean().iloc[-10], rel=1e-9)
+    assert snap['atr'][0] == pytest.approx(ref_atr(pd.Series(rh), pd.Series(rl), C, 14).iloc[-1], rel=1e-9)
+    assert snap['rsi'][0] == pytest.approx(ref_rsi(C, 14).iloc[-1], rel=1e-9)
+    # 历史不够的代码: 长窗口指标为 NaN，短窗口照常
+    assert np.isnan(snap['ma144'][3]) and np.isnan(snap['hma_slow'][3]) and not np.isnan(snap['vol_ma50'][3])
+    assert np.isnan(snap['atr'][4]) and np.isnan(snap['rsi'][4]) and np.isnan(snap['low_21'][4]) and not np.isnan(snap['prev_close'][4])
+
+def test_snapshot_does_not_modify_inputs():
+    (h, l, c, v), _ = padded_batch((300, 100), 300, seed=20)
+    before = [x.copy() for x in (h, l, c, v)]
+    indicators.snapshot(h, l, c, v)
+    for x, y in zip((h, l, c, v), before): np.testing.assert_array_equal(x, y)
+
+@pytest.mark.parametrize("start", (5, 100, 300))
+def test_indicator_state_push_matches_full_snapshot(start):
+    (h, l, c, v), _ = padded_batch((400, 320, 200, 40), 400, seed=30)
+    state = indicators.IndicatorState(h[:, :start], l[:, :start], c[:, :start], v[:, :start])
+    for i in range(start, 399):
+        # 盘中 snapshot 与同一根收盘后的整段计算一致，不改变状态
+        if i % 97 == 0:
+            _assert_snap_equal(state.snapshot(h[:, i], l[:, i], c[:, i], v[:, i]),
+                               indicators.snapshot(h[:, :i + 1], l[:, :i + 1], c[:, :i + 1], v[:, :i + 1]))
+        state.push(h[:, i], l[:, i], c[:, i], v[:, i])
+    _assert_snap_equal(state.snapshot(h[:, -1], l[:, -1], c[:, -1], v[:, -1]), indicators.snapshot(h, l, c, v))
+
+def test_indicator_state_single_series():
+    h, l, c, v = make_bars(300, 40)
+    state = indicators.IndicatorState(h[:250], l[:250], c[:250], v[:250])
+    for i in range(250, 299): state.push(h[i], l[i], c[i], v[i])
+    _assert_snap_equal(state.snapshot(h[-1], l[-1], c[-1], v[-1]), indicators.snapshot(h, l, c, v))
+
+# ================= pandas_ta =================
+# 运行时已不依赖 pandas_ta，测试环境里装上它做对照: pip install -r requirements-test.txt
+def test_matches_pandas_ta():
+    ta = pytest.importorskip("pandas_ta", reason="pandas_ta 未安装 (见 requirements-test.txt)")
+    h, l, c, _ = make_bars(400, 50)
+    H, L, C = pd.Series(h), pd.Series(l), pd.Series(c)
+    np.testing.assert_allclose(indicators.hma(c, 55), ta.hma(C, length=55), **TOL)
+    np.testing.assert_allclose(indicators.hma(c, 144), ta.hma(C, length=144), **TOL)
+    np.testing.assert_allclose(indicators.wma(c, 14), ta.wma(C, length=14), **TOL)
+    np.testing.assert_allclose(indicators.sma(c, 20), ta.sma(C, length=20), **TOL)
+    np.testing.assert_allclose(indicators.rma(c, 14), ta.rma(C, length=14), **TOL)
+    np.testing.assert_allclose(indicators.atr(h, l, c, 14), ta.atr(H, L, C, length=14, talib=False), **TOL)
+    np.testing.assert_allclose(indicators.rsi(c, 14), ta.rsi(C, length=14, talib=False), **TOL)
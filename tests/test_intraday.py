@@ -0,0 +1,19 @@
+import bench
+
+# ================= 📡 盘中监控 =================
+
+def test_rebuild_skips_symbols_without_bars(main, server, run, monkeypatch):
+    respond = bench.StandInServer.respond
+    def broken(self, ep, q):
+        if ep == "historical-price-eod/full" and q.get('symbol') == "DLST": raise RuntimeError("delisted")
+        return respond(self, ep, q)
+    monkeypatch.setattr(bench.StandInServer, "respond", broken)
+
+    monitor = main.IntradayMonitor(60)
+    failed = main.stats.counters["intraday.rebuild_failed"]
+    run(monitor.rebuild({"AAA", "DLST", "BBB"}))
+    assert monitor.symbols == ["AAA", "BBB"]
+    assert monitor.state is not None and monitor.state.prev_close.shape == (2,)
+    assert main.stats.counters["intraday.rebuild_failed"] == failed + 1
+    # 观察池没变: 下一轮不再因为同一只坏代码重建
+    assert monitor.watched == frozenset({"AAA", "DLST", "BBB"})
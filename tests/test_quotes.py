@@ -0,0 +1,46 @@
+import bench
+from conftest import requests
+
+# ================= 📦 批量报价 =================
+
+def test_batch_quotes_one_request_per_chunk(main, server, run):
+    syms = [f"Q{i:02d}" for i in range(25)]
+    out = run(main.fetch_batch_quotes(syms))
+    assert sorted(out) == syms
+    # QUOTE_BATCH_SIZE=10: 25 只 -> 3 次
+    assert requests(server, "batch-quote") == 3
+    assert requests(server, "quote") == 0
+    assert out["Q07"]["price"] == server.book.quote("Q07")["price"]
+
+def test_missing_symbols_fall_back_to_single_quote(main, server, run, monkeypatch):
+    respond = bench.StandInServer.respond
+    def drop_missing(self, ep, q):
+        body = respond(self, ep, q)
+        return [r for r in body if r['symbol'] != "GONE"] if ep == "batch-quote" else body
+    monkeypatch.setattr(bench.StandInServer, "respond", drop_missing)
+
+    async def go():
+        await main.prefetch_quotes(["AAA", "BBB", "GONE"])
+        return await main.get_quote("AAA"), await main.get_quote("GONE")
+    hit, missing = run(go())
+    assert "GONE" not in main.quote_table
+    assert hit["symbol"] == "AAA" and missing["symbol"] == "GONE"
+    assert requests(server, "batch-quote") == 1
+    # 只有批量里缺的那只单独请求
+    assert requests(server, "quote") == 1
+
+def test_cached_symbols_are_not_refetched(main, server, run):
+    async def go():
+        await main.get_daily_data_stable("CCC")
+        server.reset()
+        await main.prefetch_quotes(["CCC", "DDD"])
+        await main.get_quote("DDD")
+        again = await main.get_daily_data_stable("CCC")
+        return again
+    df, quote = run(go())
+    assert df is not None and quote["symbol"] == "CCC"
+    # CCC 已在当天行情缓存里: 批量只请求 DDD，之后全部命中
+    assert requests(server, "batch-quote") == 1
+    assert requests(server, "quote") == 0
+    assert requests(server, "historical-price-eod/full") == 0
+    assert set(main.quote_table) == {"DDD"}
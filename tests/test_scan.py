@@ -0,0 +1,46 @@
+import types
+
+import bench
+from conftest import requests
+
+# ================= 🛰️ /scan 上传文件 =================
+
+class Upload:
+    def __init__(self, symbols):
+        self.filename = "list.txt"
+        self.data = "\n".join(symbols).encode()
+        self.size = len(self.data)
+    async def read(self): return self.data
+
+class Interaction(bench.FakeInteraction):
+    def __init__(self, uid, admin=False):
+        super().__init__(uid)
+        self.user.guild_permissions = types.SimpleNamespace(administrator=admin)
+        self.texts = []
+        async def send(content=None, **kwargs): self.texts.append(content)
+        self.followup.send = send
+
+def _scan(main, run, interaction, symbols):
+    run(main.scan_market.callback(interaction, file=Upload(symbols), top=5))
+    return interaction.texts
+
+def test_scheduled_scan_is_off_by_default(main):
+    assert main.SCAN_TIME == ""
+
+def test_non_admin_upload_is_capped(main, server, run):
+    symbols = [f"U{i:03d}" for i in range(main.SCAN_FILE_MAX + 1)]
+    texts = _scan(main, run, Interaction(1), symbols)
+    assert texts and "上限" in texts[0]
+    assert sum(s['requests'] for s in server.stats.values()) == 0
+
+def test_admin_upload_allows_more(main, server, run, monkeypatch):
+    monkeypatch.setattr(main, "SCAN_FILE_MAX", 2)
+    server.universe = {"ADA", "ADB", "ADC"}
+    texts = _scan(main, run, Interaction(1, admin=True), sorted(server.universe))
+    assert texts == [None]  # 结果以 embed 发出
+    assert requests(server, "historical-price-eod/full") >= 3
+
+def test_uploads_can_be_admin_only(main, server, run, monkeypatch):
+    monkeypatch.setattr(main, "SCAN_FILE_MAX", 0)
+    texts = _scan(main, run, Interaction(1), ["AAA"])
+    assert "仅限管理员" in texts[0]
@@ -0,0 +1,29 @@
+import sys
+import asyncio
+import logging
+import subprocess
+
+# ================= 🚀 启动 / 后台任务 =================
+
+def test_spawned_task_is_referenced_and_errors_logged(main, caplog):
+    async def boom():
+        await asyncio.sleep(0)
+        raise RuntimeError("refresh broke")
+    async def go():
+        task = main.spawn(boom(), "sector refresh")
+        assert task in main.background_tasks
+        await asyncio.gather(task, return_exceptions=True)
+        await asyncio.sleep(0)
+    with caplog.at_level(logging.ERROR, logger=main.logger.name):
+        asyncio.run(go())
+    assert not main.background_tasks
+    assert "sector refresh failed" in caplog.text and "refresh broke" in caplog.text
+
+def test_import_defers_heavy_modules(main):
+    # 新进程里只导入 main: pandas / scipy / dateutil.parser 都不应该被真正加载
+    # 缓存估算大小也不能把 LazyLoader 登记的 pandas 碰醒
+    code = ("import sys, main; main.api_cache.put('fund', 'X', {'a': 1}); "
+            "print(','.join(m for m in ('scipy.signal', 'dateutil.parser', 'pandas.core.frame') if m in sys.modules))")
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, timeout=120, cwd=main.os.path.dirname(main.__file__))
+    assert out.returncode == 0, out.stderr
+    assert out.stdout.strip() == ""
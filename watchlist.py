@@ -0,0 +1,84 @@
+import os
+import json
+import sqlite3
+import logging
+
+logger = logging.getLogger(__name__)
+
+# ================= 📋 观察池存储 =================
+# SQLite (WAL) 单行增删，每次 /add /remove 只写改动的那几行；
+# ticker 列建索引，扫描时直接按 代码 -> 用户 反查。
+# 首次使用时才打开数据库；库为空且旧 JSON 还在时自动迁移。
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS watch (
+    uid TEXT NOT NULL,
+    ticker TEXT NOT NULL,
+    UNIQUE (uid, ticker)
+);
+CREATE INDEX IF NOT EXISTS watch_ticker ON watch (ticker);
+"""
+
+class WatchlistStore:
+    def __init__(self, path, legacy_json=None):
+        self.path = path
+        self.legacy_json = legacy_json
+        self._db = None
+
+    @property
+    def db(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(SCHEMA)
+            self._migrate()
+        return self._db
+
+    def _migrate(self):
+        if not self.legacy_json or not os.path.exists(self.legacy_json): return
+        if self._db.execute("SELECT 1 FROM watch LIMIT 1").fetchone(): return
+        try:
+            with open(self.legacy_json, 'r') as f: data = json.load(f)
+        except Exception as e:
+            logger.error(f"⚠️ [WATCHLIST] legacy JSON unreadable, skipped: {e}")
+            return
+        self.replace(data)
+        os.replace(self.legacy_json, self.legacy_json + ".migrated")
+        logger.info(f"📋 [WATCHLIST] migrated {sum(len(v) for v in data.values())} rows from {self.legacy_json}")
+
+    def add(self, uid, tickers):
+        # 已存在的保持原来的位置
+        with self.db:
+            self.db.executemany("INSERT OR IGNORE INTO watch (uid, ticker) VALUES (?, ?)", [(str(uid), t) for t in tickers])
+
+    def remove(self, uid, ticker):
+        with self.db:
+            return self.db.execute("DELETE FROM watch WHERE uid = ? AND ticker = ?", (str(uid), ticker)).rowcount > 0
+
+    def tickers(self, uid):
+        return [t for (t,) in self.db.execute("SELECT ticker FROM watch WHERE uid = ? ORDER BY rowid", (str(uid),))]
+
+    def by_user(self):
+        # uid -> [ticker, ...]，按添加顺序
+        out = {}
+        for uid, t in self.db.execute("SELECT uid, ticker FROM watch ORDER BY rowid"):
+            out.setdefault(uid, []).append(t)
+        return out
+
+    def plan(self):
+        # 反向索引: ticker -> [uid, ...]，每个标的只扫一次
+        out = {}
+        for t, uid in self.db.execute("SELECT ticker, uid FROM watch ORDER BY ticker, rowid"):
+            out.setdefault(t, []).append(uid)
+        return out
+
+    def replace(self, data):
+        # 整体替换 (迁移 / 基准测试用): {uid: {ticker: {}, ...}}
+        with self.db:
+            self.db.execute("DELETE FROM watch")
+            self.db.executemany("INSERT OR IGNORE INTO watch (uid, ticker) VALUES (?, ?)",
+                                [(str(uid), t) for uid, stocks in data.items() for t in stocks])
+
+    def close(self):
+        if self._db is not None:
+            self._db.close(); self._db = None